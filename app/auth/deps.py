@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from jose import jwt
 from sqlalchemy import select
 from .models import User
+from . import user_cache
 
 # Secret and algorithm (reuse same as your login logic)
 SECRET_KEY = "your-secret-key"          # TODO: use env var
@@ -108,7 +109,25 @@ async def get_user_by_email(email: str, db: AsyncSession):
 async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Extract user info from request.state.user_id (set by AuthMiddleware)
-    and fetch full user record.
+    and return a cached UserSnapshot. The database is only hit on a cache miss.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    if not user_id:
+        raise HTTPException(401, "Not authenticated")
+
+    user = await user_cache.get(user_id)
+    if user is None:
+        row = await get_user_by_id(user_id, db)
+        if not row:
+            raise HTTPException(404, "User not found")
+        user = await user_cache.put(row)
+    return user
+
+
+async def get_current_user_row(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Like get_current_user, but returns the live ORM row for routes that modify it.
+    Callers must user_cache.invalidate() after committing.
     """
     user_id = getattr(request.state, "user_id", None)
     if not user_id:
@@ -1,4 +1,24 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 import bcrypt
+from fastapi import HTTPException
+
+from app import metrics
+
+# bcrypt is deliberately slow (~200 ms per call), so it must never run on the
+# event loop. Calls are shipped to a bounded worker pool instead; when too many
+# are already waiting we fail fast with 503 rather than queueing unboundedly.
+HASH_POOL = os.getenv("HASH_POOL", "thread")  # "thread" or "process"
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "1")
+
+_executor = None
+_pending = 0
+
 
 def hash_password(password: str) -> str:
     salt = bcrypt.gensalt()
@@ -10,3 +30,65 @@ def verify_password(password: str, hashed: str) -> bool:
         return bcrypt.checkpw(password.encode(), hashed.encode())
     except ValueError:
         return False
+
+
+# --------------------------------------------------------
+# ⚙️ Async hashing service (bounded worker pool)
+# --------------------------------------------------------
+def get_executor():
+    global _executor
+    if _executor is None:
+        if HASH_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        else:
+            # bcrypt releases the GIL, so threads give real parallelism
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _timed(fn, *args):
+    """Runs in the worker; reports its own busy time back to the loop."""
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= HASH_MAX_PENDING:
+        metrics.HASH_REJECTED.inc()
+        raise HTTPException(
+            503, "Server busy, please retry", headers={"Retry-After": HASH_RETRY_AFTER}
+        )
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        result, busy = await loop.run_in_executor(get_executor(), _timed, fn, *args)
+        metrics.HASH_LATENCY.observe(fn.__name__, value=busy)
+        metrics.HASH_QUEUE_WAIT.observe(fn.__name__, value=max(time.perf_counter() - submitted - busy, 0.0))
+        return result
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run(verify_password, password, hashed)
+
+
+def pool_stats() -> dict:
+    return {
+        "pool": HASH_POOL,
+        "workers": HASH_WORKERS,
+        "max_pending": HASH_MAX_PENDING,
+        "pending": _pending,
+    }
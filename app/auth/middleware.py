@@ -1,26 +1,118 @@
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from starlette.requests import cookie_parser
+
+from app.auth import redis_store
 from app.auth.deps import verify_token
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        token = request.cookies.get("access_token")
-        if not token:
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.startswith("Bearer "):
-                token = auth_header.split(" ")[1]
+# Verified access tokens: token -> (user_id, jti, exp). Entries die at the
+# token's own exp, so a cache hit never outlives the JWT it came from.
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Denylist lookups: jti -> (denied, valid_until). A "not denied" answer is only
+# trusted for DENY_CACHE_TTL seconds, so a logout on another worker is seen
+# within that window; logouts on this worker are seen immediately.
+DENY_CACHE_SIZE = int(os.getenv("AUTH_DENY_CACHE_SIZE", "10000"))
+DENY_CACHE_TTL = float(os.getenv("AUTH_DENY_CACHE_TTL", "2"))
+
+_tokens = OrderedDict()
+_denied = OrderedDict()
+
+
+def _put(cache, key, value, limit):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def _verify_cached(token: str, now: float):
+    entry = _tokens.get(token)
+    if entry is not None:
+        if entry[2] > now:
+            _tokens.move_to_end(token)
+            return entry
+        del _tokens[token]
+
+    try:
+        payload = verify_token(token, "access")
+        entry = (int(payload["sub"]), payload["jti"], float(payload["exp"]))
+    except (HTTPException, KeyError, ValueError):
+        return None
+    _put(_tokens, token, entry, TOKEN_CACHE_SIZE)
+    return entry
+
+
+async def _is_denied_cached(jti: str, exp: float, now: float) -> bool:
+    entry = _denied.get(jti)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    try:
+        denied = await redis_store.is_denied(jti)
+    except RedisError:
+        # Fail open: a Redis outage must not log every user out
+        return False
+    _put(_denied, jti, (denied, exp if denied else now + DENY_CACHE_TTL), DENY_CACHE_SIZE)
+    return denied
+
 
-        print("[DEBUG] access_token:", token)  # 👈 add this
+def note_denied(jti: str, exp: float):
+    """Record a logout locally so this worker rejects the token without asking Redis."""
+    _put(_denied, jti, (True, exp), DENY_CACHE_SIZE)
 
-        request.state.user_id = None
+
+def _extract_token(scope):
+    cookie = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            cookie = value.decode("latin-1")
+        elif name == b"authorization":
+            authorization = value.decode("latin-1")
+
+    if cookie:
+        token = cookie_parser(cookie).get("access_token")
         if token:
-            try:
-                payload = verify_token(token, "access")
-                request.state.user_id = int(payload["sub"])
-                print("[DEBUG] user_id from token:", request.state.user_id)
-            except HTTPException as e:
-                print("[DEBUG] Token verification failed:", e.detail)
-                request.state.user_id = None
-
-        response = await call_next(request)
-        return response
+            return token
+    if authorization and authorization.startswith("Bearer "):
+        return authorization.split(" ")[1]
+    return None
+
+
+async def authenticate(token: str):
+    """Return the user id for a valid, non-revoked access token, else None."""
+    now = time.time()
+    entry = _verify_cached(token, now)
+    if entry is None:
+        return None
+    user_id, jti, exp = entry
+    if await _is_denied_cached(jti, exp, now):
+        return None
+    return user_id
+
+
+class AuthMiddleware:
+    """
+    Pure ASGI middleware: resolves the access token (cookie first, then
+    Bearer header) and sets request.state.user_id, or None when anonymous.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        token = _extract_token(scope)
+        state = scope.setdefault("state", {})
+        state["user_id"] = await authenticate(token) if token else None
+
+        await self.app(scope, receive, send)
+
+
+def cache_stats() -> dict:
+    return {"tokens": len(_tokens), "denylist": len(_denied)}
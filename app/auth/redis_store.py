@@ -1,24 +1,226 @@
 import os
+import time
+
 import redis.asyncio as redis
 
+from app import metrics
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-r = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+# Explicitly sized pool: callers wait up to REDIS_POOL_TIMEOUT for a free
+# connection instead of opening unbounded extra sockets under load.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+
+
+class TimedRedis(redis.Redis):
+    """Records every command's round trip (EVALSHA for the scripts below)."""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            metrics.REDIS_ERRORS.inc(command)
+            raise
+        finally:
+            metrics.REDIS_LATENCY.observe(command, value=time.perf_counter() - started)
+
+
+r = TimedRedis(connection_pool=redis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+    health_check_interval=30,
+    encoding="utf-8",
+    decode_responses=True,
+))
+
+# Keys:
+#   rt:{jti}        -> user_id      (refresh token, TTL = refresh lifetime)
+#   urt:{user_id}   -> set of jtis  (per-user index, TTL = longest live member)
+#   blk:{jti}       -> "1"          (denied access token, TTL = remaining lifetime)
+REFRESH_PREFIX = "rt:"
+INDEX_PREFIX = "urt:"
+DENY_PREFIX = "blk:"
+# Prune expired members from a user's index once it grows past this size
+INDEX_PRUNE_AT = int(os.getenv("REFRESH_INDEX_PRUNE_AT", "64"))
+
+# The scripts keep rt:* and urt:* in step atomically, in one round trip each.
+# They are called with client=r so the module-level client can be swapped,
+# and preloaded with load_scripts() at startup so the first call is an EVALSHA hit.
+_INDEX_ADD = """
+local function index_add(index, jti, ttl, limit, prefix)
+    redis.call('SADD', index, jti)
+    if redis.call('TTL', index) < ttl then
+        redis.call('EXPIRE', index, ttl)
+    end
+    if redis.call('SCARD', index) > limit then
+        for _, member in ipairs(redis.call('SMEMBERS', index)) do
+            if redis.call('EXISTS', prefix .. member) == 0 then
+                redis.call('SREM', index, member)
+            end
+        end
+    end
+end
+"""
+
+_store_refresh = r.register_script(_INDEX_ADD + """
+redis.call('SETEX', KEYS[1], ARGV[2], ARGV[1])
+index_add(KEYS[2], ARGV[3], tonumber(ARGV[2]), tonumber(ARGV[4]), ARGV[5])
+return 1
+""")
+
+# Refresh rotation: consume the old jti and store the new one for the same
+# user, or do nothing at all if the old one is gone (reuse / expiry).
+_rotate_refresh = r.register_script(_INDEX_ADD + """
+local uid = redis.call('GET', KEYS[1])
+if not uid then
+    return false
+end
+redis.call('DEL', KEYS[1])
+local index = ARGV[6] .. uid
+redis.call('SREM', index, ARGV[1])
+redis.call('SETEX', KEYS[2], ARGV[3], uid)
+index_add(index, ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5])
+return uid
+""")
+
+# Logout: deny the access jti (if still live) and consume the refresh jti (if any)
+_logout = r.register_script("""
+if tonumber(ARGV[1]) > 0 then
+    redis.call('SETEX', KEYS[1], ARGV[1], '1')
+end
+if ARGV[2] ~= '' then
+    local uid = redis.call('GET', KEYS[2])
+    if uid then
+        redis.call('DEL', KEYS[2])
+        redis.call('SREM', ARGV[3] .. uid, ARGV[2])
+    end
+end
+return 1
+""")
+
+_take_refresh = r.register_script("""
+local uid = redis.call('GET', KEYS[1])
+if uid then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', ARGV[1] .. uid, ARGV[2])
+end
+return uid
+""")
+
+_index_refresh = r.register_script("""
+redis.call('SADD', KEYS[1], ARGV[1])
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+""")
+
+_revoke_user = r.register_script("""
+local n = 0
+for _, jti in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    n = n + redis.call('DEL', ARGV[1] .. jti)
+end
+redis.call('DEL', KEYS[1])
+return n
+""")
+
 
 # Store refresh token jti -> user_id (with TTL), and a denylist for access jti at logout
 async def store_refresh(jti: str, user_id: int, seconds: int):
-    await r.setex(f"rt:{jti}", seconds, str(user_id))
+    await _store_refresh(
+        keys=[f"{REFRESH_PREFIX}{jti}", f"{INDEX_PREFIX}{user_id}"],
+        args=[str(user_id), seconds, jti, INDEX_PRUNE_AT, REFRESH_PREFIX],
+        client=r,
+    )
+
+async def rotate_refresh(old_jti: str, new_jti: str, seconds: int):
+    """Swap old_jti for new_jti atomically. Returns the owner's user id, or None if old_jti was not live."""
+    return await _rotate_refresh(
+        keys=[f"{REFRESH_PREFIX}{old_jti}", f"{REFRESH_PREFIX}{new_jti}"],
+        args=[old_jti, new_jti, seconds, INDEX_PRUNE_AT, REFRESH_PREFIX, INDEX_PREFIX],
+        client=r,
+    )
+
+async def logout(access_jti: str = None, access_seconds: int = 0, refresh_jti: str = None):
+    """Deny an access jti for its remaining lifetime and drop a refresh jti, in one call."""
+    await _logout(
+        keys=[f"{DENY_PREFIX}{access_jti or ''}", f"{REFRESH_PREFIX}{refresh_jti or ''}"],
+        args=[access_seconds if access_jti else 0, refresh_jti or "", INDEX_PREFIX],
+        client=r,
+    )
 
 async def take_refresh(jti: str):
-    key = f"rt:{jti}"
-    # emulate GETDEL for Redis < 6.2
-    async with r.pipeline(transaction=True) as pipe:
-        pipe.get(key)
-        pipe.delete(key)
-        result, _ = await pipe.execute()
-        return result
+    return await _take_refresh(
+        keys=[f"{REFRESH_PREFIX}{jti}"], args=[INDEX_PREFIX, jti], client=r
+    )
+
+async def revoke_user_refresh(user_id: int) -> int:
+    """Drop every live refresh token of one user. Returns how many were removed."""
+    return await _revoke_user(
+        keys=[f"{INDEX_PREFIX}{user_id}"], args=[REFRESH_PREFIX], client=r
+    )
 
 async def deny_access(jti: str, seconds: int):
-    await r.setex(f"blk:{jti}", seconds, "1")
+    await r.setex(f"{DENY_PREFIX}{jti}", seconds, "1")
 
 async def is_denied(jti: str) -> bool:
-    return bool(await r.exists(f"blk:{jti}"))
+    return bool(await r.exists(f"{DENY_PREFIX}{jti}"))
+
+
+_SCRIPTS = (_store_refresh, _rotate_refresh, _logout, _take_refresh, _index_refresh, _revoke_user)
+
+
+async def load_scripts():
+    """SCRIPT LOAD every script once, so requests only ever send EVALSHA."""
+    for script in _SCRIPTS:
+        script.sha = await r.script_load(script.script)
+
+
+# --------------------------------------------------------
+# 🧹 One-off backfill of urt:* for rt:* keys written before the index existed
+# --------------------------------------------------------
+async def backfill_refresh_index(batch: int = 1000) -> int:
+    """
+    Walk rt:* with SCAN (non-blocking, unlike KEYS) and add each live jti to
+    its owner's index. Safe to re-run; returns the number of jtis indexed.
+    """
+    indexed = 0
+    cursor = 0
+    while True:
+        cursor, keys = await r.scan(cursor, match=f"{REFRESH_PREFIX}*", count=batch)
+        if keys:
+            async with r.pipeline(transaction=False) as pipe:
+                for k in keys:
+                    pipe.get(k)
+                    pipe.ttl(k)
+                values = await pipe.execute()
+
+            async with r.pipeline(transaction=False) as pipe:
+                for k, uid, ttl in zip(keys, values[0::2], values[1::2]):
+                    if uid is None or ttl <= 0:
+                        continue
+                    await _index_refresh(
+                        keys=[f"{INDEX_PREFIX}{uid}"],
+                        args=[k[len(REFRESH_PREFIX):], ttl],
+                        client=pipe,
+                    )
+                    indexed += 1
+                await pipe.execute()
+        if cursor == 0:
+            return indexed
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    if sys.argv[1:] == ["backfill"]:
+        print("Indexed", asyncio.run(backfill_refresh_index()), "refresh tokens")
+    else:
+        print("usage: python -m app.auth.redis_store backfill")
@@ -5,16 +5,21 @@ from fastapi import APIRouter, Depends, HTTPException, Response, Request
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from redis.exceptions import RedisError
 
+from app import mailer
 from app.database import get_db
 from .models import User
 from .deps import (
     make_token, verify_token, cookie_tokens,
     ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, ACTIVATE_TTL_HOURS,
-    create_reset_token, get_current_user
+    create_reset_token, get_current_user, get_current_user_row
 )
-from .redis_store import store_refresh, take_refresh, deny_access, r
-from .hash import verify_password, hash_password
+from .redis_store import store_refresh, rotate_refresh, logout as logout_tokens, revoke_user_refresh
+from .hash import verify_password_async, hash_password_async
+from .middleware import note_denied
+from . import user_cache
+from .user_cache import UserSnapshot
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -37,18 +42,37 @@ async def register(body: RegisterIn, db: AsyncSession = Depends(get_db)):
     if exists:
         raise HTTPException(400, "Email already registered")
 
-    user = User(email=body.email, password_hash=hash_password(body.password), is_active=False)
+    user = User(email=body.email, password_hash=await hash_password_async(body.password), is_active=False)
     db.add(user)
     await db.commit()
     await db.refresh(user)
 
-    # Create activation token
+    # Activation link goes out by mail; the worker sends it after we return
     activate_token, _, _ = make_token(str(user.id), timedelta(hours=ACTIVATE_TTL_HOURS), "activate")
+    try:
+        await mailer.send_activation(user.email, activate_token)
+    except RedisError:
+        return {"message": "Account created, but the activation email could not be queued. "
+                           "Use /auth/resend-activation to try again."}
 
-    return {
-        "message": "Account created. Use /auth/activate?token=... to activate.",
-        "activate_token": activate_token
-    }
+    return {"message": "Account created. Check your email for the activation link."}
+
+
+class ResendActivationIn(BaseModel):
+    email: EmailStr
+
+
+@router.post("/resend-activation", status_code=202)
+async def resend_activation(body: ResendActivationIn, db: AsyncSession = Depends(get_db)):
+    # Same answer whether or not the address is registered
+    user = (await db.execute(select(User).where(User.email == body.email))).scalar_one_or_none()
+    if user and not user.is_active:
+        activate_token, _, _ = make_token(str(user.id), timedelta(hours=ACTIVATE_TTL_HOURS), "activate")
+        try:
+            await mailer.send_activation(user.email, activate_token)
+        except RedisError:
+            raise HTTPException(503, "Email queue unavailable, try again later")
+    return {"detail": "If the account exists and is not active, an activation email is on its way"}
 
 
 @router.get("/activate")
@@ -59,6 +83,7 @@ async def activate(token: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(400, "User not found")
     user.is_active = True
     await db.commit()
+    await user_cache.invalidate(user.id)
     return {"message": "Account activated successfully"}
 
 
@@ -77,7 +102,7 @@ async def login(body: LoginIn, response: Response, db: AsyncSession = Depends(ge
     if not user:
         raise HTTPException(401, "Invalid email or password")
 
-    if not verify_password(body.password, user.password_hash):
+    if not await verify_password_async(body.password, user.password_hash):
         raise HTTPException(401, "Invalid email or password")
 
     if not user.is_active:
@@ -120,20 +145,19 @@ async def refresh(request: Request, response: Response):
     if not refresh_token:
         raise HTTPException(401, "Missing refresh token")
 
-    # Verify and rotate
+    # Verify and rotate (one atomic Redis call: the old jti is consumed only
+    # if the new one is stored)
     payload = verify_token(refresh_token, "refresh")
-    user_id = await take_refresh(payload["jti"])
-    if not user_id:
-        raise HTTPException(401, "Stale or invalid refresh")
-
+    user_id = payload["sub"]
     new_access, new_access_jti, _ = make_token(
         str(user_id), timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES), "access"
     )
     new_refresh, new_refresh_jti, _ = make_token(
         str(user_id), timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), "refresh"
     )
-
-    await store_refresh(new_refresh_jti, int(user_id), REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    owner = await rotate_refresh(payload["jti"], new_refresh_jti, REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    if owner is None or str(owner) != str(user_id):
+        raise HTTPException(401, "Stale or invalid refresh")
 
     # Set new cookies
     cookie_tokens(response, new_access, new_refresh)
@@ -145,14 +169,19 @@ async def logout(request: Request, response: Response):
     atk = request.cookies.get("access_token")
     rtk = request.cookies.get("refresh_token")
 
+    access_jti = refresh_jti = None
+    ttl = 0
     if atk:
         p = verify_token(atk, "access")
+        access_jti = p["jti"]
         ttl = int(p["exp"] - datetime.utcnow().timestamp())
-        await deny_access(p["jti"], max(ttl, 0))
+        note_denied(p["jti"], p["exp"])
 
     if rtk:
-        p = verify_token(rtk, "refresh")
-        await take_refresh(p["jti"])
+        refresh_jti = verify_token(rtk, "refresh")["jti"]
+
+    if access_jti or refresh_jti:
+        await logout_tokens(access_jti, max(ttl, 0), refresh_jti)
 
     response.delete_cookie("access_token", path="/")
     response.delete_cookie("refresh_token", path="/")
@@ -179,14 +208,15 @@ class PasswordChangeIn(BaseModel):
 @router.post("/change-password")
 async def change_password(
     payload: PasswordChangeIn,
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_row),
     db: AsyncSession = Depends(get_db)
 ):
-    if not verify_password(payload.old_password, user.password_hash):
+    if not await verify_password_async(payload.old_password, user.password_hash):
         raise HTTPException(400, "Incorrect old password")
 
-    user.password_hash = hash_password(payload.new_password)
+    user.password_hash = await hash_password_async(payload.new_password)
     await db.commit()
+    await user_cache.invalidate(user.id)
     return {"detail": "Password changed successfully"}
 
 
@@ -202,16 +232,13 @@ async def forgot_password(payload: ForgotPasswordIn, db: AsyncSession = Depends(
     if not user:
         raise HTTPException(404, "User not found")
 
-    token = create_reset_token(user.id)
-    reset_link = f"http://127.0.0.1:8000/auth/reset-password?token={token}"
-
-    print(f"[DEBUG] Reset link: {reset_link}")
+    token, _, _ = create_reset_token(user.id)
+    try:
+        await mailer.send_password_reset(user.email, token)
+    except RedisError:
+        raise HTTPException(503, "Email queue unavailable, try again later")
 
-    # For now, return the link so frontend can use it
-    return {
-        "detail": "Password reset link generated",
-        "reset_link": reset_link
-    }
+    return {"detail": "Password reset link sent"}
 
 
 
@@ -251,15 +278,12 @@ async def reset_password(
         }
 
     # 4️⃣ Hash and update password
-    user.password_hash = hash_password(new_password)
+    user.password_hash = await hash_password_async(new_password)
     await db.commit()
+    await user_cache.invalidate(user.id)
 
     # 5️⃣ Optional — invalidate old tokens (logout everywhere)
-    keys = await r.keys("rt:*")
-    for k in keys:
-        val = await r.get(k)
-        if val == str(user.id):
-            await r.delete(k)
+    await revoke_user_refresh(user.id)
 
     return {"detail": "Password reset successfully"}
 
@@ -286,14 +310,8 @@ async def verify_reset_token(token: str, db: AsyncSession = Depends(get_db)):
 # 🚫 Revoke All Tokens
 # -------------------------------------------------------------------
 @router.post("/revoke-all")
-async def revoke_all(user: User = Depends(get_current_user)):
-    keys = await r.keys("rt:*")
-    count = 0
-    for k in keys:
-        val = await r.get(k)
-        if val == str(user.id):  # no .decode() needed (decode_responses=True)
-            await r.delete(k)
-            count += 1
+async def revoke_all(user: UserSnapshot = Depends(get_current_user)):
+    count = await revoke_user_refresh(user.id)
     return {"detail": f"Revoked {count} refresh tokens"}
 
 
@@ -303,24 +321,28 @@ async def revoke_all(user: User = Depends(get_current_user)):
 class ProfileUpdateIn(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
+    city: Optional[str] = None
 
 
 @router.get("/profile")
-async def get_profile(user: User = Depends(get_current_user)):
-    return {"id": user.id, "email": user.email, "name": getattr(user, "name", None)}
+async def get_profile(user: UserSnapshot = Depends(get_current_user)):
+    return {"id": user.id, "email": user.email, "name": getattr(user, "name", None), "city": user.city}
 
 
 @router.put("/profile")
 async def update_profile(
     payload: ProfileUpdateIn,
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_row),
     db: AsyncSession = Depends(get_db)
 ):
     if payload.name:
         user.name = payload.name
     if payload.email:
         user.email = payload.email
+    if payload.city:
+        user.city = payload.city
     await db.commit()
+    await user_cache.invalidate(user.id)
     return {"detail": "Profile updated successfully"}
 
 
@@ -328,5 +350,5 @@ async def update_profile(
 # 👤 /me (alias of /profile)
 # -------------------------------------------------------------------
 @router.get("/me")
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(user: UserSnapshot = Depends(get_current_user)):
     return {"id": user.id, "email": user.email, "name": getattr(user, "name", None)}
@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+from redis.exceptions import RedisError
+
+from app.auth import redis_store
+
+# Tier 1: per-process LRU with a short TTL (bounds staleness across workers).
+# Tier 2: optional Redis copy shared by all workers, keyed usr:{id}.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "0") == "1"
+USER_CACHE_REDIS_TTL = int(os.getenv("USER_CACHE_REDIS_TTL", "300"))
+
+
+@dataclass(slots=True, frozen=True)
+class UserSnapshot:
+    """Read-only view of a users row; no password hash, no ORM session."""
+    id: int
+    email: str
+    name: str | None
+    is_active: bool
+    city: str | None = None
+
+
+_local = OrderedDict()
+_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _key(user_id: int) -> str:
+    return f"usr:{user_id}"
+
+
+def snapshot(user) -> UserSnapshot:
+    return UserSnapshot(id=user.id, email=user.email, name=user.name, is_active=user.is_active, city=user.city)
+
+
+def _remember(user: UserSnapshot):
+    _local[user.id] = (user, time.monotonic() + USER_CACHE_TTL)
+    _local.move_to_end(user.id)
+    if len(_local) > USER_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+async def get(user_id: int):
+    entry = _local.get(user_id)
+    if entry is not None:
+        if entry[1] > time.monotonic():
+            _local.move_to_end(user_id)
+            _stats["local_hits"] += 1
+            return entry[0]
+        del _local[user_id]
+
+    if USER_CACHE_REDIS:
+        try:
+            raw = await redis_store.r.get(_key(user_id))
+        except RedisError:
+            raw = None
+        if raw:
+            user = UserSnapshot(**json.loads(raw))
+            _remember(user)
+            _stats["redis_hits"] += 1
+            return user
+
+    _stats["misses"] += 1
+    return None
+
+
+async def put(user) -> UserSnapshot:
+    """Cache an ORM User (or snapshot) and return its snapshot."""
+    snap = user if isinstance(user, UserSnapshot) else snapshot(user)
+    _remember(snap)
+    if USER_CACHE_REDIS:
+        try:
+            await redis_store.r.setex(_key(snap.id), USER_CACHE_REDIS_TTL, json.dumps(asdict(snap)))
+        except RedisError:
+            pass
+    return snap
+
+
+async def invalidate(user_id: int):
+    """Call after committing any change to a users row."""
+    _local.pop(user_id, None)
+    _stats["invalidations"] += 1
+    if USER_CACHE_REDIS:
+        try:
+            await redis_store.r.delete(_key(user_id))
+        except RedisError:
+            pass
+
+
+def stats() -> dict:
+    lookups = _stats["local_hits"] + _stats["redis_hits"] + _stats["misses"]
+    hits = lookups - _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_local),
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
@@ -1,16 +1,174 @@
+import logging
 import os
+import time
+from contextvars import ContextVar
+
 from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import metrics
 
 load_dotenv()
+log = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL").replace("postgresql+psycopg2", "postgresql+asyncpg")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# --------------------------------------------------------
+# ⚙️ Engine profile
+# --------------------------------------------------------
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))      # seconds waiting for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # below typical server/proxy idle cuts
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))  # 0 behind pgbouncer (transaction mode)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+DB_SLOW_REQUEST_QUERIES = int(os.getenv("DB_SLOW_REQUEST_QUERIES", "50"))  # log requests issuing more
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.observe(value=time.perf_counter() - started)
+
+
+def engine_options(url: str) -> dict:
+    options = {"echo": DB_ECHO}
+    if url.startswith("sqlite"):
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    if "+asyncpg" in url:
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {
+                "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+                "application_name": "weather-outfit-api",
+            },
+        }
+    return options
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
 
 async def get_db() -> AsyncSession:
     async with SessionLocal() as session:
         yield session
+
+
+# --------------------------------------------------------
+# 🔍 Per-request query count and DB time
+# --------------------------------------------------------
+class QueryStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set per request by QueryStatsMiddleware; SQLAlchemy's greenlets inherit the
+# caller's context, so the cursor events below see the request's object.
+_request_stats: ContextVar = ContextVar("db_request_stats", default=None)
+_totals = {"requests": 0, "queries": 0, "seconds": 0.0, "max_queries": 0, "slow_requests": 0}
+_by_route = {}  # route path -> [requests, queries, seconds]
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # on the statement's own context, so one that fails leaves nothing behind
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    metrics.DB_QUERY_LATENCY.observe(value=elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def _record(route: str, stats: QueryStats):
+    _totals["requests"] += 1
+    _totals["queries"] += stats.queries
+    _totals["seconds"] += stats.seconds
+    _totals["max_queries"] = max(_totals["max_queries"], stats.queries)
+    entry = _by_route.get(route)
+    if entry is None:
+        entry = _by_route[route] = [0, 0, 0.0]
+    entry[0] += 1
+    entry[1] += stats.queries
+    entry[2] += stats.seconds
+    metrics.DB_QUERIES_PER_REQUEST.observe(route, value=stats.queries)
+    if stats.queries > DB_SLOW_REQUEST_QUERIES:
+        _totals["slow_requests"] += 1
+        log.warning("%s issued %d queries (%.1f ms DB time)", route, stats.queries, stats.seconds * 1000)
+
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware: counts the queries and DB time of each HTTP request
+    and reports them as `X-DB-Queries` and `Server-Timing: db;dur=<ms>`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.queries).encode()),
+                    (b"server-timing", f"db;dur={stats.seconds * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            _record(route.path if route is not None else "<unmatched>", stats)
+
+
+def query_stats() -> dict:
+    """Totals plus per-route mean queries/DB time, worst offenders first."""
+    routes = {
+        path: {
+            "requests": n,
+            "queries_per_request": round(q / n, 2),
+            "db_ms_per_request": round(s / n * 1000, 3),
+        }
+        for path, (n, q, s) in sorted(_by_route.items(), key=lambda kv: kv[1][1] / kv[1][0], reverse=True)
+    }
+    pool = engine.pool
+    return {
+        **_totals,
+        "seconds": round(_totals["seconds"], 3),
+        "pool": pool.status() if hasattr(pool, "status") else None,
+        "routes": routes,
+    }
@@ -0,0 +1,553 @@
+"""
+Feedback counters.
+
+On Postgres, statement-level triggers on `feedback` keep two counter
+tables current (per user, per (outfit, weather_tag)), so summaries are
+primary-key lookups instead of scans over all feedback. Per weather_tag
+totals are a view over the outfit counters.
+Elsewhere (SQLite benches) the same helpers aggregate `feedback` directly.
+
+Counters can drift only through bugs or manual edits; reconcile them
+nightly:
+
+    python -m app.feedback reconcile --dry-run   # report drift only
+    python -m app.feedback reconcile
+
+POST /feedback takes one event or a list and answers 202 once the events
+are accepted. What "accepted" means is FEEDBACK_DURABILITY:
+
+    memory  queued in this process; flushed in batches by a BatchWriter.
+            Fastest; a crash loses at most the unflushed buffer.
+    redis   XADDed to the fb:events stream first. Every worker drains it
+            through the fb consumer group and XACKs only after the DB commit;
+            entries left by a crashed worker are reclaimed via XAUTOCLAIM.
+            An entry delivered more than FEEDBACK_MAX_DELIVERIES times goes
+            to the fb:dead stream (`python -m app.feedback requeue-dead`).
+    sync    written to the database before the response (no buffering).
+            Rows the database rejects are listed under "rejected" in the
+            response; a request whose every row is rejected gets 422.
+
+Each flush is one multi-row insert (COPY on asyncpg). If the database
+rejects the batch's data (e.g. an outfit deleted after the event was
+accepted: an FK violation), the rows are retried one by one and only the
+bad ones are dropped (dead-lettered in redis mode). The flush then bumps the
+users' recommendation-cache feedback version, then asks for a throttled
+online model step (FEEDBACK_MODEL_UPDATE_SECONDS, 0 = leave it to the
+`ml.dataset_preparation` + `ml.recommender_model train` jobs). A step is
+exactly those two jobs, run by whichever worker holds the MODEL_LOCK_KEY
+Redis lock: new rows are read from the table past the feature watermark,
+so each vote is trained on once, however many workers flushed it. When
+the buffer is full, requests get 503 with Retry-After instead of growing
+memory.
+
+Every NEIGHBOURS_REFRESH_SECONDS (0 = leave it to the
+`ml.recommender_model neighbours` job), a worker that has loaded the ML
+stack asks for a build of the collaborative NeighbourIndex. Whichever
+worker holds the NEIGHBOURS_LOCK_KEY Redis lock runs it: the votes every
+worker committed since the published version are read from the table and
+folded in, and the result is published for all workers to memory-map.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import case, func, select, text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import outfits, recommendation_cache
+from app.auth import redis_store
+from app.auth.deps import get_current_user
+from app.auth.user_cache import UserSnapshot
+from app.database import engine, get_db
+from app.ingest import BatchWriter, bulk_insert
+from app.models import Feedback, FeedbackCountOutfit, FeedbackCountUser, Outfit
+
+log = logging.getLogger(__name__)
+
+FEEDBACK_DURABILITY = os.getenv("FEEDBACK_DURABILITY", "memory")  # memory | redis | sync
+FEEDBACK_BATCH = int(os.getenv("FEEDBACK_BATCH", "500"))
+FEEDBACK_DELAY = float(os.getenv("FEEDBACK_DELAY", "0.5"))
+FEEDBACK_MAX_PENDING = int(os.getenv("FEEDBACK_MAX_PENDING", "20000"))
+FEEDBACK_MAX_EVENTS = int(os.getenv("FEEDBACK_MAX_EVENTS", "200"))  # per request
+FEEDBACK_RETRY_AFTER = os.getenv("FEEDBACK_RETRY_AFTER", "1")
+FEEDBACK_CLAIM_IDLE_MS = int(os.getenv("FEEDBACK_CLAIM_IDLE_MS", "30000"))
+# ~10 minutes of failed retries at the default idle time before giving up on an entry
+FEEDBACK_MAX_DELIVERIES = int(os.getenv("FEEDBACK_MAX_DELIVERIES", "20"))
+FEEDBACK_MODEL_UPDATE_SECONDS = float(os.getenv("FEEDBACK_MODEL_UPDATE_SECONDS", "60"))
+# expiry of the trainer lock, in case its holder dies mid-step
+FEEDBACK_MODEL_LOCK_SECONDS = int(os.getenv("FEEDBACK_MODEL_LOCK_SECONDS", "600"))
+MODEL_LOCK_KEY = "lock:model-trainer"
+NEIGHBOURS_REFRESH_SECONDS = float(os.getenv("NEIGHBOURS_REFRESH_SECONDS", "30"))
+NEIGHBOURS_LOCK_KEY = "lock:neighbours-builder"
+FEEDBACK_COLUMNS = ("user_id", "outfit_id", "weather_tag", "liked", "created_at")
+STREAM = "fb:events"
+DEAD_STREAM = "fb:dead"
+GROUP = "fb"
+
+
+def has_counters(db: AsyncSession) -> bool:
+    """The counter tables are trigger-maintained on Postgres only."""
+    return db.bind.dialect.name == "postgresql"
+
+
+# --------------------------------------------------------
+# 📊 Reads
+# --------------------------------------------------------
+async def user_summary(db: AsyncSession, user_id: int) -> dict:
+    if has_counters(db):
+        row = (await db.execute(
+            select(FeedbackCountUser.total, FeedbackCountUser.likes, FeedbackCountUser.dislikes)
+            .where(FeedbackCountUser.user_id == user_id)
+        )).first()
+    else:
+        row = (await db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((Feedback.liked.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Feedback.liked.is_(False), 1), else_=0)), 0),
+            ).where(Feedback.user_id == user_id)
+        )).first()
+    total, likes, dislikes = row or (0, 0, 0)
+    return {"total_feedbacks": total, "likes": likes, "dislikes": dislikes}
+
+
+async def outfit_tag_counts(db: AsyncSession, user_ids) -> list:
+    """
+    (outfit_id, weather_tag, liked, count) for every outfit owned by
+    `user_ids`, the shape app.recommender.Wardrobe.from_rows() takes.
+    """
+    if not has_counters(db):
+        return (await db.execute(
+            select(Feedback.outfit_id, Feedback.weather_tag, Feedback.liked, func.count())
+            .where(Feedback.user_id.in_(user_ids))
+            .group_by(Feedback.outfit_id, Feedback.weather_tag, Feedback.liked)
+        )).all()
+    rows = await db.execute(
+        select(
+            FeedbackCountOutfit.outfit_id, FeedbackCountOutfit.weather_tag,
+            FeedbackCountOutfit.likes, FeedbackCountOutfit.dislikes,
+        )
+        .join(Outfit, Outfit.id == FeedbackCountOutfit.outfit_id)
+        .where(Outfit.user_id.in_(user_ids), FeedbackCountOutfit.total > 0)
+    )
+    counts = []
+    for outfit_id, tag, likes, dislikes in rows:
+        tag = tag or None
+        if likes:
+            counts.append((outfit_id, tag, True, likes))
+        if dislikes:
+            counts.append((outfit_id, tag, False, dislikes))
+    return counts
+
+
+# --------------------------------------------------------
+# 📝 Write path
+# --------------------------------------------------------
+_stats = {"model_updates": 0, "model_rows": 0, "model_errors": 0, "model_skipped": 0,
+          "rejected": 0, "stream_acked": 0, "stream_claimed": 0, "dead_lettered": 0,
+          "neighbour_builds": 0, "neighbour_updates": 0, "neighbour_skipped": 0, "neighbour_errors": 0}
+_model_state = {"last": time.monotonic(), "task": None, "pending": 0}
+
+
+def _bad_data(exc) -> bool:
+    """Constraint or data errors (SQLSTATE classes 23 / 22): retrying the same rows cannot help."""
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    return str(getattr(exc, "sqlstate", "") or "")[:2] in ("22", "23")  # asyncpg COPY raises its own
+
+
+async def _insert(events):
+    async with engine.begin() as conn:
+        await bulk_insert(conn, Feedback.__table__, FEEDBACK_COLUMNS, events)
+
+
+async def write_feedback(events) -> list:
+    """
+    Flush a batch of event tuples (FEEDBACK_COLUMNS order). Returns the
+    events the database refused as bad data; everything else is written.
+    """
+    rejected = []
+    try:
+        await _insert(events)
+    except Exception as exc:
+        if not _bad_data(exc):
+            raise
+        # one bad row fails the whole statement: find it row by row
+        good = []
+        for event in events:
+            try:
+                await _insert([event])
+                good.append(event)
+            except Exception as row_exc:
+                if not _bad_data(row_exc):
+                    raise
+                rejected.append(event)
+        _stats["rejected"] += len(rejected)
+        log.warning("feedback: %d of %d events rejected (%s)", len(rejected), len(events), type(exc).__name__)
+        events = good
+        if not events:
+            return rejected
+    await recommendation_cache.bump_feedback_version({e[0] for e in events})
+    _queue_model_update(events)
+    return rejected
+
+
+def _queue_model_update(events):
+    if FEEDBACK_MODEL_UPDATE_SECONDS <= 0:
+        return
+    _model_state["pending"] += sum(1 for e in events if e[3] is not None)
+    due = time.monotonic() - _model_state["last"] >= FEEDBACK_MODEL_UPDATE_SECONDS
+    if due and _model_state["pending"] and _model_state["task"] is None:
+        _model_state["pending"] = 0
+        _model_state["last"] = time.monotonic()
+        _model_state["task"] = asyncio.create_task(_update_model(), name="feedback-model-update")
+
+
+_release_lock = redis_store.r.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+async def _update_model():
+    """
+    One online step if no other worker is running one: fold newly
+    committed feedback into the feature shards, then train() on the new
+    shards (flocked against the CLI jobs). Only the database reads run on
+    the loop; featurizing, shard writes and training go to the executor.
+    """
+    token = uuid.uuid4().hex
+    try:
+        if not await redis_store.r.set(MODEL_LOCK_KEY, token, nx=True, ex=FEEDBACK_MODEL_LOCK_SECONDS):
+            _stats["model_skipped"] += 1  # the holder's step reads these rows too
+            return
+        try:
+            from ml import dataset_preparation, recommender_model
+
+            summary = await dataset_preparation.build(wait=False)
+            if summary is None:
+                _stats["model_skipped"] += 1
+                return
+            result = await asyncio.get_running_loop().run_in_executor(None, recommender_model.train)
+            if result is not None:
+                _stats["model_updates"] += 1
+                _stats["model_rows"] += result[1]
+        finally:
+            await _release_lock(keys=[MODEL_LOCK_KEY], args=[token], client=redis_store.r)
+    except Exception:
+        _stats["model_errors"] += 1
+        log.exception("online model update failed")
+    finally:
+        _model_state["task"] = None
+
+
+async def _refresh_neighbours():
+    """
+    Publish the votes committed since the current NeighbourIndex version,
+    if no other worker or job is building one. Idle until the ML stack is
+    loaded in this worker (warm-up or first recommendation), so auth-only
+    workers never build. Readers pick the version up through
+    ml.recommender_model.get_neighbours().
+    """
+    while True:
+        await asyncio.sleep(NEIGHBOURS_REFRESH_SECONDS)
+        model = sys.modules.get("ml.recommender_model")
+        if model is None:
+            continue
+        token = uuid.uuid4().hex
+        try:
+            if not await redis_store.r.set(NEIGHBOURS_LOCK_KEY, token, nx=True, ex=FEEDBACK_MODEL_LOCK_SECONDS):
+                _stats["neighbour_skipped"] += 1
+                continue
+            try:
+                summary = await model.build_neighbours(wait=False)
+            finally:
+                await _release_lock(keys=[NEIGHBOURS_LOCK_KEY], args=[token], client=redis_store.r)
+            if summary is None:
+                _stats["neighbour_skipped"] += 1  # the CLI job holds the flock
+            elif summary["published"] is not None:
+                _stats["neighbour_builds" if summary["refit"] else "neighbour_updates"] += 1
+        except Exception:
+            _stats["neighbour_errors"] += 1
+            log.exception("neighbour index build failed")
+
+
+feedback_writer = BatchWriter(
+    "feedback", write_feedback,
+    max_batch=FEEDBACK_BATCH, max_delay=FEEDBACK_DELAY, max_pending=FEEDBACK_MAX_PENDING,
+)
+
+
+# Redis stream mode ----------------------------------------
+def _encode(event) -> dict:
+    user_id, outfit_id, tag, liked, created_at = event
+    return {
+        "u": user_id, "o": outfit_id, "t": tag or "",
+        "l": "" if liked is None else int(liked), "c": created_at.isoformat(),
+    }
+
+
+def _decode(fields) -> tuple:
+    liked = fields["l"]
+    return (
+        int(fields["u"]), int(fields["o"]), fields["t"] or None,
+        None if liked == "" else liked == "1", datetime.fromisoformat(fields["c"]),
+    )
+
+
+async def _append_stream(events):
+    if await redis_store.r.xlen(STREAM) + len(events) > FEEDBACK_MAX_PENDING:
+        return False
+    async with redis_store.r.pipeline(transaction=False) as pipe:
+        for e in events:
+            pipe.xadd(STREAM, _encode(e))
+        await pipe.execute()
+    return True
+
+
+async def _ensure_group():
+    try:
+        await redis_store.r.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+async def _dead_letter(entries, reason: str):
+    """Move stream entries to DEAD_STREAM, keeping their fields so they can be requeued."""
+    ids = [entry_id for entry_id, _ in entries]
+    async with redis_store.r.pipeline(transaction=True) as pipe:
+        for entry_id, fields in entries:
+            pipe.xadd(DEAD_STREAM, {**fields, "id": entry_id, "reason": reason})
+        pipe.xack(STREAM, GROUP, *ids)
+        pipe.xdel(STREAM, *ids)
+        await pipe.execute()
+    _stats["dead_lettered"] += len(entries)
+    log.warning("feedback: %d stream entries dead-lettered (%s)", len(entries), reason)
+
+
+async def _exhausted(entries) -> list:
+    """Dead-letter reclaimed entries delivered more than FEEDBACK_MAX_DELIVERIES times; return the rest."""
+    pending = await redis_store.r.xpending_range(
+        STREAM, GROUP, min=entries[0][0], max=entries[-1][0], count=len(entries)
+    )
+    tries = {p["message_id"]: p["times_delivered"] for p in pending}
+    dead = [e for e in entries if tries.get(e[0], 0) > FEEDBACK_MAX_DELIVERIES]
+    if not dead:
+        return entries
+    await _dead_letter(dead, "max deliveries")
+    return [e for e in entries if tries.get(e[0], 0) <= FEEDBACK_MAX_DELIVERIES]
+
+
+async def requeue_dead() -> int:
+    """Put every dead-lettered entry back on the stream (after fixing whatever failed it)."""
+    moved = 0
+    while entries := await redis_store.r.xrange(DEAD_STREAM, count=FEEDBACK_BATCH):
+        async with redis_store.r.pipeline(transaction=True) as pipe:
+            for entry_id, fields in entries:
+                pipe.xadd(STREAM, {k: v for k, v in fields.items() if k not in ("id", "reason")})
+            pipe.xdel(DEAD_STREAM, *[entry_id for entry_id, _ in entries])
+            await pipe.execute()
+        moved += len(entries)
+    return moved
+
+
+async def _consume(consumer: str):
+    """Drain the stream in batches; entries are acked only once committed."""
+    await _ensure_group()
+    next_claim = 0.0
+    while True:
+        try:
+            entries = []
+            if time.monotonic() >= next_claim:
+                # take over anything a dead worker left unacknowledged
+                _, entries, *_ = await redis_store.r.xautoclaim(
+                    STREAM, GROUP, consumer, FEEDBACK_CLAIM_IDLE_MS, "0-0", count=FEEDBACK_BATCH
+                )
+                _stats["stream_claimed"] += len(entries)
+                if entries:
+                    entries = await _exhausted(entries)
+                else:
+                    next_claim = time.monotonic() + FEEDBACK_CLAIM_IDLE_MS / 1000
+            if not entries:
+                response = await redis_store.r.xreadgroup(GROUP, consumer, {STREAM: ">"}, count=FEEDBACK_BATCH)
+                entries = response[0][1] if response else []
+            if not entries:
+                # polled rather than BLOCKed: a blocking read would pin a pooled connection
+                await asyncio.sleep(FEEDBACK_DELAY)
+                continue
+            ids = [entry_id for entry_id, _ in entries]
+            rejected = set(await write_feedback([_decode(fields) for _, fields in entries]))
+            if rejected:
+                bad = [e for e in entries if _decode(e[1]) in rejected]
+                await _dead_letter(bad, "rejected by the database")
+                ids = [entry_id for entry_id, fields in entries if _decode(fields) not in rejected]
+            if ids:
+                await redis_store.r.xack(STREAM, GROUP, *ids)
+                await redis_store.r.xdel(STREAM, *ids)
+                _stats["stream_acked"] += len(ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # unacked entries stay pending and are retried after FEEDBACK_CLAIM_IDLE_MS
+            log.exception("feedback stream consumer error")
+            await asyncio.sleep(1)
+
+
+_consumer_task = None
+_neighbours_task = None
+
+
+def start():
+    global _consumer_task, _neighbours_task
+    if FEEDBACK_DURABILITY == "memory":
+        feedback_writer.start()
+    elif FEEDBACK_DURABILITY == "redis" and _consumer_task is None:
+        consumer = f"{socket.gethostname()}-{os.getpid()}"
+        _consumer_task = asyncio.create_task(_consume(consumer), name="feedback-stream")
+    if NEIGHBOURS_REFRESH_SECONDS > 0 and _neighbours_task is None:
+        _neighbours_task = asyncio.create_task(_refresh_neighbours(), name="feedback-neighbours")
+
+
+async def stop():
+    global _consumer_task, _neighbours_task
+    await feedback_writer.stop()
+    for task in (_consumer_task, _neighbours_task):
+        if task is not None:
+            task.cancel()  # mid-batch stream entries stay pending and are reclaimed
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _consumer_task = _neighbours_task = None
+    if _model_state["task"] is not None:
+        await _model_state["task"]
+
+
+async def accept(events) -> Optional[list]:
+    """
+    Hand events over per FEEDBACK_DURABILITY. Returns the events the database
+    rejected (only known in sync mode), or None for "full, retry later".
+    """
+    if FEEDBACK_DURABILITY == "sync":
+        return await write_feedback(events)
+    if FEEDBACK_DURABILITY == "redis":
+        try:
+            queued = await _append_stream(events)
+        except RedisError:
+            raise HTTPException(503, "Feedback store unavailable", headers={"Retry-After": FEEDBACK_RETRY_AFTER})
+    else:
+        queued = feedback_writer.submit_many(events)
+    return [] if queued else None
+
+
+def diagnostics() -> dict:
+    return {
+        "durability": FEEDBACK_DURABILITY,
+        "writer": feedback_writer.diagnostics(),
+        "model_backlog": _model_state["pending"],
+        **_stats,
+    }
+
+
+# --------------------------------------------------------
+# 🔧 Reconciliation
+# --------------------------------------------------------
+async def reconcile(dry_run: bool = False) -> dict:
+    """Recompute every counter from `feedback`; returns drifted rows per table."""
+    async with engine.begin() as conn:
+        rows = await conn.execute(
+            text("SELECT counter, drifted FROM reconcile_feedback_counts(:dry_run)"),
+            {"dry_run": dry_run},
+        )
+        return {counter: drifted for counter, drifted in rows}
+
+
+# --------------------------------------------------------
+# 👍 Routes
+# --------------------------------------------------------
+router = APIRouter(prefix="/feedback", tags=["feedback"])
+
+
+class FeedbackIn(BaseModel):
+    outfit_id: int
+    liked: Optional[bool] = None
+    weather_tag: Optional[str] = Field(default=None, max_length=20)
+
+
+@router.post("", status_code=202)
+async def submit_feedback(
+    body: Union[FeedbackIn, list[FeedbackIn]],
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    items = body if isinstance(body, list) else [body]
+    if not items:
+        return {"accepted": 0, "rejected": [], "durability": FEEDBACK_DURABILITY}
+    if len(items) > FEEDBACK_MAX_EVENTS:
+        raise HTTPException(413, f"At most {FEEDBACK_MAX_EVENTS} events per request")
+
+    # ownership check against the in-memory wardrobe index, not a query per event
+    index = await outfits.get_index(db, user.id)
+    unknown = sorted({i.outfit_id for i in items if i.outfit_id not in index})
+    if unknown:
+        raise HTTPException(404, f"Unknown outfit ids: {unknown}")
+
+    now = datetime.utcnow()
+    events = [(user.id, i.outfit_id, i.weather_tag, i.liked, now) for i in items]
+    rejected = await accept(events)
+    if rejected is None:
+        raise HTTPException(503, "Feedback buffer full, retry shortly", headers={"Retry-After": FEEDBACK_RETRY_AFTER})
+    rejected_ids = [e[1] for e in rejected]
+    if rejected and len(rejected) == len(events):
+        raise HTTPException(422, f"Feedback rejected for outfit ids: {rejected_ids}")
+    return {"accepted": len(events) - len(rejected), "rejected": rejected_ids, "durability": FEEDBACK_DURABILITY}
+
+
+@router.get("/summary")
+async def feedback_summary(user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await user_summary(db, user.id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["reconcile", "requeue-dead"])
+    parser.add_argument("--dry-run", action="store_true", help="report drift without fixing it")
+    args = parser.parse_args()
+
+    if args.command == "requeue-dead":
+        async def requeue():
+            try:
+                return await requeue_dead()
+            finally:
+                await redis_store.r.aclose(close_connection_pool=True)
+
+        print(f"Requeued {asyncio.run(requeue())} dead-lettered feedback events")
+        return
+
+    async def run():
+        try:
+            return await reconcile(args.dry_run)
+        finally:
+            await engine.dispose()
+
+    drift = asyncio.run(run())
+    verb = "drifted" if args.dry_run else "fixed"
+    print(", ".join(f"{counter}: {n} {verb}" for counter, n in drift.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Location normalization: free-text city or "lat,lon" -> geohash cell.
+
+The bundled gazetteer (GAZETTEER_PATH, CSV: name,country,lat,lon,population,
+aliases) is loaded once per process into two in-memory indexes:
+
+    names   normalized name/alias -> places, plus a sorted key list so
+            prefix search is a bisect (GET /weather/locate)
+    cells   every geohash prefix up to GEO_INDEX_PRECISION chars -> places,
+            to name the nearest place for raw coordinates
+
+A Location's cell is the GEO_PRECISION-char geohash of its point (5 chars
+is about 4.9 x 4.9 km). "London", "london, gb", "Londres" and
+"51.51,-0.12" all resolve to "gcpvj", so they share one upstream fetch,
+one cache entry and one weather_data series. Names the gazetteer does not
+know keep their normalized text as the key (cell None).
+"""
+import bisect
+import csv
+import logging
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+# bundled with the repo: resolved from this file, not the working directory
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "gazetteer.csv"),
+)
+GEO_PRECISION = int(os.getenv("GEO_PRECISION", "5"))
+GEO_INDEX_PRECISION = 3  # ~156 km buckets for nearest-place lookups
+GEO_NAME_RADIUS_KM = float(os.getenv("GEO_NAME_RADIUS_KM", "50"))
+GEO_MEMO_SIZE = int(os.getenv("GEO_MEMO_SIZE", "20000"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_COORDS = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*[,;]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+@dataclass(frozen=True, slots=True)
+class Place:
+    name: str
+    country: str
+    lat: float
+    lon: float
+    population: int
+    cell: str
+
+
+@dataclass(frozen=True, slots=True)
+class Location:
+    name: str  # display name: gazetteer name, nearest place, or the normalized input
+    cell: str | None
+    lat: float | None = None  # centre of the cell: what providers are queried with
+    lon: float | None = None
+
+    @property
+    def key(self) -> str:
+        """Cache / single-flight key: the cell, or the text when unresolved."""
+        return self.cell or f"q:{self.name}"
+
+
+# --------------------------------------------------------
+# 🧭 Geohash
+# --------------------------------------------------------
+def encode(lat: float, lon: float, precision: int = GEO_PRECISION) -> str:
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            ch = ch << 1 | (lon >= mid)
+            lon_lo, lon_hi = (mid, lon_hi) if lon >= mid else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = ch << 1 | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def decode(cell: str):
+    """Centre (lat, lon) of a cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in cell:
+        value = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = value >> shift & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return round((lat_lo + lat_hi) / 2, 5), round((lon_lo + lon_hi) / 2, 5)
+
+
+def distance_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 12742 * math.asin(math.sqrt(a))
+
+
+def normalize_name(text: str) -> str:
+    """Case-, accent- and whitespace-insensitive form: "  São  Paulo" -> "sao paulo"."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().replace(".", " ").split())
+
+
+# --------------------------------------------------------
+# 📚 Gazetteer
+# --------------------------------------------------------
+class Gazetteer:
+    def __init__(self, places, names=None):
+        self.places = list(places)
+        self._names = names or {}  # normalized name or alias -> [Place], most populous first
+        self._keys = sorted(self._names)
+        self._cells = {}  # geohash prefix -> [Place]
+        for place in self.places:
+            for length in range(1, GEO_INDEX_PRECISION + 1):
+                self._cells.setdefault(place.cell[:length], []).append(place)
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        places, names = [], {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                lat, lon = float(row["lat"]), float(row["lon"])
+                place = Place(row["name"], row["country"].upper(), lat, lon,
+                              int(row["population"] or 0), encode(lat, lon))
+                places.append(place)
+                for alias in [row["name"], *filter(None, (row.get("aliases") or "").split("|"))]:
+                    names.setdefault(normalize_name(alias), []).append(place)
+        for matches in names.values():
+            matches.sort(key=lambda p: -p.population)
+        return cls(places, names)
+
+    def lookup(self, text: str):
+        """Best place for "name" or "name, CC"; None when unknown."""
+        name, _, country = normalize_name(text).partition(",")
+        matches = self._names.get(name.strip())
+        if not matches:
+            return None
+        country = country.strip().upper()
+        if country:
+            matches = [p for p in matches if p.country == country] or matches
+        return matches[0]
+
+    def search(self, prefix: str, limit: int = 10) -> list:
+        """Places whose name or alias starts with `prefix`, most populous first."""
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        found = {}
+        i = bisect.bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix):
+            for place in self._names[self._keys[i]]:
+                found[place.cell, place.name] = place
+            i += 1
+        return sorted(found.values(), key=lambda p: -p.population)[:limit]
+
+    def nearest(self, lat: float, lon: float):
+        """Closest place sharing the longest geohash prefix; None beyond GEO_NAME_RADIUS_KM."""
+        cell = encode(lat, lon, GEO_INDEX_PRECISION)
+        for length in range(GEO_INDEX_PRECISION, 0, -1):
+            candidates = self._cells.get(cell[:length])
+            if candidates:
+                best = min(candidates, key=lambda p: distance_km(lat, lon, p.lat, p.lon))
+                if distance_km(lat, lon, best.lat, best.lon) <= GEO_NAME_RADIUS_KM:
+                    return best
+                return None
+        return None
+
+
+_gazetteer = None
+_memo = {}
+_stats = {"resolved": 0, "coordinates": 0, "unresolved": 0, "memo_hits": 0}
+
+
+def get_gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        try:
+            _gazetteer = Gazetteer.load()
+        except FileNotFoundError:
+            log.warning("gazetteer %s not found: city names will not resolve to cells", GAZETTEER_PATH)
+            _gazetteer = Gazetteer([])  # every name stays unresolved: per-text keys, as before
+    return _gazetteer
+
+
+# --------------------------------------------------------
+# 📍 Resolution
+# --------------------------------------------------------
+def _cell_location(name: str, lat: float, lon: float) -> Location:
+    cell = encode(lat, lon)
+    center_lat, center_lon = decode(cell)
+    return Location(name=name, cell=cell, lat=center_lat, lon=center_lon)
+
+
+def coordinates(text: str):
+    """(lat, lon) if the text is written as coordinates, else None. Not range-checked."""
+    match = _COORDS.match(text)
+    return (float(match[1]), float(match[2])) if match else None
+
+
+def in_range(lat: float, lon: float) -> bool:
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def resolve_point(lat: float, lon: float) -> Location:
+    if not in_range(lat, lon):
+        raise ValueError(f"Coordinates out of range: {lat}, {lon}")
+    place = get_gazetteer().nearest(lat, lon)
+    return _cell_location(place.name if place else f"{lat:.2f},{lon:.2f}", lat, lon)
+
+
+def resolve(text: str) -> Location:
+    """City name, "name, CC" or "lat,lon" -> Location. Never raises for names."""
+    memo_key = " ".join(text.lower().split())
+    location = _memo.get(memo_key)
+    if location is not None:
+        _stats["memo_hits"] += 1
+        return location
+
+    coords = coordinates(text)
+    if coords and in_range(*coords):
+        location = resolve_point(*coords)
+        _stats["coordinates"] += 1
+    else:  # out-of-range "coordinates" (a profile city of "95, 10") are just text
+        place = get_gazetteer().lookup(text)
+        if place is not None:
+            location = _cell_location(place.name, place.lat, place.lon)
+            _stats["resolved"] += 1
+        else:
+            location = Location(name=memo_key, cell=None)
+            _stats["unresolved"] += 1
+
+    if len(_memo) >= GEO_MEMO_SIZE:
+        _memo.pop(next(iter(_memo)))
+    _memo[memo_key] = location
+    return location
+
+
+def stats() -> dict:
+    return {"places": len(get_gazetteer().places), "precision": GEO_PRECISION, "memo": len(_memo), **_stats}
@@ -0,0 +1,212 @@
+"""
+Outfit images.
+
+Uploads are streamed to disk with aiofiles. Each chunk is hashed on the
+way in, so the body is never held in memory. Files are stored by content
+hash under IMAGE_DIR:
+
+    ab/ab12...ef.jpg          original, exactly as uploaded (never re-encoded)
+    ab/ab12...ef-256.webp     thumbnails, one per IMAGE_THUMB_SIZES, made once at upload
+
+outfits.image_path holds the relative original path. The hash doubles as
+the ETag, so a conditional GET is answered with 304 from the DB row alone,
+without touching the file. Files are served through FileResponse, which
+supports Range requests. When the server offers the ASGI pathsend
+extension, the file is handed to it for zero-copy sendfile.
+
+Identical uploads share files. Replaced images are left on disk for an
+offline sweep, because another outfit may still reference them.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import aiofiles
+import aiofiles.os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import FileResponse
+
+from app.auth.deps import get_current_user
+from app.auth.user_cache import UserSnapshot
+from app.database import get_db
+from app.outfits import _out, _owned
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "data/images")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_THUMB_SIZES = tuple(int(s) for s in os.getenv("IMAGE_THUMB_SIZES", "128,256,512").split(","))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_CACHE_SECONDS = int(os.getenv("IMAGE_CACHE_SECONDS", "86400"))
+CONTENT_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+MEDIA_TYPES = {ext: ctype for ctype, ext in CONTENT_TYPES.items()}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Pillow releases the GIL while decoding/resizing
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="thumbs")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def thumbnail_path(image_path: str, size: int) -> str:
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}-{size}.webp"
+
+
+def _digest(image_path: str) -> str:
+    return os.path.splitext(os.path.basename(image_path))[0]
+
+
+# --------------------------------------------------------
+# 🖼 Thumbnails (worker threads)
+# --------------------------------------------------------
+def make_thumbnails(src: str, sizes=IMAGE_THUMB_SIZES):
+    """Validate the upload and write one WebP per size. Raises ValueError if not an image."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(src) as probe:
+            probe.verify()
+        with Image.open(src) as im:
+            im = ImageOps.exif_transpose(im)
+            if im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+            for size in sorted(sizes, reverse=True):
+                im.thumbnail((size, size))  # shrinks in place: each size starts from the previous
+                out = thumbnail_path(src, size)
+                im.save(out + ".tmp", "WEBP", quality=80, method=4)
+                os.replace(out + ".tmp", out)
+    except (UnidentifiedImageError, OSError, SyntaxError) as exc:
+        raise ValueError(str(exc)) from exc
+
+
+# --------------------------------------------------------
+# 📥 Streaming upload
+# --------------------------------------------------------
+async def store_upload(request: Request) -> str:
+    """Stream the request body to disk; returns the content-addressed relative path."""
+    ext = CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if ext is None:
+        raise HTTPException(415, f"Content-Type must be one of {', '.join(CONTENT_TYPES)}")
+
+    await aiofiles.os.makedirs(IMAGE_DIR, exist_ok=True)
+    tmp = os.path.join(IMAGE_DIR, f".upload-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise HTTPException(413, f"Image larger than {IMAGE_MAX_BYTES} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+        if not size:
+            raise HTTPException(400, "Empty body")
+
+        sha = digest.hexdigest()
+        image_path = f"{sha[:2]}/{sha}.{ext}"
+        final = os.path.join(IMAGE_DIR, image_path)
+        if await aiofiles.os.path.exists(final):
+            return image_path  # same bytes uploaded before: file and thumbnails exist
+        try:
+            await asyncio.get_running_loop().run_in_executor(_get_executor(), make_thumbnails, tmp)
+        except ValueError:
+            raise HTTPException(400, "Not a valid image")
+        await aiofiles.os.makedirs(os.path.dirname(final), exist_ok=True)
+        for s in IMAGE_THUMB_SIZES:
+            await aiofiles.os.replace(thumbnail_path(tmp, s), thumbnail_path(final, s))
+        await aiofiles.os.replace(tmp, final)  # last, so an existing original implies its thumbnails
+        return image_path
+    finally:
+        for leftover in (tmp, *(thumbnail_path(tmp, s) for s in IMAGE_THUMB_SIZES)):
+            try:
+                await aiofiles.os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+
+# --------------------------------------------------------
+# 📤 Serving
+# --------------------------------------------------------
+class ImageResponse(FileResponse):
+    """FileResponse that lets the server sendfile() the body when it offers ASGI pathsend."""
+
+    async def __call__(self, scope, receive, send):
+        self._pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send, send_header_only):
+        if not self._pathsend or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+
+
+def _etag(image_path: str, size) -> str:
+    return f'"{_digest(image_path)}-{size or "orig"}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+
+router = APIRouter(prefix="/outfits", tags=["images"])
+
+
+@router.put("/{outfit_id}/image")
+async def upload_image(
+    outfit_id: int,
+    request: Request,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Raw image body (Content-Type image/jpeg, image/png or image/webp)."""
+    outfit = await _owned(db, outfit_id, user.id)
+    outfit.image_path = await store_upload(request)
+    await db.commit()
+    return _out(outfit)
+
+
+@router.get("/{outfit_id}/image")
+async def get_image(
+    outfit_id: int,
+    request: Request,
+    size: int = None,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if size is not None and size not in IMAGE_THUMB_SIZES:
+        raise HTTPException(400, f"size must be one of {IMAGE_THUMB_SIZES}")
+    outfit = await _owned(db, outfit_id, user.id)
+    if not outfit.image_path:
+        raise HTTPException(404, "Outfit has no image")
+
+    etag = _etag(outfit.image_path, size)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={IMAGE_CACHE_SECONDS}"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if size is None:
+        path, media_type = outfit.image_path, MEDIA_TYPES[outfit.image_path.rsplit(".", 1)[-1]]
+    else:
+        path, media_type = thumbnail_path(outfit.image_path, size), "image/webp"
+    full = os.path.join(IMAGE_DIR, path)
+    if not await aiofiles.os.path.isfile(full):
+        raise HTTPException(404, "Image file missing")
+    return ImageResponse(full, media_type=media_type, headers=headers)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import insert
+
+log = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Write-behind buffer: items are submitted without waiting and flushed in
+    batches by a background task, whenever `max_batch` items are queued or
+    `max_delay` seconds have passed since the first one. `flush` is an async
+    callable taking a list. stop() drains everything still queued.
+    """
+
+    def __init__(self, name: str, flush, max_batch: int = 500, max_delay: float = 1.0, max_pending: int = 10000):
+        self.name = name
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+        self._draining = False
+        self.stats = {"submitted": 0, "dropped": 0, "flushed": 0, "batches": 0, "failed": 0, "flush_seconds": 0.0}
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._draining = False
+            self._task = asyncio.create_task(self._run(), name=f"batch-writer:{self.name}")
+
+    def submit(self, item) -> bool:
+        """Queue one item. Returns False (and counts a drop) when the buffer is full."""
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def submit_many(self, items) -> bool:
+        """Queue all of `items` or none of them (False, counted as drops, when they don't fit)."""
+        if self._queue.maxsize and self._queue.qsize() + len(items) > self._queue.maxsize:
+            self.stats["dropped"] += len(items)
+            return False
+        for item in items:
+            self._queue.put_nowait(item)
+        self.stats["submitted"] += len(items)
+        return True
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._draining = True
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._draining:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            t0 = time.perf_counter()
+            try:
+                await self.flush(batch)
+                self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+            except Exception:
+                self.stats["failed"] += len(batch)
+                log.exception("%s: failed to flush %d items", self.name, len(batch))
+            finally:
+                self.stats["flush_seconds"] += time.perf_counter() - t0
+                for _ in batch:
+                    self._queue.task_done()
+
+    def diagnostics(self) -> dict:
+        return {"pending": self.pending, **self.stats}
+
+
+async def bulk_insert(conn, table, columns, records):
+    """
+    Insert many rows on an AsyncConnection: COPY on asyncpg, one multi-row
+    INSERT elsewhere. Runs inside the caller's transaction; the caller commits.
+    """
+    if not records:
+        return
+    if conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(table.name, records=records, columns=columns)
+    else:
+        await conn.execute(insert(table), [dict(zip(columns, r)) for r in records])
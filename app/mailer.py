@@ -0,0 +1,357 @@
+"""
+Outbound email (account activation, password reset), sent off the request path.
+
+    enqueue()  ->  mail:outbox (Redis stream)  ->  worker  ->  SMTP
+
+Endpoints call enqueue() and return at once. A message is dropped when
+the same kind of mail went to the same address within
+MAIL_DEDUP_SECONDS, so a user hammering "forgot password" gets one mail.
+The dedup check and the XADD run in one Lua call.
+
+Workers read the stream through the `mailer` consumer group, MAIL_BATCH
+entries at a time, and send them over a pool of MAIL_SMTP_CONNECTIONS
+SMTP connections. Each connection stays open and logged in across batches
+and is recycled after MAIL_CONNECTION_MAX_AGE seconds. An entry is acked
+once its mail was accepted by the server or given up on:
+
+    temporary failure   (4xx, connection/timeout errors) re-queued through
+                        the mail:retry sorted set after MAIL_RETRY_BASE * 2^attempt s
+    permanent failure   (5xx, refused recipient, MAIL_MAX_ATTEMPTS used)
+                        pushed to mail:dead for inspection
+
+Entries a crashed worker left unacked are reclaimed with XAUTOCLAIM. By
+default every API worker runs one consumer (MAIL_WORKER=1). Set it to 0
+and run `python -m app.mailer worker` to send from a separate process.
+
+MAIL_BACKEND=log (development) logs messages at INFO instead of sending
+them, with link tokens redacted; the full messages stay in outbox_log,
+in the worker's memory only. To exercise the SMTP path locally, run the
+stand-in server:
+
+    python -m bench.smtp_sink --port 1025
+    MAIL_BACKEND=smtp SMTP_PORT=1025 SMTP_STARTTLS=0 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from collections import deque
+from email.message import EmailMessage
+
+from redis.exceptions import RedisError, ResponseError
+
+from app.auth import redis_store
+
+log = logging.getLogger(__name__)
+
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "smtp")  # smtp | log
+MAIL_FROM = os.getenv("MAIL_FROM", "Weather Outfit <no-reply@localhost>")
+APP_BASE_URL = os.getenv("APP_BASE_URL", "http://127.0.0.1:8000")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+MAIL_WORKER = os.getenv("MAIL_WORKER", "1") == "1"
+MAIL_BATCH = int(os.getenv("MAIL_BATCH", "50"))
+MAIL_SMTP_CONNECTIONS = int(os.getenv("MAIL_SMTP_CONNECTIONS", "2"))
+MAIL_CONNECTION_MAX_AGE = float(os.getenv("MAIL_CONNECTION_MAX_AGE", "300"))
+MAIL_DEDUP_SECONDS = int(os.getenv("MAIL_DEDUP_SECONDS", "60"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", "5"))
+MAIL_POLL = float(os.getenv("MAIL_POLL", "1"))
+MAIL_CLAIM_IDLE_MS = int(os.getenv("MAIL_CLAIM_IDLE_MS", "60000"))
+MAIL_DEAD_KEEP = 1000
+
+OUTBOX = "mail:outbox"
+RETRY = "mail:retry"
+DEAD = "mail:dead"
+GROUP = "mailer"
+DEDUP_PREFIX = "mail:dedup:"
+TOKEN_PARAM = re.compile(r"(token=)[^\s&]+")
+
+_stats = {"enqueued": 0, "deduped": 0, "sent": 0, "retried": 0, "dead": 0, "batches": 0, "connects": 0, "claimed": 0}
+outbox_log = deque(maxlen=100)  # MAIL_BACKEND=log: the last messages "sent"
+
+_enqueue = redis_store.r.register_script("""
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    redis.call('XADD', KEYS[2], '*', 'm', ARGV[2])
+    return 1
+end
+return 0
+""")
+
+# Move due retries back onto the stream, atomically per call
+_promote = redis_store.r.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, raw in ipairs(due) do
+    redis.call('ZREM', KEYS[1], raw)
+    redis.call('XADD', KEYS[2], '*', 'm', raw)
+end
+return #due
+""")
+
+
+# --------------------------------------------------------
+# 📮 Enqueue (request path)
+# --------------------------------------------------------
+async def enqueue(kind: str, to: str, subject: str, body: str) -> bool:
+    """Queue one mail. False when deduplicated. Raises RedisError if the queue is down."""
+    message = json.dumps({"id": uuid.uuid4().hex, "kind": kind, "to": to, "subject": subject,
+                          "body": body, "attempt": 0})
+    queued = await _enqueue(
+        keys=[f"{DEDUP_PREFIX}{kind}:{to.lower()}", OUTBOX], args=[MAIL_DEDUP_SECONDS, message],
+        client=redis_store.r,
+    )
+    _stats["enqueued" if queued else "deduped"] += 1
+    return bool(queued)
+
+
+async def send_activation(to: str, token: str) -> bool:
+    link = f"{APP_BASE_URL}/auth/activate?token={token}"
+    return await enqueue("activate", to, "Activate your account",
+                         f"Welcome! Open this link to activate your account:\n\n{link}\n")
+
+
+async def send_password_reset(to: str, token: str) -> bool:
+    link = f"{APP_BASE_URL}/auth/reset-password?token={token}"
+    return await enqueue("reset", to, "Reset your password",
+                         f"Someone asked to reset your password. If it was you, open:\n\n{link}\n\n"
+                         "Otherwise ignore this mail.\n")
+
+
+def _build(message: dict) -> EmailMessage:
+    mail = EmailMessage()
+    mail["From"] = MAIL_FROM
+    mail["To"] = message["to"]
+    mail["Subject"] = message["subject"]
+    mail["Message-ID"] = f"<{message['id']}@{socket.gethostname()}>"
+    mail.set_content(message["body"])
+    return mail
+
+
+# --------------------------------------------------------
+# 🔌 SMTP connection pool
+# --------------------------------------------------------
+class PermanentFailure(Exception):
+    """The server refused the message for good; retrying will not help."""
+
+
+class SMTPPool:
+    """
+    `size` authenticated SMTP connections, opened on first use and kept
+    open between batches. A connection that errors is closed and reopened
+    by its next send.
+    """
+
+    def __init__(self, size: int = None):
+        self._idle = asyncio.Queue()
+        for _ in range(size or MAIL_SMTP_CONNECTIONS):
+            self._idle.put_nowait({"smtp": None, "opened_at": 0.0})
+
+    async def _open(self, slot):
+        import aiosmtplib
+
+        smtp = aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT, timeout=SMTP_TIMEOUT, start_tls=SMTP_STARTTLS)
+        await smtp.connect()
+        if SMTP_USER:
+            try:
+                await smtp.login(SMTP_USER, SMTP_PASSWORD)
+            except Exception:
+                smtp.close()
+                raise
+        slot["smtp"], slot["opened_at"] = smtp, time.monotonic()
+        _stats["connects"] += 1
+
+    async def _close(self, slot):
+        smtp, slot["smtp"] = slot["smtp"], None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+    async def send(self, mail: EmailMessage):
+        import aiosmtplib
+
+        slot = await self._idle.get()
+        try:
+            if slot["smtp"] is not None and (
+                not slot["smtp"].is_connected or time.monotonic() - slot["opened_at"] > MAIL_CONNECTION_MAX_AGE
+            ):
+                await self._close(slot)
+            if slot["smtp"] is None:
+                try:
+                    await self._open(slot)
+                except Exception as exc:  # refused login or unreachable server: retry later
+                    raise ConnectionError(f"SMTP connect to {SMTP_HOST}:{SMTP_PORT} failed: {exc!r}") from exc
+            await slot["smtp"].send_message(mail)
+        except aiosmtplib.SMTPRecipientsRefused as exc:
+            raise PermanentFailure(str(exc)) from exc
+        except aiosmtplib.SMTPResponseException as exc:
+            # the server answered, so the connection is still good
+            if exc.code >= 500:
+                raise PermanentFailure(f"{exc.code} {exc.message}") from exc
+            raise
+        except Exception:
+            await self._close(slot)
+            raise
+        finally:
+            self._idle.put_nowait(slot)
+
+    async def close(self):
+        while not self._idle.empty():
+            slot = self._idle.get_nowait()
+            await self._close(slot)
+
+
+async def _deliver(pool, message: dict) -> str:
+    """Send one message; returns "sent", "retry" or "dead"."""
+    if MAIL_BACKEND == "log":
+        log.info("mail %s to %s (log backend) subject=%r\n%s", message["id"], message["to"],
+                 message["subject"], TOKEN_PARAM.sub(r"\1<redacted>", message["body"]))
+        outbox_log.append(message)
+        return "sent"
+    try:
+        await pool.send(_build(message))
+        return "sent"
+    except PermanentFailure as exc:
+        log.warning("mail %s to %s refused: %s", message["id"], message["to"], exc)
+        return "dead"
+    except Exception as exc:
+        log.info("mail %s to %s failed (attempt %d): %r", message["id"], message["to"], message["attempt"] + 1, exc)
+        return "retry" if message["attempt"] + 1 < MAIL_MAX_ATTEMPTS else "dead"
+
+
+# --------------------------------------------------------
+# 📤 Worker
+# --------------------------------------------------------
+async def _ensure_group():
+    try:
+        await redis_store.r.xgroup_create(OUTBOX, GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+async def process_batch(pool, entries):
+    """Deliver a batch over the pool, then settle every entry (retry / dead / ack)."""
+    messages = [json.loads(fields["m"]) for _, fields in entries]
+    outcomes = await asyncio.gather(*(_deliver(pool, m) for m in messages))
+    now = time.time()
+    async with redis_store.r.pipeline(transaction=False) as pipe:
+        for message, outcome in zip(messages, outcomes):
+            _stats[{"sent": "sent", "retry": "retried", "dead": "dead"}[outcome]] += 1
+            if outcome == "retry":
+                due = now + MAIL_RETRY_BASE * 2 ** message["attempt"]
+                pipe.zadd(RETRY, {json.dumps({**message, "attempt": message["attempt"] + 1}): due})
+            elif outcome == "dead":
+                pipe.lpush(DEAD, json.dumps({**message, "failed_at": now}))
+                pipe.ltrim(DEAD, 0, MAIL_DEAD_KEEP - 1)
+        ids = [entry_id for entry_id, _ in entries]
+        pipe.xack(OUTBOX, GROUP, *ids)
+        pipe.xdel(OUTBOX, *ids)
+        await pipe.execute()
+    _stats["batches"] += 1
+
+
+async def consume(consumer: str, pool: SMTPPool = None):
+    """Worker loop: promote due retries, reclaim abandoned entries, send new ones."""
+    pool = pool or SMTPPool()
+    await _ensure_group()
+    next_claim = 0.0
+    try:
+        while True:
+            try:
+                await _promote(keys=[RETRY, OUTBOX], args=[time.time(), MAIL_BATCH], client=redis_store.r)
+                entries = []
+                if time.monotonic() >= next_claim:
+                    _, entries, *_ = await redis_store.r.xautoclaim(
+                        OUTBOX, GROUP, consumer, MAIL_CLAIM_IDLE_MS, "0-0", count=MAIL_BATCH
+                    )
+                    _stats["claimed"] += len(entries)
+                    if not entries:
+                        next_claim = time.monotonic() + MAIL_CLAIM_IDLE_MS / 1000
+                if not entries:
+                    response = await redis_store.r.xreadgroup(GROUP, consumer, {OUTBOX: ">"}, count=MAIL_BATCH)
+                    entries = response[0][1] if response else []
+                if not entries:
+                    await asyncio.sleep(MAIL_POLL)
+                    continue
+                await process_batch(pool, entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # unacked entries stay pending and are reclaimed after MAIL_CLAIM_IDLE_MS
+                log.exception("mail worker error")
+                await asyncio.sleep(MAIL_POLL)
+    finally:
+        await pool.close()
+
+
+_worker_task = None
+
+
+def start():
+    global _worker_task
+    if MAIL_WORKER and _worker_task is None:
+        _worker_task = asyncio.create_task(consume(f"{socket.gethostname()}-{os.getpid()}"), name="mailer")
+
+
+async def stop():
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()  # a batch cut short stays pending and is reclaimed
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+
+
+def diagnostics() -> dict:
+    return {"backend": MAIL_BACKEND, "worker": _worker_task is not None, **_stats}
+
+
+async def status() -> dict:
+    """Queue depths, for the CLI."""
+    async with redis_store.r.pipeline(transaction=False) as pipe:
+        pipe.xlen(OUTBOX)
+        pipe.zcard(RETRY)
+        pipe.llen(DEAD)
+        outbox, retry, dead = await pipe.execute()
+    return {"outbox": outbox, "retry": retry, "dead": dead}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outbound email queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("worker", help="send queued mail until interrupted")
+    sub.add_parser("status", help="show queue depths")
+    args = parser.parse_args()
+
+    async def _main():
+        try:
+            if args.command == "worker":
+                await consume(f"{socket.gethostname()}-{os.getpid()}")
+            else:
+                print(await status())
+        except RedisError as exc:
+            raise SystemExit(f"Redis unavailable: {exc}")
+        finally:
+            await redis_store.r.aclose(close_connection_pool=True)
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,61 @@
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from redis.exceptions import RedisError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.openapi.docs import get_swagger_ui_html
 from app.auth.router import router as auth_router
 from app.auth.middleware import AuthMiddleware
+from app.auth.hash import shutdown_executor, pool_stats
+from app.auth import middleware as auth_middleware, redis_store, user_cache
+from app import weather, outfits, images, recommendations, recommendation_cache, feedback, mailer
+from app.database import QueryStatsMiddleware, query_stats
+from app import metrics
+from app import warmup
 
 
-app = FastAPI(title="Weather Outfit Recommender", version="0.1.0")
+# -------------------------------
+# Startup / shutdown
+# -------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await redis_store.load_scripts()
+    except RedisError:
+        pass  # the scripts load themselves on first use (EVALSHA -> NOSCRIPT -> LOAD)
+    weather.observation_writer.start()
+    feedback.start()
+    mailer.start()
+    if warmup.ML_PRELOAD == "background":
+        # off the loop: importing numpy and mapping the model must not stall requests
+        asyncio.get_running_loop().run_in_executor(None, warmup.warm_up)
+    yield
+    await mailer.stop()
+    await feedback.stop()
+    await weather.observation_writer.stop()
+    await weather.close_client()
+    # the pool was passed in explicitly, so aclose() alone would leave it open
+    await redis_store.r.aclose(close_connection_pool=True)
+    shutdown_executor()
+    images.shutdown_executor()
+
+
+app = FastAPI(title="Weather Outfit Recommender", version="0.1.0", lifespan=lifespan)
+
+if warmup.ML_PRELOAD == "master":
+    warmup.warm_up()  # before gunicorn --preload forks the workers
 
 # -------------------------------
 # Routers and middleware
 # -------------------------------
 app.include_router(auth_router)
+app.include_router(weather.router)
+app.include_router(outfits.router)
+app.include_router(images.router)
+app.include_router(recommendations.router)
+app.include_router(feedback.router)
 app.add_middleware(AuthMiddleware)
 
 app.add_middleware(
@@ -25,7 +69,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "Server-Timing"],
 )
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # -------------------------------
 # Health check
@@ -35,11 +82,35 @@ async def healthz():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/me")
 async def me(req: Request):
     return {"user_id": getattr(req.state, "user_id", None)}
 
 
+# -------------------------------
+# Diagnostics (cache and pool counters)
+# -------------------------------
+@app.get("/diagnostics", include_in_schema=False)
+async def diagnostics():
+    return {
+        "hash_pool": pool_stats(),
+        "auth_cache": auth_middleware.cache_stats(),
+        "user_cache": user_cache.stats(),
+        "weather": weather.get_weather_service().diagnostics(),
+        "weather_writer": weather.observation_writer.diagnostics(),
+        "model": warmup.diagnostics(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "feedback": feedback.diagnostics(),
+        "mail": mailer.diagnostics(),
+        "db": query_stats(),
+    }
+
+
 # -------------------------------
 # Custom Swagger UI (cookies + auth button)
 # -------------------------------
@@ -0,0 +1,197 @@
+"""
+In-process metrics in Prometheus text format, served at /metrics.
+
+Everything is observed from the event-loop thread (worker pools report
+their timings back to the loop), so the counters are plain ints and floats
+with no locks: an observation is a bisect plus two additions. Each worker
+process exposes its own numbers; scrape every worker, or run one per pod.
+"""
+import time
+from bisect import bisect_left
+
+# Seconds. Fine at the low end for Redis/pool waits, up to bcrypt-scale calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self.labels()  # unlabeled series are exported from the start, as zero
+        _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new()
+        return child
+
+    def _new(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new(self):
+        return [0.0]
+
+    def inc(self, *values, amount: float = 1.0):
+        self.labels(*values)[0] += amount
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_labels(self.label_names, values)} {child[0]:g}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *values, amount: float = 1.0):
+        self.labels(*values)[0] -= amount
+
+    def set(self, *values, value: float):
+        self.labels(*values)[0] = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # per bucket; cumulated only when rendering
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, *values, value: float):
+        self.labels(*values).observe(value)
+
+    def time(self, *values) -> _Timer:
+        """`with HISTOGRAM.time("label"):` observes the block's wall time."""
+        return _Timer(self.labels(*values))
+
+    def _render_child(self, values, child):
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += n
+            le = "le=\"+Inf\"" if bound == float("inf") else f'le="{bound:g}"'
+            yield f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.label_names, values)} {child.sum:g}"
+        yield f"{self.name}_count{_labels(self.label_names, values)} {child.count}"
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------
+# 📈 Application metrics
+# --------------------------------------------------------
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("route", "method"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Redis command round-trip time", ("command",))
+REDIS_ERRORS = Counter("redis_command_errors_total", "Redis commands that raised", ("command",))
+
+HASH_LATENCY = Histogram("bcrypt_duration_seconds", "bcrypt time inside the worker", ("op",))
+HASH_QUEUE_WAIT = Histogram("bcrypt_queue_wait_seconds", "Time a bcrypt call waited for a worker", ("op",))
+HASH_REJECTED = Counter("bcrypt_rejected_total", "bcrypt calls refused with 503 (pool saturated)")
+
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection")
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Cursor execute time per statement")
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Statements issued per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+REC_CACHE_LOOKUPS = Counter(
+    "recommendation_cache_lookups_total", "Recommendation cache lookups by weather bucket", ("bucket", "result"),
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency, status and in-flight count."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = route.path if route is not None else "<unmatched>"
+            HTTP_LATENCY.observe(path, scope["method"], value=time.perf_counter() - started)
+            HTTP_REQUESTS.inc(path, scope["method"], str(status))
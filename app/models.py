@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    ForeignKey, String, TIMESTAMP, Float, Integer, BigInteger, Boolean, Text, JSON, PrimaryKeyConstraint, func,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.schema import CreateColumn
+
+from app.database import Base
+
+
+# weather_data and recommendations are partitioned by day on PostgreSQL, so
+# their keys are (id, <partition key>) (sql/migrations/006). SQLite only
+# generates ids for a lone INTEGER PRIMARY KEY, so the local bench schema
+# makes the id column that and keeps the composite key as a UNIQUE.
+@compiles(CreateColumn, "sqlite")
+def _sqlite_rowid_column(element, compiler, **kw):
+    column = element.element
+    if column.info.get("sqlite_rowid"):
+        return f"{compiler.preparer.format_column(column)} INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT"
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_rowid_key(constraint, compiler, **kw):
+    ddl = compiler.visit_primary_key_constraint(constraint, **kw)
+    if any(column.info.get("sqlite_rowid") for column in constraint.columns):
+        return ddl.replace("PRIMARY KEY", "UNIQUE", 1)
+    return ddl
+
+
+class WeatherData(Base):
+    __tablename__ = "weather_data"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, info={"sqlite_rowid": True})
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    city: Mapped[str] = mapped_column(String(100), nullable=True)
+    cell: Mapped[str] = mapped_column(String(12), nullable=True)  # app.geo cell; NULL if unresolved
+    temperature: Mapped[float] = mapped_column(Float, nullable=True)
+    condition: Mapped[str] = mapped_column(String(50), nullable=True)
+    humidity: Mapped[int] = mapped_column(Integer, nullable=True)
+    wind_speed: Mapped[float] = mapped_column(Float, nullable=True)
+    fetched_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True, server_default=func.now())
+
+
+class Outfit(Base):
+    __tablename__ = "outfits"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    name: Mapped[str] = mapped_column(String(100))
+    category: Mapped[str] = mapped_column(String(50), nullable=True)
+    season: Mapped[str] = mapped_column(String(20), nullable=True)
+    # [min °C, max °C]; JSON on SQLite so local benches can create the table
+    temperature_range: Mapped[list] = mapped_column(
+        ARRAY(Integer).with_variant(JSON, "sqlite"), nullable=True
+    )
+    color: Mapped[str] = mapped_column(String(30), nullable=True)
+    image_path: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, server_default=func.now())
+
+
+class Feedback(Base):
+    __tablename__ = "feedback"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    outfit_id: Mapped[int] = mapped_column(ForeignKey("outfits.id", ondelete="CASCADE"))
+    weather_tag: Mapped[str] = mapped_column(String(20), nullable=True)
+    liked: Mapped[bool] = mapped_column(Boolean, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, server_default=func.now())
+
+
+class Recommendation(Base):
+    __tablename__ = "recommendations"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, info={"sqlite_rowid": True})
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    outfit_id: Mapped[int] = mapped_column(ForeignKey("outfits.id", ondelete="CASCADE"))
+    weather_id: Mapped[int] = mapped_column(Integer, nullable=True)  # no FK: weather_data.id alone is not a key
+    score: Mapped[float] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True, server_default=func.now())
+
+
+# Feedback counters, maintained by statement-level triggers on feedback
+# (sql/migrations/004_feedback_counters.sql). weather_tag NULL is stored as ''.
+class FeedbackCountUser(Base):
+    __tablename__ = "feedback_counts_user"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    total: Mapped[int] = mapped_column(BigInteger, default=0)
+    likes: Mapped[int] = mapped_column(BigInteger, default=0)
+    dislikes: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class FeedbackCountOutfit(Base):
+    __tablename__ = "feedback_counts_outfit"
+    outfit_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    weather_tag: Mapped[str] = mapped_column(String(20), primary_key=True)
+    total: Mapped[int] = mapped_column(BigInteger, default=0)
+    likes: Mapped[int] = mapped_column(BigInteger, default=0)
+    dislikes: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+# A view summing feedback_counts_outfit (sql/migrations/007), read-only
+class FeedbackCountTag(Base):
+    __tablename__ = "feedback_counts_tag"
+    weather_tag: Mapped[str] = mapped_column(String(20), primary_key=True)
+    total: Mapped[int] = mapped_column(BigInteger, default=0)
+    likes: Mapped[int] = mapped_column(BigInteger, default=0)
+    dislikes: Mapped[int] = mapped_column(BigInteger, default=0)
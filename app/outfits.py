@@ -0,0 +1,291 @@
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, field_validator
+from redis.exceptions import RedisError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import redis_store
+from app.auth.deps import get_current_user
+from app.auth.user_cache import UserSnapshot
+from app.database import get_db
+from app.models import Outfit
+
+# Per-user in-memory interval indexes; each one is rebuilt when the user's
+# wardrobe version (wv:{user_id} in Redis, bumped on every write) moves.
+OUTFIT_INDEX_SIZE = int(os.getenv("OUTFIT_INDEX_SIZE", "5000"))
+CANDIDATE_SLACK = int(os.getenv("OUTFIT_CANDIDATE_SLACK", "3"))  # °C either side
+UNBOUNDED = (-10**6, 10**6)
+
+
+# --------------------------------------------------------
+# 🌡 Centered interval tree over [lo, hi] temperature ranges
+# --------------------------------------------------------
+class _Node:
+    __slots__ = ("center", "by_lo", "by_hi", "left", "right")
+
+
+def _build(intervals):
+    """intervals: list of (lo, hi, outfit_id). O(n log n), O(n) memory."""
+    if not intervals:
+        return None
+    points = sorted(p for lo, hi, _ in intervals for p in (lo, hi))
+    center = points[len(points) // 2]
+    here, left, right = [], [], []
+    for iv in intervals:
+        if iv[1] < center:
+            left.append(iv)
+        elif iv[0] > center:
+            right.append(iv)
+        else:
+            here.append(iv)
+    node = _Node()
+    node.center = center
+    node.by_lo = sorted(here, key=lambda iv: iv[0])
+    node.by_hi = sorted(here, key=lambda iv: iv[1], reverse=True)
+    node.left = _build(left)
+    node.right = _build(right)
+    return node
+
+
+class TemperatureIndex:
+    """
+    Outfit ids by temperature range. overlapping(lo, hi) is O(log n + k);
+    mutations mark the tree dirty and it is rebuilt on the next query.
+    """
+
+    def __init__(self, ranges=None, version=None):
+        self._ranges = dict(ranges or {})  # outfit_id -> (lo, hi)
+        self._root = None
+        self._dirty = True
+        self.version = version
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, outfit_id):
+        return outfit_id in self._ranges
+
+    def add(self, outfit_id: int, temperature_range):
+        lo, hi = temperature_range or UNBOUNDED
+        self._ranges[outfit_id] = (lo, hi)
+        self._dirty = True
+
+    def remove(self, outfit_id: int):
+        if self._ranges.pop(outfit_id, None) is not None:
+            self._dirty = True
+
+    def overlapping(self, lo: float, hi: float) -> list:
+        if self._dirty:
+            self._root = _build([(l, h, oid) for oid, (l, h) in self._ranges.items()])
+            self._dirty = False
+        found, stack = [], [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if hi < node.center:
+                for iv in node.by_lo:
+                    if iv[0] > hi:
+                        break
+                    found.append(iv[2])
+                stack.append(node.left)
+            elif lo > node.center:
+                for iv in node.by_hi:
+                    if iv[1] < lo:
+                        break
+                    found.append(iv[2])
+                stack.append(node.right)
+            else:
+                found.extend(iv[2] for iv in node.by_lo)
+                stack.append(node.left)
+                stack.append(node.right)
+        return found
+
+    def containing(self, temperature: float) -> list:
+        return self.overlapping(temperature, temperature)
+
+
+# --------------------------------------------------------
+# 🗂 Per-user index registry kept in step with outfit writes
+# --------------------------------------------------------
+_indexes = OrderedDict()  # user_id -> TemperatureIndex
+
+
+async def wardrobe_version(user_id: int) -> int:
+    try:
+        return int(await redis_store.r.get(f"wv:{user_id}") or 0)
+    except RedisError:
+        return -1  # unknown: forces a rebuild
+
+
+async def bump_wardrobe_version(user_id: int) -> int:
+    """Call after committing any change to a user's outfits."""
+    try:
+        return await redis_store.r.incr(f"wv:{user_id}")
+    except RedisError:
+        _indexes.pop(user_id, None)
+        return -1
+
+
+async def get_index(db: AsyncSession, user_id: int) -> TemperatureIndex:
+    version = await wardrobe_version(user_id)
+    index = _indexes.get(user_id)
+    if index is None or index.version != version or version < 0:
+        rows = await db.execute(
+            select(Outfit.id, Outfit.temperature_range).where(Outfit.user_id == user_id)
+        )
+        index = TemperatureIndex(version=version)
+        for outfit_id, temperature_range in rows:
+            index.add(outfit_id, temperature_range)
+        _indexes[user_id] = index
+        if len(_indexes) > OUTFIT_INDEX_SIZE:
+            _indexes.popitem(last=False)
+    _indexes.move_to_end(user_id)
+    return index
+
+
+async def _apply(user_id: int, change):
+    """Update this worker's index in place and move it to the new version."""
+    version = await bump_wardrobe_version(user_id)
+    index = _indexes.get(user_id)
+    if index is None:
+        return
+    if index.version is not None and index.version == version - 1:
+        change(index)
+        index.version = version
+    else:
+        # another worker wrote in between; rebuild from the database next time
+        _indexes.pop(user_id, None)
+
+
+async def candidate_ids(db: AsyncSession, user_id: int, temperature: float, slack: int = CANDIDATE_SLACK,
+                        upto: float = None) -> list:
+    """
+    Outfits whose range is within `slack` °C of `temperature` (or of the span
+    temperature..upto, for forecasts), from the in-memory index.
+    """
+    index = await get_index(db, user_id)
+    return index.overlapping(temperature - slack, (temperature if upto is None else upto) + slack)
+
+
+async def candidate_ids_db(db: AsyncSession, user_id: int, temperature: float, slack: int = CANDIDATE_SLACK) -> list:
+    """Same query answered by Postgres through the GiST index on (user_id, temp_range)."""
+    rows = await db.execute(
+        text("SELECT id FROM outfits WHERE user_id = :uid AND temp_range && int4range(:lo, :hi, '[]')"),
+        {"uid": user_id, "lo": int(temperature - slack), "hi": int(temperature + slack)},
+    )
+    return [r[0] for r in rows]
+
+
+async def candidate_ids_db_many(db: AsyncSession, user_ids, temperature: float, slack: int = CANDIDATE_SLACK) -> dict:
+    """candidate_ids_db for a group of users in one round trip: {user_id: [outfit_id, ...]}."""
+    rows = await db.execute(
+        text("SELECT user_id, id FROM outfits WHERE user_id = ANY(:uids) AND temp_range && int4range(:lo, :hi, '[]')"),
+        {"uids": list(user_ids), "lo": int(temperature - slack), "hi": int(temperature + slack)},
+    )
+    found = {}
+    for uid, oid in rows:
+        found.setdefault(uid, []).append(oid)
+    return found
+
+
+# --------------------------------------------------------
+# 👗 Routes
+# --------------------------------------------------------
+router = APIRouter(prefix="/outfits", tags=["outfits"])
+
+
+class OutfitIn(BaseModel):
+    name: str = Field(max_length=100)
+    category: Optional[str] = None
+    season: Optional[str] = None
+    temperature_range: Optional[list[int]] = Field(default=None, min_length=2, max_length=2)
+    color: Optional[str] = None
+
+    @field_validator("temperature_range")
+    @classmethod
+    def ordered(cls, v):
+        if v is not None and v[0] > v[1]:
+            raise ValueError("temperature_range must be [min, max]")
+        return v
+
+
+def _out(o: Outfit) -> dict:
+    return {
+        "id": o.id, "name": o.name, "category": o.category, "season": o.season,
+        "temperature_range": o.temperature_range, "color": o.color, "image_path": o.image_path,
+        # ?v= changes with the content hash, so clients can cache by URL
+        "image_url": f"/outfits/{o.id}/image?v={os.path.basename(o.image_path)[:12]}" if o.image_path else None,
+    }
+
+
+async def _owned(db: AsyncSession, outfit_id: int, user_id: int) -> Outfit:
+    outfit = await db.get(Outfit, outfit_id)
+    if not outfit or outfit.user_id != user_id:
+        raise HTTPException(404, "Outfit not found")
+    return outfit
+
+
+@router.get("")
+async def list_outfits(user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    rows = await db.execute(select(Outfit).where(Outfit.user_id == user.id).order_by(Outfit.id))
+    return [_out(o) for o in rows.scalars()]
+
+
+@router.post("", status_code=201)
+async def create_outfit(
+    body: OutfitIn,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    outfit = Outfit(user_id=user.id, **body.model_dump())
+    db.add(outfit)
+    await db.commit()
+    await _apply(user.id, lambda ix: ix.add(outfit.id, outfit.temperature_range))
+    return _out(outfit)
+
+
+@router.get("/candidates")
+async def outfit_candidates(
+    temp: float,
+    slack: int = CANDIDATE_SLACK,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    ids = await candidate_ids(db, user.id, temp, slack)
+    if not ids:
+        return []
+    rows = await db.execute(select(Outfit).where(Outfit.id.in_(ids)).order_by(Outfit.id))
+    return [_out(o) for o in rows.scalars()]
+
+
+@router.put("/{outfit_id}")
+async def update_outfit(
+    outfit_id: int,
+    body: OutfitIn,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    outfit = await _owned(db, outfit_id, user.id)
+    for field, value in body.model_dump().items():
+        setattr(outfit, field, value)
+    await db.commit()
+    await _apply(user.id, lambda ix: ix.add(outfit.id, outfit.temperature_range))
+    return _out(outfit)
+
+
+@router.delete("/{outfit_id}")
+async def delete_outfit(
+    outfit_id: int,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    outfit = await _owned(db, outfit_id, user.id)
+    await db.delete(outfit)
+    await db.commit()
+    await _apply(user.id, lambda ix: ix.remove(outfit_id))
+    return {"detail": "Outfit deleted"}
@@ -0,0 +1,188 @@
+"""
+Batch precomputation of daily recommendations.
+
+Active users with a city are paged by id and grouped by weather cell
+(app.geo), so spellings of one city and nearby coordinates share a group.
+Each group gets one weather fetch, one weather_data row and one vectorized
+scoring pass over all its members' wardrobes; the top-k per user are
+bulk-inserted into recommendations (replacing that user's rows from today).
+Scores include the collaborative blend: the job first publishes the votes
+committed since the current NeighbourIndex version (ml.recommender_model
+build_neighbours), which the API workers then share too.
+GET /recommendations/today then reads them with one indexed lookup, as
+long as the user's wardrobe and feedback versions are still the ones the
+batch was scored at (app.recommendation_cache.precomputed_current).
+
+    python -m app.precompute                      # everyone
+    python -m app.precompute --users 4,8,15       # a subset
+    python -m app.precompute --city London --k 10
+
+Schedule it before the morning peak, e.g. cron:
+    30 5 * * *  cd /srv/app && python -m app.precompute
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select
+
+from app import geo, outfits, recommendation_cache, recommender
+from app.auth.models import User
+from app.database import SessionLocal, engine
+from app.ingest import bulk_insert
+from app.models import Recommendation, WeatherData
+from app.recommendations import TOP_K, day_start
+from app.weather import WeatherService, WeatherUnavailable, make_provider
+
+PAGE_USERS = 1000
+GROUP_CONCURRENCY = 8  # cell groups scored at once (each holds a DB connection)
+RECOMMENDATION_COLUMNS = ("user_id", "outfit_id", "weather_id", "score", "created_at")
+
+
+class Progress:
+    def __init__(self, report=print):
+        self.report = report
+        self.started = time.perf_counter()
+        self.users = self.groups = self.written = self.skipped = 0
+
+    def line(self):
+        elapsed = time.perf_counter() - self.started
+        self.report(
+            f"[precompute] {self.users} users, {self.groups} groups, {self.written} rows, "
+            f"{self.skipped} skipped, {self.users / elapsed if elapsed else 0:.0f} users/s"
+        )
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "users": self.users, "groups": self.groups, "rows": self.written,
+            "skipped": self.skipped, "seconds": round(elapsed, 2),
+            "users_per_second": round(self.users / elapsed, 1) if elapsed else None,
+        }
+
+
+async def _store_weather(obs) -> int:
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            insert(WeatherData).values(
+                city=obs.city, cell=obs.cell, temperature=obs.temperature, condition=obs.condition,
+                humidity=obs.humidity, wind_speed=obs.wind_speed,
+                fetched_at=datetime.utcfromtimestamp(obs.fetched_at),
+            ).returning(WeatherData.id)
+        )
+        return result.scalar_one()
+
+
+async def _run_group(location, user_ids, ctx, progress):
+    async with ctx["limit"]:
+        await _score_group(location, user_ids, ctx, progress)
+
+
+async def _score_group(location, user_ids, ctx, progress):
+    try:
+        obs = await ctx["weather"].current(location)
+    except WeatherUnavailable:
+        progress.skipped += len(user_ids)
+        return
+    if location.key not in ctx["weather_ids"]:
+        ctx["weather_ids"][location.key] = await _store_weather(obs)
+    weather_id = ctx["weather_ids"][location.key]
+
+    versions = await recommendation_cache.precomputed_versions(user_ids)  # before reading the wardrobes
+    async with SessionLocal() as db:
+        # the GiST range query is Postgres-only; elsewhere the group loads in full
+        candidates = None
+        if db.bind.dialect.name == "postgresql":
+            candidates = await outfits.candidate_ids_db_many(db, user_ids, obs.temperature)
+        wardrobe = await recommender.load_wardrobes(db, user_ids, candidates, at_least=ctx["k"])
+    vector = recommender.weather_vector(obs.temperature, obs.condition, obs.humidity, obs.wind_speed)
+    scores = recommender.rank(wardrobe, vector, ctx["model"], ctx["neighbours"])
+    top = wardrobe.top_k_per_owner(scores, ctx["k"])
+
+    stamp = ctx["stamp"]
+    records = [
+        (uid, oid, weather_id, float(score), stamp)
+        for uid, items in top.items() for oid, score in items
+    ]
+    async with engine.begin() as conn:
+        # reruns on the same day replace, rather than duplicate, a user's batch
+        await conn.execute(
+            delete(Recommendation).where(
+                Recommendation.user_id.in_(user_ids), Recommendation.created_at >= day_start(stamp)
+            )
+        )
+        await bulk_insert(conn, Recommendation.__table__, RECOMMENDATION_COLUMNS, records)
+    await recommendation_cache.mark_precomputed(versions)
+
+    progress.groups += 1
+    progress.written += len(records)
+
+
+async def run(user_ids=None, city=None, k: int = TOP_K, page: int = PAGE_USERS, report=print) -> dict:
+    from ml.recommender_model import build_neighbours, get_model, get_neighbour_handle
+
+    report(f"[precompute] neighbours {await build_neighbours()}")
+    ctx = {
+        "weather": WeatherService(make_provider()),  # no sink: the job stores its own rows
+        "weather_ids": {},
+        "model": get_model(),
+        "neighbours": get_neighbour_handle().reload(),
+        "k": k,
+        "stamp": datetime.utcnow(),
+        "limit": asyncio.Semaphore(GROUP_CONCURRENCY),
+    }
+    progress = Progress(report)
+    only = geo.resolve(city).key if city else None
+    after = 0
+    while True:
+        query = (
+            select(User.id, User.city)
+            .where(User.is_active.is_(True), User.city.is_not(None), User.id > after)
+            .order_by(User.id)
+            .limit(page)
+        )
+        if user_ids:
+            query = query.where(User.id.in_(user_ids))
+        async with SessionLocal() as db:
+            users = (await db.execute(query)).all()
+        if not users:
+            break
+        after = users[-1].id
+
+        groups = defaultdict(list)
+        locations = {}
+        for uid, user_city in users:
+            location = geo.resolve(user_city)
+            if only is not None and location.key != only:
+                continue
+            locations[location.key] = location
+            groups[location.key].append(uid)
+        await asyncio.gather(*(_run_group(locations[key], ids, ctx, progress) for key, ids in groups.items()))
+        progress.users += sum(len(ids) for ids in groups.values())
+        progress.line()
+
+    return progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", help="comma-separated user ids")
+    parser.add_argument("--city")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--page", type=int, default=PAGE_USERS)
+    args = parser.parse_args()
+    user_ids = [int(u) for u in args.users.split(",")] if args.users else None
+
+    async def go():
+        try:
+            return await run(user_ids, args.city, args.k, args.page)
+        finally:
+            await engine.dispose()
+
+    print(asyncio.run(go()))
+
+
+if __name__ == "__main__":
+    main()
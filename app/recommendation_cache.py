@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+
+from app import metrics
+from app.auth import redis_store
+
+# Live recommendation results keyed by
+#   rec:{user_id}:{wardrobe version}:{feedback version}:{model version}:{neighbours version}:{k}:{bucket}
+# Outfit writes bump wv:{user_id} (app.outfits) and feedback writes bump
+# fbv:{user_id} (bump_feedback_version), so a user's old entries simply stop
+# being addressable on every worker at once; nothing else is touched. A new
+# model or NeighbourIndex version does the same for everyone.
+# Tier 1: per-process LRU. Tier 2: Redis copy shared by all workers.
+# The precompute job records the versions each user's batch was scored at
+# (pre:{user_id}); /recommendations/today only serves that batch while they
+# still match, so an outfit or feedback write falls through to live scoring.
+REC_CACHE_SIZE = int(os.getenv("REC_CACHE_SIZE", "20000"))
+REC_CACHE_TTL = float(os.getenv("REC_CACHE_TTL", "900"))
+REC_CACHE_REDIS = os.getenv("REC_CACHE_REDIS", "1") == "1"
+REC_CACHE_REDIS_TTL = int(os.getenv("REC_CACHE_REDIS_TTL", "3600"))
+REC_CACHE_TEMP_STEP = float(os.getenv("REC_CACHE_TEMP_STEP", "2"))  # °C per bucket
+PRECOMPUTED_TTL = 2 * 86400  # outlives the day its batch is served
+
+_local = OrderedDict()
+_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "bypassed": 0}
+_by_bucket = {}  # bucket -> [local_hits, redis_hits, misses]
+_RESULTS = ("local_hit", "redis_hit", "miss")
+
+
+def bucket(temperature: float, condition: str) -> str:
+    """Quantized weather: REC_CACHE_TEMP_STEP-wide temperature band plus condition."""
+    lo = math.floor(temperature / REC_CACHE_TEMP_STEP) * REC_CACHE_TEMP_STEP
+    return f"{lo:g}..{lo + REC_CACHE_TEMP_STEP:g}|{(condition or '').strip().lower()}"
+
+
+async def _versions(user_id: int):
+    values = await redis_store.r.mget(f"wv:{user_id}", f"fbv:{user_id}")
+    return tuple(int(v or 0) for v in values)
+
+
+def _count(band: str, slot: int):
+    counts = _by_bucket.get(band)
+    if counts is None:
+        counts = _by_bucket[band] = [0, 0, 0]
+    counts[slot] += 1
+    metrics.REC_CACHE_LOOKUPS.inc(band, _RESULTS[slot])
+
+
+async def get(user_id: int, temperature: float, condition: str, model_version, k: int, neighbours_version=None):
+    """
+    Returns (key, items). items is None on a miss; pass the key to put().
+    key is None when the versions cannot be read, i.e. do not cache.
+    """
+    band = bucket(temperature, condition)
+    try:
+        wardrobe_v, feedback_v = await _versions(user_id)
+    except RedisError:
+        _stats["bypassed"] += 1
+        return None, None
+    key = f"rec:{user_id}:{wardrobe_v}:{feedback_v}:{model_version or 0}:{neighbours_version or 0}:{k}:{band}"
+
+    entry = _local.get(key)
+    if entry is not None:
+        if entry[1] > time.monotonic():
+            _local.move_to_end(key)
+            _stats["local_hits"] += 1
+            _count(band, 0)
+            return key, entry[0]
+        del _local[key]
+
+    if REC_CACHE_REDIS:
+        try:
+            raw = await redis_store.r.get(key)
+        except RedisError:
+            raw = None
+        if raw:
+            items = json.loads(raw)
+            _remember(key, items)
+            _stats["redis_hits"] += 1
+            _count(band, 1)
+            return key, items
+
+    _stats["misses"] += 1
+    _count(band, 2)
+    return key, None
+
+
+def _remember(key: str, items: list):
+    _local[key] = (items, time.monotonic() + REC_CACHE_TTL)
+    _local.move_to_end(key)
+    if len(_local) > REC_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+async def put(key: str, items: list):
+    if key is None:
+        return
+    _remember(key, items)
+    if REC_CACHE_REDIS:
+        try:
+            await redis_store.r.setex(key, REC_CACHE_REDIS_TTL, json.dumps(items))
+        except RedisError:
+            pass
+
+
+async def bump_feedback_version(user_ids):
+    """Call after committing feedback; drops those users' cached results everywhere."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    try:
+        async with redis_store.r.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.incr(f"fbv:{user_id}")
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def precomputed_versions(user_ids) -> dict:
+    """{user_id: "wardrobe:feedback" version} now; {} if Redis is unavailable."""
+    user_ids = list(user_ids)
+    try:
+        async with redis_store.r.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.mget(f"wv:{user_id}", f"fbv:{user_id}")
+            values = await pipe.execute()
+    except RedisError:
+        return {}
+    return {uid: ":".join(str(int(v or 0)) for v in pair) for uid, pair in zip(user_ids, values)}
+
+
+async def mark_precomputed(versions: dict):
+    """Record the versions (from precomputed_versions) a user's batch was scored at."""
+    if not versions:
+        return
+    try:
+        async with redis_store.r.pipeline(transaction=False) as pipe:
+            for user_id, version in versions.items():
+                pipe.set(f"pre:{user_id}", version, ex=PRECOMPUTED_TTL)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def precomputed_current(user_id: int) -> bool:
+    """False once the user's wardrobe or feedback moved past their precomputed batch."""
+    try:
+        scored, wardrobe_v, feedback_v = await redis_store.r.mget(
+            f"pre:{user_id}", f"wv:{user_id}", f"fbv:{user_id}"
+        )
+    except RedisError:
+        return True  # versions unknown: the batch is the best there is
+    return scored == f"{int(wardrobe_v or 0)}:{int(feedback_v or 0)}"
+
+
+def stats() -> dict:
+    lookups = _stats["local_hits"] + _stats["redis_hits"] + _stats["misses"]
+    buckets = {}
+    for band, (local, shared, missed) in sorted(_by_bucket.items()):
+        total = local + shared + missed
+        buckets[band] = {"lookups": total, "hit_rate": round((local + shared) / total, 4)}
+    return {
+        **_stats,
+        "size": len(_local),
+        "hit_rate": round((lookups - _stats["misses"]) / lookups, 4) if lookups else None,
+        "temp_step": REC_CACHE_TEMP_STEP,
+        "buckets": buckets,
+    }
@@ -0,0 +1,145 @@
+import os
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import outfits, recommendation_cache
+from app.auth.deps import get_current_user
+from app.auth.user_cache import UserSnapshot
+from app.database import get_db
+from app.models import Outfit, Recommendation
+from app.weather import FORECAST_MAX_HOURS, forecast_hours, get_weather_service, WeatherUnavailable
+
+TOP_K = int(os.getenv("RECOMMEND_TOP_K", "5"))
+DAY_HOURS = int(os.getenv("RECOMMEND_DAY_HOURS", "12"))  # default span of /recommendations/day
+
+
+def day_start(now: datetime = None) -> datetime:
+    """Start of the current UTC day; precomputed rows are stamped in UTC."""
+    return (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def precomputed(db: AsyncSession, user_id: int, k: int = TOP_K) -> list:
+    """Today's batch for one user: a range scan on ix_recommendations_user_created_at."""
+    rows = await db.execute(
+        select(Recommendation.outfit_id, Outfit.name, Recommendation.score, Recommendation.weather_id)
+        .join(Outfit, Outfit.id == Recommendation.outfit_id)
+        .where(Recommendation.user_id == user_id, Recommendation.created_at >= day_start())
+        .order_by(Recommendation.score.desc())
+        .limit(k)
+    )
+    return [
+        {"outfit_id": oid, "name": name, "score": round(score, 4), "weather_id": wid}
+        for oid, name, score, wid in rows
+    ]
+
+
+async def live(db: AsyncSession, user: UserSnapshot, obs, model, k: int = TOP_K, neighbours=None) -> list:
+    """Score the wardrobe now, for users the batch job has not covered yet."""
+    from app import recommender
+
+    # only outfits whose range is near the current temperature, unless that leaves fewer than k
+    ids = await outfits.candidate_ids(db, user.id, obs.temperature)
+    wardrobe = await recommender.load_wardrobe(db, user.id, ids, at_least=k)
+    weather = recommender.weather_vector(obs.temperature, obs.condition, obs.humidity, obs.wind_speed)
+    scores = recommender.rank(wardrobe, weather, model, neighbours)
+    return await _named(db, wardrobe.top_k_per_owner(scores, k).get(user.id, []))
+
+
+async def live_forecast(db: AsyncSession, user: UserSnapshot, forecast, model, k: int = TOP_K,
+                        how: str = None) -> list:
+    """Best outfits across all forecast hours, scored as one (hours x outfits) batch."""
+    from app import recommender
+    from ml.recommender_model import get_neighbours
+
+    temperatures = [o.temperature for o in forecast]
+    ids = await outfits.candidate_ids(db, user.id, min(temperatures), upto=max(temperatures))
+    wardrobe = await recommender.load_wardrobe(db, user.id, ids, at_least=k)
+    scores = recommender.rank_forecast(
+        wardrobe, recommender.weather_matrix(forecast), model, how or recommender.FORECAST_AGGREGATE,
+        neighbours=get_neighbours(),
+    )
+    return await _named(db, wardrobe.top_k_per_owner(scores, k).get(user.id, []))
+
+
+async def _named(db: AsyncSession, top) -> list:
+    if not top:
+        return []
+    names = dict((await db.execute(
+        select(Outfit.id, Outfit.name).where(Outfit.id.in_([oid for oid, _ in top]))
+    )).all())
+    return [{"outfit_id": oid, "name": names.get(oid), "score": round(s, 4), "weather_id": None} for oid, s in top]
+
+
+# --------------------------------------------------------
+# 👔 Routes
+# --------------------------------------------------------
+router = APIRouter(prefix="/recommendations", tags=["recommendations"])
+
+
+@router.get("/today")
+async def todays_recommendations(
+    k: int = TOP_K,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if await recommendation_cache.precomputed_current(user.id):
+        items = await precomputed(db, user.id, k)
+        if items:
+            return {"source": "precomputed", "items": items}
+
+    if not user.city:
+        raise HTTPException(400, "Set your city via PUT /auth/profile first")
+    try:
+        obs = await get_weather_service().current(user.city)
+    except WeatherUnavailable:
+        raise HTTPException(503, "Weather unavailable, try again shortly")
+
+    from ml.recommender_model import get_model, get_neighbours
+    model, neighbours = get_model(), get_neighbours()
+    key, items = await recommendation_cache.get(
+        user.id, obs.temperature, obs.condition, model.version if model else None, k,
+        neighbours.version if neighbours else None,
+    )
+    if items is not None:
+        return {"source": "cache", "items": items}
+    items = await live(db, user, obs, model, k, neighbours)
+    await recommendation_cache.put(key, items)
+    return {"source": "live", "items": items}
+
+
+@router.get("/day")
+async def day_recommendations(
+    hours: int = DAY_HOURS,
+    how: str = None,
+    k: int = TOP_K,
+    user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Outfits that hold up over the next `hours` hours (at most FORECAST_MAX_HOURS)."""
+    from app.recommender import AGGREGATES
+    if how is not None and how not in AGGREGATES:
+        raise HTTPException(400, f"how must be one of {AGGREGATES}")
+    if not user.city:
+        raise HTTPException(400, "Set your city via PUT /auth/profile first")
+    try:
+        forecast = await get_weather_service().forecast(user.city, min(hours, FORECAST_MAX_HOURS))
+    except WeatherUnavailable:
+        raise HTTPException(503, "Weather unavailable, try again shortly")
+    if not forecast:
+        raise HTTPException(503, "Forecast unavailable, try again shortly")
+
+    from ml.recommender_model import get_model
+    items = await live_forecast(db, user, forecast, get_model(), k, how)
+    temperatures = [o.temperature for o in forecast]
+    return {
+        "source": "forecast",
+        "hours": round(forecast_hours(forecast), 2),
+        "steps": len(forecast),
+        "from": datetime.utcfromtimestamp(forecast[0].fetched_at).isoformat(),
+        "min_temperature": min(temperatures),
+        "max_temperature": max(temperatures),
+        "items": items,
+    }
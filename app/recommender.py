@@ -0,0 +1,337 @@
+import os
+
+import numpy as np
+from sqlalchemy import or_, select
+
+from app.feedback import outfit_tag_counts
+from app.models import Outfit
+
+# --------------------------------------------------------
+# 🔢 Encodings (free-text columns -> small ints)
+# --------------------------------------------------------
+SEASONS = ("all", "winter", "spring", "summer", "autumn")
+CATEGORIES = ("top", "bottom", "outerwear", "dress", "shoes", "accessory", "other")
+CONDITIONS = ("clear", "clouds", "rain", "drizzle", "snow", "mist", "other")
+COLORS = ("black", "white", "grey", "blue", "brown", "green", "red", "yellow", "other")
+
+SEASON_ALIASES = {"fall": "autumn", "any": "all", "all-season": "all"}
+CONDITION_ALIASES = {"sunny": "clear", "cloudy": "clouds", "rainy": "rain", "thunderstorm": "rain",
+                     "fog": "mist", "haze": "mist", "snowy": "snow"}
+
+# Weather vector layout: one row per weather (observation or forecast hour)
+TEMP, CONDITION, HUMIDITY, WIND = range(4)
+WEATHER_FEATURES = 4
+
+TEMP_SCALE = float(os.getenv("RECOMMENDER_TEMP_SCALE", "4"))  # °C outside range per e-fold
+WIND_CHILL = 0.3  # °C of apparent cooling per m/s above 2 m/s
+NO_RANGE = (-50, 60)
+# How per-hour scores of a forecast collapse into one per outfit
+FORECAST_AGGREGATE = os.getenv("FORECAST_AGGREGATE", "worst")  # worst | weighted
+AGGREGATES = ("worst", "weighted")
+# How far neighbour approval moves a score: x(1 +/- weight) at unanimous (dis)like
+COLLAB_WEIGHT = float(os.getenv("RECOMMENDER_COLLAB_WEIGHT", "0.3"))
+
+# Season affinity [outfit season, weather season]
+SEASON_AFFINITY = np.array([
+    # all  winter spring summer autumn
+    [1.0, 1.0, 1.0, 1.0, 1.0],   # all
+    [1.0, 1.0, 0.6, 0.2, 0.8],   # winter
+    [1.0, 0.5, 1.0, 0.8, 0.9],   # spring
+    [1.0, 0.2, 0.8, 1.0, 0.6],   # summer
+    [1.0, 0.8, 0.9, 0.5, 1.0],   # autumn
+])
+
+# Condition affinity [category, condition]
+CONDITION_AFFINITY = np.ones((len(CATEGORIES), len(CONDITIONS)))
+CONDITION_AFFINITY[CATEGORIES.index("outerwear"), [CONDITIONS.index(c) for c in ("rain", "drizzle", "snow")]] = 1.3
+CONDITION_AFFINITY[CATEGORIES.index("dress"), [CONDITIONS.index(c) for c in ("rain", "snow")]] = 0.7
+CONDITION_AFFINITY[CATEGORIES.index("shoes"), CONDITIONS.index("snow")] = 1.2
+
+
+def _code(value, names, aliases=None, default="other"):
+    value = (value or "").strip().lower()
+    if aliases:
+        value = aliases.get(value, value)
+    return names.index(value) if value in names else names.index(default)
+
+
+def season_code(value) -> int:
+    return _code(value, SEASONS, SEASON_ALIASES, default="all")
+
+def category_code(value) -> int:
+    return _code(value, CATEGORIES)
+
+def condition_code(value) -> int:
+    return _code(value, CONDITIONS, CONDITION_ALIASES)
+
+def color_code(value) -> int:
+    return _code(value, COLORS)
+
+
+# Outfit "kind" shared across users: the item axis of the collaborative index
+ARCHETYPES = len(CATEGORIES) * len(SEASONS) * len(COLORS)
+
+
+def archetype_code(category, season, color):
+    """Works on ints or arrays of codes."""
+    return (np.asarray(category) * len(SEASONS) + season) * len(COLORS) + color
+
+
+def weather_vector(temperature, condition, humidity=50, wind_speed=0.0) -> np.ndarray:
+    return np.array([temperature, condition_code(condition), humidity or 0, wind_speed or 0.0], dtype=np.float64)
+
+
+def weather_matrix(observations) -> np.ndarray:
+    """Stack observations (anything with temperature/condition/humidity/wind_speed) into (m, 4)."""
+    return np.array(
+        [[o.temperature, condition_code(o.condition), o.humidity or 0, o.wind_speed or 0.0] for o in observations],
+        dtype=np.float64,
+    ).reshape(-1, WEATHER_FEATURES)
+
+
+def weather_season(temperature: np.ndarray) -> np.ndarray:
+    """Season implied by apparent temperature: <6 winter, <14 autumn, <20 spring, else summer."""
+    return np.select(
+        [temperature < 6, temperature < 14, temperature < 20],
+        [SEASONS.index("winter"), SEASONS.index("autumn"), SEASONS.index("spring")],
+        SEASONS.index("summer"),
+    )
+
+
+# --------------------------------------------------------
+# 👕 Columnar wardrobe + vectorized scoring
+# --------------------------------------------------------
+class Wardrobe:
+    """
+    One or more users' outfits as parallel NumPy columns. `owner` holds the
+    user id per row so several wardrobes can be scored in a single pass.
+    `likes`/`votes` are (n, len(CONDITIONS)) feedback counts per weather tag.
+    """
+    __slots__ = ("outfit_ids", "owner", "lo", "hi", "season", "category", "color", "likes", "votes", "_weight")
+
+    def __init__(self, outfit_ids, owner, lo, hi, season, category, color, likes=None, votes=None):
+        n = len(outfit_ids)
+        self.outfit_ids = np.asarray(outfit_ids, dtype=np.int64)
+        self.owner = np.asarray(owner, dtype=np.int64)
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+        self.season = np.asarray(season, dtype=np.intp)
+        self.category = np.asarray(category, dtype=np.intp)
+        self.color = np.asarray(color, dtype=np.intp)
+        shape = (n, len(CONDITIONS))
+        self.likes = np.zeros(shape) if likes is None else np.asarray(likes, dtype=np.float64)
+        self.votes = np.zeros(shape) if votes is None else np.asarray(votes, dtype=np.float64)
+        self._weight = None
+
+    def __len__(self):
+        return len(self.outfit_ids)
+
+    @property
+    def archetype(self) -> np.ndarray:
+        return archetype_code(self.category, self.season, self.color)
+
+    @classmethod
+    def from_rows(cls, outfits, feedback=()):
+        """
+        Build from Outfit-like rows and (outfit_id, weather_tag, liked, count)
+        tuples. Unknown outfit ids in `feedback` are ignored.
+        """
+        outfits = list(outfits)
+        ranges = [o.temperature_range or NO_RANGE for o in outfits]
+        wardrobe = cls(
+            outfit_ids=[o.id for o in outfits],
+            owner=[o.user_id for o in outfits],
+            lo=[r[0] for r in ranges],
+            hi=[r[1] for r in ranges],
+            season=[season_code(o.season) for o in outfits],
+            category=[category_code(o.category) for o in outfits],
+            color=[color_code(o.color) for o in outfits],
+        )
+        row = {oid: i for i, oid in enumerate(wardrobe.outfit_ids.tolist())}
+        for outfit_id, tag, liked, count in feedback:
+            i = row.get(outfit_id)
+            if i is None or liked is None:
+                continue
+            c = condition_code(tag)
+            wardrobe.votes[i, c] += count
+            if liked:
+                wardrobe.likes[i, c] += count
+        return wardrobe
+
+    @classmethod
+    def concat(cls, wardrobes):
+        wardrobes = [w for w in wardrobes if len(w)]
+        if not wardrobes:
+            return cls.from_rows([])
+        return cls(*(np.concatenate([getattr(w, f) for w in wardrobes]) for f in cls.__slots__[:-1]))
+
+    @property
+    def weight(self) -> np.ndarray:
+        """
+        (n, len(CONDITIONS)) feedback multiplier in [0.5, 1.5]: a smoothed
+        like-rate for the tag, borrowing a quarter weight from the outfit's
+        overall votes so sparse tags fall back to the overall opinion.
+        """
+        if self._weight is None:
+            likes = self.likes + 0.25 * self.likes.sum(axis=1, keepdims=True)
+            votes = self.votes + 0.25 * self.votes.sum(axis=1, keepdims=True)
+            self._weight = 0.5 + (likes + 1) / (votes + 2)
+        return self._weight
+
+    def score_batch(self, weathers: np.ndarray) -> np.ndarray:
+        """Score every outfit against every weather row: (m, 4) -> (m, n)."""
+        weathers = np.atleast_2d(np.asarray(weathers, dtype=np.float64))
+        apparent = weathers[:, TEMP] - WIND_CHILL * np.maximum(weathers[:, WIND] - 2, 0)
+        cond = weathers[:, CONDITION].astype(np.intp)
+        t = apparent[:, None]
+
+        distance = np.maximum(self.lo - t, 0) + np.maximum(t - self.hi, 0)
+        scores = np.exp(-distance / TEMP_SCALE)
+        scores *= SEASON_AFFINITY[self.season[None, :], weather_season(apparent)[:, None]]
+        scores *= CONDITION_AFFINITY[self.category[None, :], cond[:, None]]
+        scores *= self.weight.T[cond]
+        return scores
+
+    def score(self, weather: np.ndarray) -> np.ndarray:
+        return self.score_batch(weather)[0]
+
+    def top_k_batch(self, weathers: np.ndarray, k: int = 5):
+        """Best k outfits per weather row: (ids (m, k), scores (m, k)), best first."""
+        scores = self.score_batch(weathers)
+        k = min(k, scores.shape[1])
+        if k == 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-part, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        return self.outfit_ids[idx], np.take_along_axis(part, order, axis=1)
+
+    def top_k(self, weather: np.ndarray, k: int = 5):
+        """[(outfit_id, score), ...] best first, for a single weather vector."""
+        ids, scores = self.top_k_batch(weather, k)
+        return list(zip(ids[0].tolist(), scores[0].tolist()))
+
+    def top_k_per_owner(self, scores: np.ndarray, k: int = 5) -> dict:
+        """
+        Split one row of scores (n,) from a concatenated wardrobe back into
+        {user_id: [(outfit_id, score), ...]}, best first.
+        """
+        order = np.lexsort((-scores, self.owner))
+        owners = self.owner[order]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        result = {}
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            rows = order[s:min(e, s + k)]
+            result[int(owners[s])] = list(zip(self.outfit_ids[rows].tolist(), scores[rows].tolist()))
+        return result
+
+
+def collaborative(wardrobe: Wardrobe, conditions, neighbours) -> np.ndarray:
+    """
+    (m, n) multiplier per condition row and outfit: 1 + COLLAB_WEIGHT x the
+    approval that the owner's neighbours (ml.recommender_model.NeighbourIndex)
+    gave this kind of outfit under that condition. 1 without neighbours.
+    """
+    conditions = np.asarray(conditions, dtype=np.intp)
+    weight = np.ones((len(conditions), len(wardrobe)))
+    if neighbours is None or not len(wardrobe) or COLLAB_WEIGHT == 0:
+        return weight
+    items = wardrobe.archetype
+    for owner in np.unique(wardrobe.owner).tolist():
+        cols = np.flatnonzero(wardrobe.owner == owner)
+        for c in np.unique(conditions).tolist():
+            approval = neighbours.predict(owner, c)
+            if approval is not None:
+                weight[np.ix_(conditions == c, cols)] = 1 + COLLAB_WEIGHT * approval[items[cols]]
+    return weight
+
+
+def rank(wardrobe: Wardrobe, weather: np.ndarray, model=None, neighbours=None) -> np.ndarray:
+    """
+    Final per-outfit score for one weather vector: the rule-based score,
+    scaled by the learned like-probability when a model is published and
+    by what similar users thought of such outfits in this weather.
+    """
+    scores = wardrobe.score(weather)
+    if model is not None and len(wardrobe):
+        scores *= 0.5 + model.score_wardrobe(wardrobe, weather)
+    if neighbours is not None:
+        scores *= collaborative(wardrobe, [int(weather[CONDITION])], neighbours)[0]
+    return scores
+
+
+def aggregate_hours(scores: np.ndarray, how: str = FORECAST_AGGREGATE, weights=None) -> np.ndarray:
+    """
+    Collapse (hours, n) scores into (n,). "worst" keeps each outfit's lowest
+    hour (it must work all day); "weighted" is the mean under `weights`
+    (one per hour, default uniform), so a bad hour costs in proportion.
+    """
+    if how == "worst":
+        return scores.min(axis=0)
+    if how == "weighted":
+        weights = np.ones(len(scores)) if weights is None else np.asarray(weights, dtype=np.float64)
+        return weights @ scores / weights.sum()
+    raise ValueError(f"Unknown forecast aggregate: {how}")
+
+
+def rank_forecast(wardrobe: Wardrobe, weathers: np.ndarray, model=None, how: str = FORECAST_AGGREGATE,
+                  weights=None, neighbours=None) -> np.ndarray:
+    """
+    rank() over a whole forecast: every outfit against every hour of a
+    (hours, 4) matrix in one batched pass, then aggregate_hours().
+    """
+    weathers = np.atleast_2d(np.asarray(weathers, dtype=np.float64))
+    scores = wardrobe.score_batch(weathers)
+    if model is not None and len(wardrobe):
+        scores *= 0.5 + model.score_wardrobe_batch(wardrobe, weathers)
+    if neighbours is not None:
+        scores *= collaborative(wardrobe, weathers[:, CONDITION], neighbours)
+    return aggregate_hours(scores, how, weights)
+
+
+# --------------------------------------------------------
+# 🗄 Loading from the database
+# --------------------------------------------------------
+async def load_wardrobes(db, user_ids, candidates=None, at_least: int = 1) -> Wardrobe:
+    """
+    Outfits of `user_ids` with their owners' per-tag feedback counts.
+    `candidates` ({user_id: outfit ids}, from app.outfits) narrows a user to
+    those outfits; users missing from it, or with fewer than `at_least`
+    candidates, load their whole wardrobe.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return Wardrobe.from_rows([])
+    candidates = {uid: ids for uid, ids in (candidates or {}).items() if len(ids) >= at_least}
+    whole = [uid for uid in user_ids if uid not in candidates]
+    picked = [oid for uid in user_ids for oid in candidates.get(uid, ())]
+    wanted = []
+    if whole:
+        wanted.append(Outfit.user_id.in_(whole))
+    if picked:
+        wanted.append(Outfit.id.in_(picked))
+    outfits = (await db.execute(select(Outfit).where(or_(*wanted)))).scalars().all()
+    return Wardrobe.from_rows(outfits, await outfit_tag_counts(db, user_ids))
+
+
+async def load_wardrobe(db, user_id: int, ids=None, at_least: int = 1) -> Wardrobe:
+    return await load_wardrobes(db, [user_id], None if ids is None else {user_id: ids}, at_least)
+
+
+def vote_arrays(rows):
+    """
+    (user_ids, tags, items, values) for NeighbourIndex.fit/add from
+    (user_id, category, season, color, weather_tag, liked, count) rows
+    (ml.dataset_preparation.read_votes).
+    """
+    rows = [r for r in rows if r[5] is not None]
+    return (
+        np.array([r[0] for r in rows], dtype=np.int64),
+        np.array([condition_code(r[4]) for r in rows], dtype=np.intp),
+        np.array([archetype_code(category_code(r[1]), season_code(r[2]), color_code(r[3])) for r in rows],
+                 dtype=np.int64),
+        np.array([r[6] if r[5] else -r[6] for r in rows], dtype=np.float32),
+    )
@@ -0,0 +1,350 @@
+"""
+Tiered retention for weather_data and recommendations (PostgreSQL).
+
+Both tables are range-partitioned by UTC day (<table>_pYYYYMMDD, plus a
+<table>_default catch-all; sql/migrations/006_time_partitions.sql). Each run:
+
+    1. creates the partitions for the next RETENTION_PARTITIONS_AHEAD days,
+       and one for every day that has rows in <table>_default (after an
+       outage longer than that, or backdated inserts), moving those rows
+       in so they expire like any other day
+    2. copies rows left in the pre-partitioning *_legacy tables across in
+       RETENTION_BACKFILL_CHUNK id ranges, then drops those tables
+    3. rolls every weather_data day older than RETENTION_RAW_DAYS up into
+       weather_hourly and weather_daily (per location: the cell, or the
+       city when unresolved) and drops the day, in one transaction
+    4. drops recommendations days older than RETENTION_RECOMMENDATION_DAYS
+    5. deletes weather_hourly rows older than RETENTION_HOURLY_DAYS;
+       weather_daily is kept
+
+Every chunk and every partition commits on its own and the backfill
+watermark lives in maintenance_state, so a run that is interrupted or
+killed resumes where it stopped. Dropping a partition only touches the
+catalog. There is no bulk DELETE, so nothing is left for VACUUM.
+Feedback rows whose recommendation's weather has been rolled up become
+weatherless training rows (has_weather = 0) in ml.dataset_preparation.
+
+    python -m app.retention --dry-run    # what would go, and the space it frees
+    python -m app.retention
+
+Schedule it nightly, e.g. cron:
+    15 3 * * *  cd /srv/app && python -m app.retention
+"""
+import argparse
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.database import engine
+
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "14"))
+RETENTION_HOURLY_DAYS = int(os.getenv("RETENTION_HOURLY_DAYS", "180"))
+RETENTION_RECOMMENDATION_DAYS = int(os.getenv("RETENTION_RECOMMENDATION_DAYS", "30"))
+RETENTION_PARTITIONS_AHEAD = int(os.getenv("RETENTION_PARTITIONS_AHEAD", "7"))
+RETENTION_BACKFILL_CHUNK = int(os.getenv("RETENTION_BACKFILL_CHUNK", "50000"))
+# DROP needs a short exclusive lock on the parent; give up (and retry next
+# run) rather than queue behind a long query and stall every insert
+RETENTION_LOCK_TIMEOUT = os.getenv("RETENTION_LOCK_TIMEOUT", "5s")
+ADVISORY_LOCK = 0x7265746E  # one runner at a time across hosts
+LOCK_NOT_AVAILABLE = "55P03"  # SQLSTATE of a lock_timeout
+
+# partitioned table -> (partition key, columns copied from the legacy table)
+TABLES = {
+    "weather_data": ("fetched_at", (
+        "id", "user_id", "city", "cell", "temperature", "condition", "humidity", "wind_speed", "fetched_at",
+    )),
+    "recommendations": ("created_at", ("id", "user_id", "outfit_id", "weather_id", "score", "created_at")),
+}
+
+_ROLLUP = """
+INSERT INTO {target} AS r (location, {bucket}, city, samples, temp_min, temp_max, temp_avg,
+                           humidity_avg, wind_avg, condition)
+SELECT COALESCE(cell, city), {expr}, max(city), count(*), min(temperature), max(temperature),
+       avg(temperature), avg(humidity), avg(wind_speed), mode() WITHIN GROUP (ORDER BY condition)
+FROM "{partition}"
+WHERE COALESCE(cell, city) IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (location, {bucket}) DO UPDATE SET
+    samples = r.samples + EXCLUDED.samples,
+    temp_min = LEAST(r.temp_min, EXCLUDED.temp_min),
+    temp_max = GREATEST(r.temp_max, EXCLUDED.temp_max),
+    temp_avg = (r.temp_avg * r.samples + EXCLUDED.temp_avg * EXCLUDED.samples) / (r.samples + EXCLUDED.samples),
+    humidity_avg = (r.humidity_avg * r.samples + EXCLUDED.humidity_avg * EXCLUDED.samples) / (r.samples + EXCLUDED.samples),
+    wind_avg = (r.wind_avg * r.samples + EXCLUDED.wind_avg * EXCLUDED.samples) / (r.samples + EXCLUDED.samples)
+"""
+ROLLUPS = (
+    ("weather_hourly", "hour", "date_trunc('hour', fetched_at)"),
+    ("weather_daily", "day", "fetched_at::date"),
+)
+
+
+class Report:
+    def __init__(self, dry_run: bool, report=print):
+        self.dry_run = dry_run
+        self.report = report
+        self.started = time.perf_counter()
+        self.created = self.backfilled = self.rolled_rows = self.hourly_deleted = 0
+        self.dropped = []  # (partition, bytes, rows)
+        self.skipped = []  # partitions left for the next run (lock timeout)
+
+    def line(self, message):
+        self.report(f"[retention{' dry-run' if self.dry_run else ''}] {message}")
+
+    def summary(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            "partitions_created": self.created,
+            "legacy_rows_copied": self.backfilled,
+            "partitions_dropped": len(self.dropped),
+            "rows_dropped": sum(rows for _, _, rows in self.dropped),
+            "bytes_reclaimed": sum(size for _, size, _ in self.dropped),
+            "rollup_rows": self.rolled_rows,
+            "hourly_rows_deleted": self.hourly_deleted,
+            "skipped": self.skipped,
+            "seconds": round(time.perf_counter() - self.started, 2),
+        }
+
+
+@asynccontextmanager
+async def _transaction():
+    """engine.begin() without the API's statement_timeout: rollups and copies scan whole days."""
+    async with engine.begin() as conn:
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        yield conn
+
+
+def _day(partition: str) -> date:
+    return datetime.strptime(partition.rsplit("_p", 1)[1], "%Y%m%d").date()
+
+
+def _lock_timeout(exc: DBAPIError) -> bool:
+    return getattr(exc.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE
+
+
+async def _partitions(conn, parent: str) -> list:
+    """[(name, total bytes, estimated rows)] of the day partitions, oldest first."""
+    rows = await conn.execute(text(r"""
+        SELECT c.relname, pg_total_relation_size(c.oid), GREATEST(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = CAST(:parent AS regclass) AND c.relname ~ '_p\d{8}$'
+        ORDER BY c.relname
+    """), {"parent": parent})
+    return rows.all()
+
+
+# --------------------------------------------------------
+# 1. Partitions ahead
+# --------------------------------------------------------
+async def ensure_partitions(report: Report, today: date):
+    days = [today + timedelta(days=d) for d in range(-1, RETENTION_PARTITIONS_AHEAD + 1)]
+    async with _transaction() as conn:
+        for parent in TABLES:
+            existing = {name for name, _, _ in await _partitions(conn, parent)}
+            missing = [d for d in days if f"{parent}_p{d:%Y%m%d}" not in existing]
+            if missing and not report.dry_run:
+                for d in missing:
+                    await conn.execute(text("SELECT ensure_day_partition(CAST(:parent AS regclass), :day)"),
+                                       {"parent": parent, "day": d})
+            report.created += len(missing)
+            if missing:
+                report.line(f"{parent}: {len(missing)} partitions to create up to {missing[-1]}")
+
+
+async def adopt_default(report: Report):
+    """Give every day with rows in <parent>_default its own partition (one transaction per day)."""
+    for parent, (key, _) in TABLES.items():
+        async with _transaction() as conn:
+            days = (await conn.execute(text(
+                f'SELECT {key}::date AS day, count(*) FROM "{parent}_default" WHERE {key} IS NOT NULL '
+                f"GROUP BY 1 ORDER BY 1"
+            ))).all()
+        for day, rows in days:
+            if not report.dry_run:
+                async with _transaction() as conn:
+                    await conn.execute(text("SELECT ensure_day_partition(CAST(:parent AS regclass), :day)"),
+                                       {"parent": parent, "day": day})
+            report.created += 1
+            report.line(f"{parent}_default: {rows} rows of {day} moved to their own partition")
+
+
+# --------------------------------------------------------
+# 2. Legacy backfill (resumable by id watermark)
+# --------------------------------------------------------
+async def backfill_legacy(report: Report, today: date):
+    for parent, (key, columns) in TABLES.items():
+        legacy = f"{parent}_legacy"
+        state = f"backfill:{parent}"
+        async with _transaction() as conn:
+            if (await conn.execute(text("SELECT to_regclass(:t)"), {"t": legacy})).scalar() is None:
+                continue
+            after = (await conn.execute(
+                text("SELECT value FROM maintenance_state WHERE key = :k"), {"k": state}
+            )).scalar() or 0
+            last_id, first_day, size = (await conn.execute(text(
+                f'SELECT max(id), min({key})::date, pg_total_relation_size(CAST(:t AS regclass)) FROM "{legacy}"'
+            ), {"t": legacy})).one()
+            remaining = (await conn.execute(
+                text(f'SELECT count(*) FROM "{legacy}" WHERE id > :after'), {"after": after}
+            )).scalar()
+        report.line(f"{legacy}: {remaining} rows to copy from id {after}, then drop ({size} bytes)")
+        if report.dry_run:
+            continue
+
+        if first_day is not None:
+            # partitions for the whole legacy range, so rows don't pile up in _default
+            async with _transaction() as conn:
+                await conn.execute(text(
+                    "SELECT ensure_day_partition(CAST(:parent AS regclass), d::date) "
+                    "FROM generate_series(CAST(:first AS date), CAST(:today AS date), interval '1 day') d"
+                ), {"parent": parent, "first": first_day, "today": today})
+
+        cols = ", ".join(columns)
+        while last_id is not None and after < last_id:
+            upto = after + RETENTION_BACKFILL_CHUNK
+            async with _transaction() as conn:
+                result = await conn.execute(text(
+                    f'INSERT INTO "{parent}" ({cols}) SELECT {cols} FROM "{legacy}" '
+                    f"WHERE id > :after AND id <= :upto AND {key} IS NOT NULL "
+                    "ON CONFLICT DO NOTHING"
+                ), {"after": after, "upto": upto})
+                await conn.execute(text(
+                    "INSERT INTO maintenance_state (key, value) VALUES (:k, :v) "
+                    "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()"
+                ), {"k": state, "v": upto})
+            report.backfilled += result.rowcount
+            after = upto
+            report.line(f"{legacy}: copied through id {min(upto, last_id)} of {last_id}")
+
+        async with _transaction() as conn:
+            await conn.execute(text(f'DROP TABLE "{legacy}"'))
+            await conn.execute(text("DELETE FROM maintenance_state WHERE key = :k"), {"k": state})
+        report.line(f"{legacy}: dropped")
+
+
+# --------------------------------------------------------
+# 3 + 4. Roll up and drop expired days
+# --------------------------------------------------------
+async def _drop(conn, partition: str):
+    await conn.execute(text(f"SET LOCAL lock_timeout = '{RETENTION_LOCK_TIMEOUT}'"))
+    await conn.execute(text(f'DROP TABLE "{partition}"'))
+
+
+async def expire_weather(report: Report, today: date):
+    cutoff = today - timedelta(days=RETENTION_RAW_DAYS)
+    async with _transaction() as conn:
+        expired = [p for p in await _partitions(conn, "weather_data") if _day(p[0]) < cutoff]
+    for partition, size, rows in expired:
+        if report.dry_run:
+            async with _transaction() as conn:
+                hours, days = (await conn.execute(text(
+                    f"SELECT count(DISTINCT (COALESCE(cell, city), date_trunc('hour', fetched_at))), "
+                    f"count(DISTINCT COALESCE(cell, city)) FROM \"{partition}\""
+                ))).one()
+            report.rolled_rows += hours + days
+            report.dropped.append((partition, size, rows))
+            report.line(f"{partition}: ~{rows} rows -> {hours} hourly + {days} daily rollups, frees {size} bytes")
+            continue
+        try:
+            async with _transaction() as conn:
+                for target, bucket, expr in ROLLUPS:
+                    result = await conn.execute(text(
+                        _ROLLUP.format(target=target, bucket=bucket, expr=expr, partition=partition)
+                    ))
+                    report.rolled_rows += result.rowcount
+                await _drop(conn, partition)
+        except DBAPIError as exc:
+            if not _lock_timeout(exc):
+                raise
+            report.skipped.append(partition)  # the rollup rolled back with the DROP
+            report.line(f"{partition}: skipped (lock timeout), retried next run")
+            continue
+        report.dropped.append((partition, size, rows))
+        report.line(f"{partition}: rolled up and dropped, {size} bytes freed")
+
+
+async def expire_recommendations(report: Report, today: date):
+    cutoff = today - timedelta(days=RETENTION_RECOMMENDATION_DAYS)
+    async with _transaction() as conn:
+        expired = [p for p in await _partitions(conn, "recommendations") if _day(p[0]) < cutoff]
+    for partition, size, rows in expired:
+        if not report.dry_run:
+            try:
+                async with _transaction() as conn:
+                    await _drop(conn, partition)
+            except DBAPIError as exc:
+                if not _lock_timeout(exc):
+                    raise
+                report.skipped.append(partition)
+                report.line(f"{partition}: skipped (lock timeout), retried next run")
+                continue
+        report.dropped.append((partition, size, rows))
+        report.line(f"{partition}: ~{rows} rows dropped, {size} bytes freed")
+
+
+# --------------------------------------------------------
+# 5. Hourly rollup retention (small table: a plain DELETE)
+# --------------------------------------------------------
+async def expire_hourly(report: Report, today: date):
+    cutoff = datetime.combine(today - timedelta(days=RETENTION_HOURLY_DAYS), datetime.min.time())
+    async with _transaction() as conn:
+        if report.dry_run:
+            report.hourly_deleted = (await conn.execute(
+                text("SELECT count(*) FROM weather_hourly WHERE hour < :cutoff"), {"cutoff": cutoff}
+            )).scalar()
+        else:
+            result = await conn.execute(text("DELETE FROM weather_hourly WHERE hour < :cutoff"), {"cutoff": cutoff})
+            report.hourly_deleted = result.rowcount
+    if report.hourly_deleted:
+        report.line(f"weather_hourly: {report.hourly_deleted} rows before {cutoff:%Y-%m-%d}")
+
+
+async def run(dry_run: bool = False, report=print) -> dict:
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("app.retention needs PostgreSQL (range partitions)")
+    progress = Report(dry_run, report)
+    today = datetime.utcnow().date()
+    async with engine.connect() as lock:
+        # session-level lock on an autocommit connection: not an open transaction for the whole run
+        lock = await lock.execution_options(isolation_level="AUTOCOMMIT")
+        if not (await lock.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK})).scalar():
+            progress.line("another run holds the lock; nothing to do")
+            return progress.summary()
+        try:
+            await ensure_partitions(progress, today)
+            await adopt_default(progress)
+            await backfill_legacy(progress, today)
+            await expire_weather(progress, today)
+            await expire_recommendations(progress, today)
+            await expire_hourly(progress, today)
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK})
+    summary = progress.summary()
+    progress.line(
+        f"{summary['partitions_dropped']} partitions ({summary['rows_dropped']} rows, "
+        f"{summary['bytes_reclaimed'] / 2**20:.1f} MiB) {'would be ' if dry_run else ''}dropped, "
+        f"{summary['rollup_rows']} rollup rows"
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition upkeep, rollups and retention")
+    parser.add_argument("--dry-run", action="store_true", help="report only; change nothing")
+    args = parser.parse_args()
+
+    async def _main():
+        try:
+            return await run(args.dry_run)
+        finally:
+            await engine.dispose()
+
+    print(asyncio.run(_main()))
+
+
+if __name__ == "__main__":
+    main()
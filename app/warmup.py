@@ -0,0 +1,53 @@
+"""
+Lazy loading of the ML stack (numpy, app.recommender, ml.recommender_model
+and the published model artifacts).
+
+Nothing ML-related is imported when app.main loads; recommendation code
+imports it on first use. ML_PRELOAD moves that cost earlier:
+
+    lazy        default: first recommendation request pays it
+    background  each worker warms up in a thread right after startup
+    master      app.main warms up at import time; with
+                `gunicorn app.main:app -k uvicorn.workers.UvicornWorker --preload`
+                that happens once in the master and the forked workers
+                share the pages copy-on-write
+
+Auth-only deployments keep lazy and never load any of it.
+"""
+import os
+import sys
+import time
+
+ML_PRELOAD = os.getenv("ML_PRELOAD", "lazy")  # lazy | background | master
+
+_state = {"warmed_at": None, "seconds": None, "error": None}
+
+
+def warm_up() -> dict:
+    """Import the ML modules and load the current model. Idempotent, never raises."""
+    if _state["warmed_at"] is not None:
+        return _state
+    started = time.perf_counter()
+    try:
+        import app.recommender  # noqa: F401
+        from ml import recommender_model
+
+        recommender_model.get_handle().reload()
+        recommender_model.get_neighbour_handle().reload()
+    except Exception as exc:  # a broken artifact must not stop the API from serving
+        _state["error"] = repr(exc)
+    _state["seconds"] = round(time.perf_counter() - started, 3)
+    _state["warmed_at"] = time.time()
+    return _state
+
+
+def diagnostics() -> dict:
+    """Model diagnostics once loaded; never triggers the import itself."""
+    model = sys.modules.get("ml.recommender_model")
+    return {
+        "preload": ML_PRELOAD,
+        "loaded": model is not None,
+        "warm_up": dict(_state),
+        **(model.get_handle().diagnostics() if model is not None else {}),
+        "neighbours": model.get_neighbour_handle().diagnostics() if model is not None else None,
+    }
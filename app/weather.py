@@ -0,0 +1,571 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+import httpx
+from fastapi import APIRouter, HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import geo
+from app.auth import redis_store
+from app.database import engine
+from app.ingest import BatchWriter, bulk_insert
+from app.models import WeatherData
+
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "fake")  # "openweathermap" or "fake"
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5")
+
+# Observations are coalesced per (location, time bucket) and served fresh for
+# WEATHER_FRESH_TTL seconds, then served stale (while one background refresh
+# runs) until WEATHER_STALE_TTL.
+WEATHER_BUCKET_SECONDS = int(os.getenv("WEATHER_BUCKET_SECONDS", "600"))
+WEATHER_FRESH_TTL = int(os.getenv("WEATHER_FRESH_TTL", "600"))
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", "3600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "5000"))
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "3"))
+WEATHER_MAX_CONNECTIONS = int(os.getenv("WEATHER_MAX_CONNECTIONS", "50"))
+BREAKER_FAILURES = int(os.getenv("WEATHER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("WEATHER_BREAKER_RESET", "30"))
+# Every upstream fetch is recorded in weather_data through a write-behind batch
+WEATHER_PERSIST = os.getenv("WEATHER_PERSIST", "1") == "1"
+WEATHER_WRITE_BATCH = int(os.getenv("WEATHER_WRITE_BATCH", "500"))
+WEATHER_WRITE_DELAY = float(os.getenv("WEATHER_WRITE_DELAY", "1.0"))
+# When upstream fails and nothing is cached, the newest weather_data row for
+# the location stands in if it is younger than this
+WEATHER_STORED_TTL = int(os.getenv("WEATHER_STORED_TTL", "10800"))
+# Forecasts: fetched FORECAST_MAX_HOURS ahead per location, cached for
+# FORECAST_TTL seconds and sliced by time per request; never persisted.
+# Steps are whatever the provider gives (1 h fake, 3 h OpenWeatherMap).
+FORECAST_MAX_HOURS = int(os.getenv("FORECAST_MAX_HOURS", "24"))
+FORECAST_TTL = int(os.getenv("FORECAST_TTL", "1800"))
+
+
+class WeatherUnavailable(Exception):
+    """No fresh or stale observation could be produced for a location."""
+
+
+@dataclass(slots=True)
+class Observation:
+    city: str  # display name (app.geo.Location.name)
+    temperature: float
+    condition: str
+    humidity: int
+    wind_speed: float
+    fetched_at: float  # unix seconds; for forecast steps, the time the step starts
+    cell: str | None = None  # geohash cell; None for names the gazetteer does not know
+
+
+def _resolve(location) -> geo.Location:
+    return geo.resolve(location) if isinstance(location, str) else location
+
+
+# --------------------------------------------------------
+# 🌦 Providers
+# --------------------------------------------------------
+class WeatherProvider:
+    """
+    Upstream source of observations. Subclasses implement current() and
+    forecast() for an app.geo.Location: the cell centre when resolved,
+    otherwise the name.
+    """
+    name = "base"
+    timeout = WEATHER_TIMEOUT
+
+    async def current(self, client: httpx.AsyncClient, location: geo.Location) -> Observation:
+        raise NotImplementedError
+
+    async def forecast(self, client: httpx.AsyncClient, location: geo.Location, hours: int) -> list:
+        """Forecast steps covering now through the next `hours` hours, oldest first."""
+        raise NotImplementedError
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    name = "openweathermap"
+
+    def __init__(self, api_key: str = OPENWEATHER_API_KEY, base_url: str = OPENWEATHER_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def _params(self, location, **extra):
+        where = {"lat": location.lat, "lon": location.lon} if location.cell else {"q": location.name}
+        return {**where, "appid": self.api_key, "units": "metric", **extra}
+
+    async def current(self, client, location):
+        resp = await client.get(f"{self.base_url}/weather", params=self._params(location), timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        return Observation(
+            city=location.name,
+            temperature=float(data["main"]["temp"]),
+            condition=data["weather"][0]["main"].lower(),
+            humidity=int(data["main"]["humidity"]),
+            wind_speed=float(data["wind"]["speed"]),
+            fetched_at=time.time(),
+            cell=location.cell,
+        )
+
+    async def forecast(self, client, location, hours):
+        # the public forecast endpoint has 3-hour steps, each one row, starting
+        # with the next step boundary: one more reaches `hours` from now
+        resp = await client.get(
+            f"{self.base_url}/forecast",
+            params=self._params(location, cnt=math.ceil(hours / 3) + 1),
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return [
+            Observation(
+                city=location.name,
+                temperature=float(step["main"]["temp"]),
+                condition=step["weather"][0]["main"].lower(),
+                humidity=int(step["main"]["humidity"]),
+                wind_speed=float(step["wind"]["speed"]),
+                fetched_at=float(step["dt"]),
+                cell=location.cell,
+            )
+            for step in resp.json()["list"]
+        ]
+
+
+class FakeWeatherProvider(WeatherProvider):
+    """
+    Deterministic offline provider for development and load tests: each
+    location key (cell) gets a stable base climate plus a daily temperature swing.
+    `latency` simulates upstream round-trip time; `calls` counts fetches.
+    """
+    name = "fake"
+    CONDITIONS = ("clear", "clouds", "rain", "snow", "drizzle", "mist")
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _seed(self, location):
+        return int.from_bytes(hashlib.sha1(location.encode()).digest()[:4], "big")
+
+    def _at(self, key, ts, location: geo.Location = None):
+        seed = self._seed(key)
+        base = (seed % 30) - 5  # -5 .. 24 °C
+        hour = (ts / 3600) % 24
+        temp = base + 6 * math.sin((hour - 9) / 24 * 2 * math.pi)
+        condition = self.CONDITIONS[(seed + int(ts // 10800)) % len(self.CONDITIONS)]
+        if condition == "snow" and temp > 3:
+            condition = "rain"
+        return Observation(
+            city=location.name if location else key,
+            temperature=round(temp, 1),
+            condition=condition,
+            humidity=40 + seed % 50,
+            wind_speed=round((seed % 120) / 10, 1),
+            fetched_at=ts,
+            cell=location.cell if location else None,
+        )
+
+    async def current(self, client, location):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._at(location.key, time.time(), location)
+
+    async def forecast(self, client, location, hours):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        hour = time.time() // 3600 * 3600  # the hour in progress, then through now + hours
+        return [self._at(location.key, hour + 3600 * h, location) for h in range(hours + 1)]
+
+
+# --------------------------------------------------------
+# 🔌 Circuit breaker
+# --------------------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive errors and rejects calls for
+    `reset_after` seconds; then lets a single probe through (half-open).
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        self.errors += 1
+        self.probing = False
+        if self.errors >= self.failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+# --------------------------------------------------------
+# ☁️ Weather service: single-flight + local/Redis SWR cache
+# --------------------------------------------------------
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared pooled client; one per process, closed from the app lifespan."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=WEATHER_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=WEATHER_MAX_CONNECTIONS,
+                max_keepalive_connections=WEATHER_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class WeatherService:
+    def __init__(self, provider: WeatherProvider, sink=None):
+        self.provider = provider
+        self.sink = sink  # called with each freshly fetched Observation
+        self.breaker = CircuitBreaker()
+        self._cache = {}  # location key (cell) -> Observation (insertion-ordered for eviction)
+        self._forecasts = {}  # location key -> (fetched at, [Observation, ...])
+        self._inflight = {}  # (fetch, location key, bucket) -> Task
+        self.stats = {"local_hits": 0, "redis_hits": 0, "stale_served": 0, "fetches": 0, "coalesced": 0, "errors": 0,
+                      "forecast_hits": 0, "forecast_fetches": 0, "stored_served": 0}
+
+    def _age(self, obs: Observation) -> float:
+        return time.time() - obs.fetched_at
+
+    def _remember(self, key, obs):
+        self._cache.pop(key, None)
+        self._cache[key] = obs
+        if len(self._cache) > WEATHER_CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+
+    async def _from_redis(self, key):
+        try:
+            raw = await redis_store.r.get(f"wx:{key}")
+        except RedisError:
+            return None
+        return Observation(**json.loads(raw)) if raw else None
+
+    async def _to_redis(self, key, obs):
+        try:
+            await redis_store.r.setex(f"wx:{key}", WEATHER_STALE_TTL, json.dumps(asdict(obs)))
+        except RedisError:
+            pass
+
+    async def _fetch(self, location: geo.Location) -> Observation:
+        if not self.breaker.allow():
+            raise WeatherUnavailable(f"{self.provider.name} circuit open")
+        self.stats["fetches"] += 1
+        key = location.key
+        try:
+            obs = await asyncio.wait_for(
+                self.provider.current(get_client(), location), self.provider.timeout
+            )
+        except Exception as e:
+            self.breaker.failure()
+            self.stats["errors"] += 1
+            raise WeatherUnavailable(f"{self.provider.name}: {e!r}") from e
+        self.breaker.success()
+        self._remember(key, obs)
+        if self.sink is not None:
+            self.sink(obs)
+        await self._to_redis(key, obs)
+        return obs
+
+    def _single_flight(self, location: geo.Location, fetch=None) -> asyncio.Task:
+        fetch = fetch or self._fetch
+        flight = (fetch.__name__, location.key, int(time.time() // WEATHER_BUCKET_SECONDS))
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(fetch(location))
+            self._inflight[flight] = task
+            task.add_done_callback(lambda t: self._inflight.pop(flight, None))
+            # Background refreshes may have no awaiter; don't warn about their errors
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.stats["coalesced"] += 1
+        return task
+
+    async def current(self, location) -> Observation:
+        """`location`: an app.geo.Location, or text (city / "lat,lon") to resolve."""
+        location = _resolve(location)
+        key = location.key
+
+        obs = self._cache.get(key)
+        if obs is not None:
+            self.stats["local_hits"] += 1
+        else:
+            obs = await self._from_redis(key)
+            if obs is not None:
+                self.stats["redis_hits"] += 1
+                self._remember(key, obs)
+
+        if obs is not None:
+            age = self._age(obs)
+            if age < WEATHER_FRESH_TTL:
+                return obs
+            if age < WEATHER_STALE_TTL:
+                self.stats["stale_served"] += 1
+                self._single_flight(location)  # revalidate in the background
+                return obs
+
+        # shield: one caller cancelling must not cancel the shared fetch
+        try:
+            return await asyncio.shield(self._single_flight(location))
+        except WeatherUnavailable:
+            stored = await self._from_db(location)
+            if stored is None or self._age(stored) >= WEATHER_STORED_TTL:
+                raise
+            self.stats["stored_served"] += 1
+            self._remember(key, stored)
+            return stored
+
+    async def _from_db(self, location):
+        try:
+            return await latest_observation(location)
+        except (SQLAlchemyError, OSError):
+            return None
+
+    async def _fetch_forecast(self, location: geo.Location) -> list:
+        if not self.breaker.allow():
+            raise WeatherUnavailable(f"{self.provider.name} circuit open")
+        self.stats["forecast_fetches"] += 1
+        key = location.key
+        try:
+            hours = await asyncio.wait_for(
+                self.provider.forecast(get_client(), location, FORECAST_MAX_HOURS), self.provider.timeout
+            )
+        except Exception as e:
+            self.breaker.failure()
+            self.stats["errors"] += 1
+            raise WeatherUnavailable(f"{self.provider.name} forecast: {e!r}") from e
+        if not hours:
+            self.breaker.failure()
+            self.stats["errors"] += 1
+            raise WeatherUnavailable(f"{self.provider.name} forecast: no steps returned")
+        self.breaker.success()
+        entry = (time.time(), hours)
+        self._forecasts.pop(key, None)
+        self._forecasts[key] = entry
+        if len(self._forecasts) > WEATHER_CACHE_SIZE:
+            self._forecasts.pop(next(iter(self._forecasts)))
+        try:
+            raw = json.dumps({"fetched_at": entry[0], "hours": [asdict(o) for o in hours]})
+            await redis_store.r.setex(f"wxf:{key}", WEATHER_STALE_TTL, raw)
+        except RedisError:
+            pass
+        return hours
+
+    async def forecast(self, location, hours: int = FORECAST_MAX_HOURS) -> list:
+        """
+        Forecast steps covering the next `hours` hours (capped at
+        FORECAST_MAX_HOURS): the step in progress, then every step that
+        starts before now + hours. Never empty. One upstream fetch per
+        location per FORECAST_TTL; a stale forecast is served if the
+        refresh fails.
+        """
+        location = _resolve(location)
+        key = location.key
+        hours = max(1, min(hours, FORECAST_MAX_HOURS))
+
+        entry = self._forecasts.get(key)
+        if entry is None:
+            try:
+                raw = await redis_store.r.get(f"wxf:{key}")
+            except RedisError:
+                raw = None
+            if raw:
+                data = json.loads(raw)
+                entry = (data["fetched_at"], [Observation(**o) for o in data["hours"]])
+                self._forecasts[key] = entry
+
+        if entry is None or time.time() - entry[0] >= FORECAST_TTL:
+            try:
+                entry = (time.time(), await asyncio.shield(self._single_flight(location, self._fetch_forecast)))
+            except WeatherUnavailable:
+                if entry is None or time.time() - entry[0] >= WEATHER_STALE_TTL:
+                    raise
+                self.stats["stale_served"] += 1
+        else:
+            self.stats["forecast_hits"] += 1
+
+        # drop steps already over; a slightly old forecast still covers "now"
+        now, steps = time.time(), entry[1]
+        step = forecast_step(steps)
+        end = now + hours * 3600
+        return [o for o in steps if o.fetched_at + step > now and o.fetched_at < end] or steps[-1:]
+
+    def diagnostics(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "breaker": self.breaker.state,
+            "cached": len(self._cache),
+            "forecasts": len(self._forecasts),
+            "locations": geo.stats(),
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+
+def forecast_step(steps) -> float:
+    """Seconds between forecast steps (3600 when there is only one)."""
+    return steps[1].fetched_at - steps[0].fetched_at if len(steps) > 1 else 3600.0
+
+
+def forecast_hours(steps) -> float:
+    """Hours a list of forecast steps spans, from the first step's start to the last one's end."""
+    if not steps:
+        return 0.0
+    return (steps[-1].fetched_at - steps[0].fetched_at + forecast_step(steps)) / 3600
+
+
+# --------------------------------------------------------
+# 💾 Persistence: batched writes into weather_data
+# --------------------------------------------------------
+OBSERVATION_COLUMNS = ("city", "temperature", "condition", "humidity", "wind_speed", "fetched_at", "cell")
+
+
+def _record(obs: Observation) -> tuple:
+    return (
+        obs.city, obs.temperature, obs.condition, obs.humidity, obs.wind_speed,
+        datetime.utcfromtimestamp(obs.fetched_at), obs.cell,
+    )
+
+
+async def write_observations(observations):
+    """Insert a batch of observations: COPY on asyncpg, multi-row INSERT otherwise."""
+    async with engine.begin() as conn:
+        await bulk_insert(conn, WeatherData.__table__, OBSERVATION_COLUMNS, [_record(o) for o in observations])
+
+
+observation_writer = BatchWriter(
+    "weather_data", write_observations,
+    max_batch=WEATHER_WRITE_BATCH, max_delay=WEATHER_WRITE_DELAY,
+)
+
+
+async def latest_observation(location) -> Observation | None:
+    """
+    Most recent stored observation for a location, by cell through
+    ix_weather_data_cell_fetched_at or by name for unresolved ones. Only key
+    and INCLUDE columns are read, so the lookup is an index-only scan.
+    """
+    location = _resolve(location)
+    match = WeatherData.cell == location.cell if location.cell else WeatherData.city == location.name
+    async with engine.connect() as conn:
+        row = (await conn.execute(
+            select(WeatherData.temperature, WeatherData.condition, WeatherData.humidity,
+                   WeatherData.wind_speed, WeatherData.fetched_at)
+            .where(match).order_by(WeatherData.fetched_at.desc()).limit(1)
+        )).first()
+    if row is None:
+        return None
+    return Observation(
+        city=location.name, temperature=row.temperature, condition=row.condition,
+        humidity=row.humidity, wind_speed=row.wind_speed,
+        fetched_at=row.fetched_at.replace(tzinfo=timezone.utc).timestamp(),  # stored as naive UTC
+        cell=location.cell,
+    )
+
+
+def make_provider(name: str = WEATHER_PROVIDER) -> WeatherProvider:
+    if name == "openweathermap":
+        return OpenWeatherMapProvider()
+    if name == "fake":
+        return FakeWeatherProvider()
+    raise ValueError(f"Unknown weather provider: {name}")
+
+
+_service = None
+
+
+def get_weather_service() -> WeatherService:
+    global _service
+    if _service is None:
+        sink = observation_writer.submit if WEATHER_PERSIST else None
+        _service = WeatherService(make_provider(), sink=sink)
+    return _service
+
+
+# --------------------------------------------------------
+# 🌍 Routes
+# --------------------------------------------------------
+router = APIRouter(prefix="/weather", tags=["weather"])
+
+
+def _locate(city: str | None, lat: float | None, lon: float | None) -> geo.Location:
+    if lat is not None and lon is not None:
+        try:
+            return geo.resolve_point(lat, lon)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    if not city:
+        raise HTTPException(400, "Pass city or lat and lon")
+    coords = geo.coordinates(city)
+    if coords and not geo.in_range(*coords):
+        raise HTTPException(400, f"Coordinates out of range: {coords[0]}, {coords[1]}")
+    return geo.resolve(city)
+
+
+@router.get("/current")
+async def current_weather(city: str = None, lat: float = None, lon: float = None):
+    try:
+        obs = await get_weather_service().current(_locate(city, lat, lon))
+    except WeatherUnavailable as e:
+        raise HTTPException(503, f"Weather unavailable: {e}")
+    return asdict(obs)
+
+
+@router.get("/forecast")
+async def hourly_forecast(city: str = None, lat: float = None, lon: float = None, hours: int = FORECAST_MAX_HOURS):
+    location = _locate(city, lat, lon)
+    try:
+        forecast = await get_weather_service().forecast(location, hours)
+    except WeatherUnavailable as e:
+        raise HTTPException(503, f"Weather unavailable: {e}")
+    return {"city": location.name, "cell": location.cell, "span_hours": forecast_hours(forecast),
+            "hours": [asdict(o) for o in forecast]}
+
+
+@router.get("/locate")
+async def locate(q: str, limit: int = 10):
+    """Gazetteer prefix search (for autocomplete), most populous first."""
+    places = geo.get_gazetteer().search(q, min(limit, 50))
+    return [{"name": p.name, "country": p.country, "lat": p.lat, "lon": p.lon, "cell": p.cell[:geo.GEO_PRECISION]}
+            for p in places]
@@ -0,0 +1,79 @@
+"""
+Event-loop latency while concurrent logins are hashing.
+
+Fires a burst of bcrypt verifications (the CPU part of /auth/login) and,
+at the same time, probes /healthz and /me through the in-process app.
+Runs twice: once with bcrypt called inline on the loop (the old behaviour)
+and once through the async hashing pool.
+
+    python -m bench.bench_hashing --logins 32 --probes 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.auth import hash as hashing
+from app.main import app
+
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+async def _inline_verify(password, hashed):
+    return hashing.verify_password(password, hashed)
+
+
+async def probe(client, path, n, out):
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await client.get(path)
+        out.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def run(mode, logins, probes, hashed):
+    verify = hashing.verify_password_async if mode == "pool" else _inline_verify
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        healthz, me = [], []
+        await probe(client, "/healthz", 5, [])  # warm up routing
+
+        async def login_storm():
+            for _ in range(logins // 8 or 1):
+                await asyncio.gather(*(verify("secret-pw", hashed) for _ in range(8)))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(
+            login_storm(),
+            probe(client, "/healthz", probes, healthz),
+            probe(client, "/me", probes, me),
+        )
+        elapsed = time.perf_counter() - t0
+
+    for name, samples in (("/healthz", healthz), ("/me", me)):
+        print(
+            f"{mode:>6} {name:<9} p50={statistics.median(samples):7.2f}ms "
+            f"p95={pct(samples, 95):7.2f}ms max={max(samples):7.2f}ms"
+        )
+    print(f"{mode:>6} total {elapsed:.2f}s for {logins} logins")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--probes", type=int, default=200)
+    args = parser.parse_args()
+
+    hashed = hashing.hash_password("secret-pw")
+    asyncio.run(run("inline", args.logins, args.probes, hashed))
+    asyncio.run(run("pool", args.logins, args.probes, hashed))
+    hashing.shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Mail delivery: one SMTP connection per message (connect, EHLO, AUTH, send,
+QUIT) versus the mailer worker's pool of persistent connections.
+
+Runs against fakeredis and the in-process SMTP stand-in (bench.smtp_sink),
+so no server is needed. --latency is the simulated per-round-trip network
+delay, applied to every command. --fail-rate makes the sink defer that share
+of messages with 451, to show the retry path. Addresses containing "reject"
+are refused and must end up in mail:dead.
+
+    python -m bench.bench_mail --mails 500 --latency 0.002 --fail-rate 0.1
+"""
+import argparse
+import asyncio
+import time
+
+from fakeredis import FakeAsyncRedis
+
+from app import mailer
+from app.auth import redis_store
+from bench.smtp_sink import SMTPSink
+
+
+class SlowSink(SMTPSink):
+    """Every reply waits `rtt`, standing in for the network round trip."""
+
+    def __init__(self, rtt, **kwargs):
+        super().__init__(**kwargs)
+        self.rtt = rtt
+
+    async def _session(self, reader, writer):
+        async def drain(_drain=writer.drain):
+            await asyncio.sleep(self.rtt)
+            await _drain()
+
+        writer.drain = drain
+        await super()._session(reader, writer)
+
+
+async def per_message(port, n):
+    import aiosmtplib
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        message = {"id": f"naive{i}", "to": f"user{i}@example.com", "subject": "Reset", "body": "link"}
+        await aiosmtplib.send(mailer._build(message), hostname="127.0.0.1", port=port,
+                              username="app", password="secret", start_tls=False)
+    return time.perf_counter() - t0
+
+
+async def pooled(n, rejects):
+    for i in range(n):
+        await mailer.send_password_reset(f"user{i}@example.com", f"token{i}")
+    for i in range(rejects):
+        await mailer.send_password_reset(f"reject{i}@example.com", f"token{i}")
+    duplicates = sum([await mailer.send_password_reset(f"user{i}@example.com", "again") for i in range(n)])
+
+    t0 = time.perf_counter()
+    worker = asyncio.create_task(mailer.consume("bench"))
+    while True:
+        depth = await mailer.status()
+        if depth["outbox"] == 0 and depth["retry"] == 0:
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    worker.cancel()
+    try:
+        await worker
+    except asyncio.CancelledError:
+        pass
+    return elapsed, duplicates, depth["dead"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mails", type=int, default=500)
+    parser.add_argument("--rejects", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    parser.add_argument("--connections", type=int, default=mailer.MAIL_SMTP_CONNECTIONS)
+    args = parser.parse_args()
+
+    redis_store.r = FakeAsyncRedis(decode_responses=True)
+    naive_sink = SlowSink(args.latency)
+    naive_server = await naive_sink.start(port=0)
+    sink = SlowSink(args.latency, fail_rate=args.fail_rate)
+    server = await sink.start(port=0)
+
+    mailer.MAIL_BACKEND = "smtp"
+    mailer.SMTP_HOST, mailer.SMTP_PORT = "127.0.0.1", server.sockets[0].getsockname()[1]
+    mailer.SMTP_USER, mailer.SMTP_PASSWORD, mailer.SMTP_STARTTLS = "app", "secret", False
+    mailer.MAIL_SMTP_CONNECTIONS = args.connections
+    mailer.MAIL_RETRY_BASE, mailer.MAIL_POLL, mailer.MAIL_MAX_ATTEMPTS = 0.02, 0.005, 20
+
+    naive = await per_message(naive_server.sockets[0].getsockname()[1], args.mails)
+    elapsed, duplicates, dead = await pooled(args.mails, args.rejects)
+    await asyncio.sleep(args.latency * 5)  # let the sessions finish their QUIT replies
+    naive_server.close()
+    server.close()
+
+    print(f"{args.mails} mails, {args.latency * 1000:.1f} ms per round trip, "
+          f"{args.fail_rate:.0%} deferred by the server")
+    print(f"  connection per message  {naive:8.2f} s  {naive_sink.stats['connections']:5d} connections")
+    print(f"  pooled worker           {elapsed:8.2f} s  {sink.stats['connections']:5d} connections  "
+          f"{mailer._stats['retried']} retries  {mailer._stats['batches']} batches")
+
+    assert sink.stats["accepted"] == args.mails, sink.stats
+    assert duplicates == 0, "dedup let a repeat through"
+    assert dead == args.rejects, f"expected {args.rejects} dead letters, got {dead}"
+    recipients = {rcpt[0] for rcpt, _ in sink.messages}
+    assert len(recipients) == args.mails, "a mail was sent twice"
+    print("  ok: every mail delivered once, repeats deduplicated, refused recipients dead-lettered")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
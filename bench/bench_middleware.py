@@ -0,0 +1,78 @@
+"""
+Requests/sec on /me through the old BaseHTTPMiddleware and the ASGI one.
+
+Both variants serve the same /me route with a valid Bearer token. The
+legacy middleware is reproduced here (minus its debug prints) so the
+comparison survives after the old class is gone. Redis is fakeredis.
+
+    python -m bench.bench_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+import httpx
+from fakeredis import FakeAsyncRedis
+from fastapi import FastAPI, HTTPException, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import redis_store
+from app.auth.deps import make_token, verify_token
+from app.auth.middleware import AuthMiddleware
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        token = request.cookies.get("access_token")
+        if not token:
+            auth_header = request.headers.get("Authorization")
+            if auth_header and auth_header.startswith("Bearer "):
+                token = auth_header.split(" ")[1]
+        request.state.user_id = None
+        if token:
+            try:
+                request.state.user_id = int(verify_token(token, "access")["sub"])
+            except HTTPException:
+                request.state.user_id = None
+        return await call_next(request)
+
+
+def build(middleware):
+    app = FastAPI()
+    app.add_middleware(middleware)
+
+    @app.get("/me")
+    async def me(req: Request):
+        return {"user_id": getattr(req.state, "user_id", None)}
+
+    return app
+
+
+async def drive(app, n, token):
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        assert (await client.get("/me", headers=headers)).json()["user_id"] == 42
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await client.get("/me", headers=headers)
+        return n / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    redis_store.r = FakeAsyncRedis(decode_responses=True)
+    token, _, _ = make_token("42", timedelta(minutes=15), "access")
+
+    before = asyncio.run(drive(build(LegacyAuthMiddleware), args.requests, token))
+    after = asyncio.run(drive(build(AuthMiddleware), args.requests, token))
+    print(f"BaseHTTPMiddleware : {before:8.0f} req/s")
+    print(f"ASGI + token cache : {after:8.0f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
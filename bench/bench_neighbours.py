@@ -0,0 +1,154 @@
+"""
+Collaborative NeighbourIndex at 1M feedback rows.
+
+Synthetic users belong to --groups taste groups. Each group likes or
+dislikes its own set of outfit archetypes per weather tag, and users vote
+with 10% noise. The bench reports:
+
+    fit          full build (CSR per tag + blocked top-K products)
+    publish      writing a version and memory-mapping it back, as workers do
+    quality      share of a user's neighbours that come from their own group
+    lookup       predict() (O(k) neighbour rows) against brute force
+                 (one user's row times the whole matrix per request)
+    blend        app.recommender.collaborative() for one wardrobe
+    incremental  add() + apply() of --new-votes votes, then a check that
+                 the refreshed lists are at least as good as a full refit
+
+    python -m bench.bench_neighbours --rows 1000000 --users 50000
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app import recommender as rec
+from ml.recommender_model import NeighbourHandle, NeighbourIndex, publish_neighbours
+
+
+def synthetic_votes(rows, users, groups, rng, first_user=1):
+    group_of = rng.integers(0, groups, users)
+    # per group and tag: 12 archetypes with an opinion (+1 / -1)
+    taste_items = rng.integers(0, rec.ARCHETYPES, (groups, len(rec.CONDITIONS), 12))
+    taste_sign = rng.choice([-1.0, 1.0], (groups, len(rec.CONDITIONS), 12))
+    user = rng.integers(0, users, rows)
+    tag = rng.integers(0, len(rec.CONDITIONS), rows)
+    pick = rng.integers(0, 12, rows)
+    g = group_of[user]
+    items = taste_items[g, tag, pick]
+    values = taste_sign[g, tag, pick] * np.where(rng.random(rows) < 0.1, -1, 1)
+    return (user + first_user, tag, items, values.astype(np.float32)), group_of
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--new-votes", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    votes, group_of = synthetic_votes(args.rows, args.users, args.groups, rng)
+    index = NeighbourIndex(len(rec.CONDITIONS), rec.ARCHETYPES)
+    t0 = time.perf_counter()
+    index.fit(*votes)
+    fit = time.perf_counter() - t0
+    states = [s for s in index._tags if s is not None]
+    mb = sum(s.votes.data.nbytes + s.unit.data.nbytes + s.nbr.nbytes + s.sim.nbytes for s in states) / 2**20
+    print(f"fit: {args.rows:,} rows, {args.users:,} users, {len(states)} tags in {fit:.2f} s "
+          f"({sum(s.votes.nnz for s in states):,} nonzeros, ~{mb:.0f} MB)")
+
+    rain = rec.CONDITIONS.index("rain")
+    sample = rng.choice(np.arange(1, args.users + 1), 1000, replace=False)
+    same = total = 0
+    for uid in sample.tolist():
+        nbr, _ = index.neighbours(uid, rain)
+        if nbr is not None and len(nbr):
+            users = index_users(index)[nbr]
+            same += int((group_of[users - 1] == group_of[uid - 1]).sum())
+            total += len(nbr)
+    print(f"quality: {same / max(total, 1):.1%} of rain neighbours share the user's taste group "
+          f"(random: {1 / args.groups:.1%})")
+
+    lookups = rng.choice(index_users(index), args.lookups).tolist()  # users with votes
+    it = iter(lookups * 3)
+    indexed = timed(lambda: index.predict(next(it), rain), args.lookups)
+    state = index._tags[rain]
+    unit_t = state.unit.T.tocsr()
+    it = iter(lookups * 3)
+
+    def brute():
+        row = index._row[next(it)]
+        sims = (state.unit[[row]] @ unit_t).toarray().ravel()
+        sims[row] = 0
+        top = np.argpartition(-sims, index.k)[:index.k]
+        return state.votes[top].sign().T @ sims[top]
+
+    brute_force = timed(brute, min(args.lookups, 200))
+    print(f"lookup: predict() {indexed * 1e6:.0f} us vs brute force {brute_force * 1e6:.0f} us per request "
+          f"({brute_force / indexed:.0f}x)")
+
+    with tempfile.TemporaryDirectory() as out:
+        t0 = time.perf_counter()
+        publish_neighbours(index, {"cursor": {"watermark": 0, "gaps": []}, "fitted_at": time.time()}, out)
+        written = time.perf_counter() - t0
+        mapped = NeighbourHandle(out).reload()
+        it = iter(lookups * 3)
+        served = timed(lambda: mapped.predict(next(it), rain), args.lookups)
+        same = all(np.array_equal(index.predict(u, rain), mapped.predict(u, rain)) for u in lookups[:200])
+        assert same, "the memory-mapped version predicts differently"
+        print(f"publish: written in {written * 1000:.0f} ms, mapped in {mapped.load_seconds * 1000:.1f} ms, "
+              f"predict() from the mapped version {served * 1e6:.0f} us")
+
+    wardrobe = rec.Wardrobe(
+        outfit_ids=np.arange(30), owner=np.full(30, lookups[0]), lo=np.zeros(30), hi=np.full(30, 20),
+        season=rng.integers(0, len(rec.SEASONS), 30), category=rng.integers(0, len(rec.CATEGORIES), 30),
+        color=rng.integers(0, len(rec.COLORS), 30),
+    )
+    weather = rec.weather_vector(8, "rain", 80, 4)
+    plain = timed(lambda: rec.rank(wardrobe, weather), 500)
+    blended = timed(lambda: rec.rank(wardrobe, weather, neighbours=index), 500)
+    print(f"blend: rank() of 30 outfits {plain * 1e6:.0f} us, with neighbours {blended * 1e6:.0f} us")
+
+    new, _ = synthetic_votes(args.new_votes, args.users + 500, args.groups, rng)  # includes 500 new user ids
+    t0 = time.perf_counter()
+    index.add(*new)
+    applied = index.apply()
+    incremental = time.perf_counter() - t0
+    print(f"incremental: {applied} votes applied in {incremental * 1000:.0f} ms "
+          f"(full refit {fit:.2f} s)")
+
+    fresh = NeighbourIndex(len(rec.CONDITIONS), rec.ARCHETYPES)
+    fresh.fit(*(np.concatenate(pair) for pair in zip(votes, new)))
+    dirty = np.unique(new[0][new[1] == rain])
+    # a refreshed list is the refit's list plus any voter merged in from the other
+    # side, so it must match or beat the refit's similarities rank by rank
+    worse = exact = 0
+    for uid in dirty.tolist():
+        _, a = index.neighbours(uid, rain)
+        _, b = fresh.neighbours(uid, rain)
+        worse += len(a) < len(b) or bool((a[:len(b)] < b - 1e-5).any())
+        exact += len(a) == len(b) and np.allclose(a, b, atol=1e-5)
+    assert not worse, f"{worse} of {len(dirty)} refreshed lists are worse than a refit"
+    print(f"  ok: of {len(dirty)} refreshed rain neighbour lists, {exact} match a full refit, "
+          f"{len(dirty) - exact} beat it")
+
+
+def index_users(index):
+    """Row -> user id."""
+    users = np.empty(len(index._row), dtype=np.int64)
+    users[list(index._row.values())] = list(index._row.keys())
+    return users
+
+
+if __name__ == "__main__":
+    main()
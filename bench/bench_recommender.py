@@ -0,0 +1,104 @@
+"""
+Outfit scoring: 10k outfits x 100 weather vectors in one vectorized pass,
+against a per-outfit Python loop on a sample for reference.
+
+Then a day forecast: one wardrobe against --hours forecast hours, as one
+batched rank_forecast() against one rank() call per hour.
+
+    python -m bench.bench_recommender --outfits 10000 --weathers 100
+    python -m bench.bench_recommender --outfits 300 --hours 24
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from app import recommender as rec
+
+
+def synthetic_wardrobe(n, rng):
+    lo = rng.integers(-15, 25, n)
+    return rec.Wardrobe(
+        outfit_ids=np.arange(1, n + 1),
+        owner=rng.integers(1, 100, n),
+        lo=lo,
+        hi=lo + rng.integers(4, 15, n),
+        season=rng.integers(0, len(rec.SEASONS), n),
+        category=rng.integers(0, len(rec.CATEGORIES), n),
+        color=rng.integers(0, len(rec.COLORS), n),
+        likes=rng.integers(0, 3, (n, len(rec.CONDITIONS))),
+        votes=rng.integers(3, 6, (n, len(rec.CONDITIONS))),
+    )
+
+
+def loop_score(w, weather):
+    """Straightforward per-outfit loop with the same formula."""
+    t = weather[rec.TEMP] - rec.WIND_CHILL * max(weather[rec.WIND] - 2, 0)
+    cond = int(weather[rec.CONDITION])
+    season = int(rec.weather_season(np.array(t)))
+    weight = w.weight
+    out = []
+    for i in range(len(w)):
+        d = max(w.lo[i] - t, 0) + max(t - w.hi[i], 0)
+        out.append(
+            math.exp(-d / rec.TEMP_SCALE)
+            * rec.SEASON_AFFINITY[w.season[i], season]
+            * rec.CONDITION_AFFINITY[w.category[i], cond]
+            * weight[i, cond]
+        )
+    return np.array(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outfits", type=int, default=10000)
+    parser.add_argument("--weathers", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    w = synthetic_wardrobe(args.outfits, rng)
+    weathers = np.column_stack([
+        rng.uniform(-10, 30, args.weathers),
+        rng.integers(0, len(rec.CONDITIONS), args.weathers),
+        rng.integers(20, 100, args.weathers),
+        rng.uniform(0, 15, args.weathers),
+    ])
+    w.weight  # warm the cached feedback weights
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        ids, scores = w.top_k_batch(weathers, args.k)
+        best = min(best, time.perf_counter() - t0)
+    pairs = args.outfits * args.weathers
+    print(f"vectorized: {best * 1000:8.1f} ms for {args.outfits} x {args.weathers} "
+          f"({pairs / best / 1e6:.1f} M pairs/s), top-{args.k} shape {ids.shape}")
+
+    t0 = time.perf_counter()
+    ref = loop_score(w, weathers[0])
+    loop = time.perf_counter() - t0
+    print(f"python loop: {loop * 1000:8.1f} ms for {args.outfits} x 1 "
+          f"(~{loop * args.weathers:.1f} s for the full batch)")
+    assert np.allclose(ref, w.score(weathers[0]))
+    assert set(ids[0]) == set(w.outfit_ids[np.argsort(-ref)[:args.k]])
+
+    forecast = weathers[:args.hours]
+    batched = per_hour = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        worst = rec.rank_forecast(w, forecast, how="worst")
+        batched = min(batched, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        ref = np.min([rec.rank(w, hour) for hour in forecast], axis=0)
+        per_hour = min(per_hour, time.perf_counter() - t0)
+    print(f"forecast: {batched * 1000:8.2f} ms batched vs {per_hour * 1000:8.2f} ms per-hour "
+          f"for {args.outfits} outfits x {len(forecast)} hours")
+    assert np.allclose(worst, ref)
+
+
+if __name__ == "__main__":
+    main()
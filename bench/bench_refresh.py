@@ -0,0 +1,106 @@
+"""
+Refresh rotation throughput: take_refresh + store_refresh (two round trips)
+versus the single rotate_refresh script.
+
+fakeredis answers in-process, so --rtt adds a simulated network round trip
+to every command; with --url the bench runs against a real server instead.
+Also checks that a replayed (already rotated) jti is refused.
+
+    python -m bench.bench_refresh --rotations 5000 --concurrency 50 --rtt 0.0005
+    python -m bench.bench_refresh --url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import redis.asyncio as redis
+from fakeredis import FakeAsyncRedis
+
+from app.auth import redis_store
+
+TTL = 7 * 24 * 3600
+
+
+class SlowFakeRedis(FakeAsyncRedis):
+    rtt = 0.0
+
+    async def execute_command(self, *args, **options):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        return await super().execute_command(*args, **options)
+
+
+async def two_calls(jti, user_id):
+    new = uuid.uuid4().hex
+    uid = await redis_store.take_refresh(jti)
+    if uid is None:
+        return None
+    await redis_store.store_refresh(new, int(uid), TTL)
+    return new
+
+
+async def one_call(jti, user_id):
+    new = uuid.uuid4().hex
+    uid = await redis_store.rotate_refresh(jti, new, TTL)
+    return new if uid is not None else None
+
+
+async def drive(rotate, rotations, concurrency):
+    """`concurrency` sessions, each rotating its own token in a chain."""
+    chains = []
+    for i in range(concurrency):
+        jti = uuid.uuid4().hex
+        await redis_store.store_refresh(jti, i, TTL)
+        chains.append(jti)
+    per_chain = rotations // concurrency
+
+    async def chain(i):
+        jti = chains[i]
+        for _ in range(per_chain):
+            jti = await rotate(jti, i)
+            assert jti is not None
+        return jti
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(chain(i) for i in range(concurrency)))
+    return per_chain * concurrency / (time.perf_counter() - t0)
+
+
+async def run(args):
+    if args.url:
+        redis_store.r = redis.from_url(args.url, decode_responses=True)
+        await redis_store.r.flushdb()
+    else:
+        SlowFakeRedis.rtt = args.rtt
+        redis_store.r = SlowFakeRedis(decode_responses=True)
+    await redis_store.load_scripts()
+
+    before = await drive(two_calls, args.rotations, args.concurrency)
+    after = await drive(one_call, args.rotations, args.concurrency)
+
+    # a consumed jti must not rotate again, and the user's index must stay exact
+    jti, new = uuid.uuid4().hex, uuid.uuid4().hex
+    await redis_store.store_refresh(jti, 99999, TTL)
+    assert await redis_store.rotate_refresh(jti, new, TTL) == "99999"
+    assert await redis_store.rotate_refresh(jti, uuid.uuid4().hex, TTL) is None
+    assert await redis_store.r.smembers("urt:99999") == {new}
+
+    target = args.url or f"fakeredis (+{args.rtt * 1000:.2f} ms simulated RTT)"
+    print(f"redis                : {target}")
+    print(f"take + store (2 RTT) : {before:9.0f} rotations/s")
+    print(f"rotate script (1 RTT): {after:9.0f} rotations/s  ({after / before:.2f}x)")
+    await redis_store.r.aclose(close_connection_pool=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rotations", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.0005, help="simulated seconds per command (fakeredis)")
+    parser.add_argument("--url", default=None, help="real Redis; the database is FLUSHED")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
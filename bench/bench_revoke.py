@@ -0,0 +1,91 @@
+"""
+Revoke-all at 100k live sessions: global KEYS scan vs per-user index.
+
+Runs against fakeredis (no server needed) and asserts that the index-based
+revoke removes exactly the target user's tokens, then checks that the
+backfill rebuilds the index for rt:* keys written without one.
+
+    python -m bench.bench_revoke --sessions 100000 --users 10000
+"""
+import argparse
+import asyncio
+import time
+
+from fakeredis import FakeAsyncRedis
+
+from app.auth import redis_store
+
+TTL = 7 * 24 * 3600
+
+
+async def legacy_revoke(r, user_id):
+    """The old /auth/revoke-all loop: KEYS rt:* then one GET (+DEL) per key."""
+    count, calls = 0, 1
+    for k in await r.keys("rt:*"):
+        calls += 1
+        if await r.get(k) == str(user_id):
+            calls += 1
+            await r.delete(k)
+            count += 1
+    return count, calls
+
+
+async def seed(r, sessions, users, indexed=True):
+    async with r.pipeline(transaction=False) as pipe:
+        for i in range(sessions):
+            uid = i % users
+            pipe.setex(f"rt:s{i}", TTL, str(uid))
+            if indexed:
+                pipe.sadd(f"urt:{uid}", f"s{i}")
+                pipe.expire(f"urt:{uid}", TTL)
+        await pipe.execute()
+
+
+async def run(sessions, users):
+    per_user = sessions // users
+    redis_store.r = FakeAsyncRedis(decode_responses=True)
+    r = redis_store.r
+
+    await seed(r, sessions, users)
+    t0 = time.perf_counter()
+    count, calls = await legacy_revoke(r, 1)
+    legacy = time.perf_counter() - t0
+    assert count == per_user, count
+    print(f"legacy KEYS scan : {legacy * 1000:9.1f} ms, {calls} round trips, revoked {count}")
+
+    t0 = time.perf_counter()
+    count = await redis_store.revoke_user_refresh(2)
+    indexed = time.perf_counter() - t0
+    assert count == per_user, count
+    assert await r.exists("urt:2") == 0
+    assert await r.get(f"rt:s3") == "3"  # other users untouched
+    print(f"per-user index   : {indexed * 1000:9.1f} ms, 1 round trip, revoked {count}")
+
+    # store/take keep the index in step
+    await redis_store.store_refresh("fresh", 3, TTL)
+    assert await r.sismember("urt:3", "fresh")
+    assert await redis_store.take_refresh("fresh") == "3"
+    assert not await r.sismember("urt:3", "fresh")
+
+    # backfill from un-indexed legacy keys
+    await r.flushdb()
+    await seed(r, sessions, users, indexed=False)
+    t0 = time.perf_counter()
+    n = await redis_store.backfill_refresh_index()
+    print(f"backfill         : {(time.perf_counter() - t0) * 1000:9.1f} ms, indexed {n}")
+    assert n == sessions
+    assert await r.scard("urt:4") == per_user
+    assert 0 < await r.ttl("urt:4") <= TTL
+    assert await redis_store.revoke_user_refresh(4) == per_user
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.users))
+
+
+if __name__ == "__main__":
+    main()
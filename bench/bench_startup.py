@@ -0,0 +1,89 @@
+"""
+Cold-start budget for an API worker.
+
+Each sample is a fresh interpreter that imports app.main and runs its
+startup (lifespan), the work a new uvicorn worker does before serving.
+Fails (exit 1) when the median exceeds --budget or when the ML stack was
+imported eagerly under ML_PRELOAD=lazy. The ML warm-up is timed separately
+so its cost stays visible.
+
+    python -m bench.bench_startup --samples 5 --budget 2.5
+    STARTUP_BUDGET=1.5 python -m bench.bench_startup
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY = ("numpy", "sklearn", "pandas", "scipy", "joblib", "app.recommender", "ml.recommender_model")
+
+CHILD = r"""
+import asyncio, json, sys, time
+from fakeredis import FakeAsyncRedis
+preloaded = set(sys.modules)  # the stand-in itself pulls in numpy; not the app's cost
+t0 = time.perf_counter()
+from app.auth import redis_store
+redis_store.r = FakeAsyncRedis(decode_responses=True)
+from app.main import app
+imported = time.perf_counter() - t0
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter() - t0
+        heavy = [m for m in HEAVY if m in sys.modules and m not in preloaded]
+        from app import warmup
+        warm = warmup.warm_up()
+        return started, heavy, warm
+
+started, heavy, warm = asyncio.run(boot())
+print(json.dumps({"import": imported, "startup": started, "heavy": heavy, "warm_up": warm["seconds"]}))
+"""
+
+
+def sample(env) -> dict:
+    out = subprocess.check_output(
+        [sys.executable, "-c", f"HEAVY = {HEAVY!r}\n" + CHILD], env=env, text=True, stderr=subprocess.DEVNULL,
+    )
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET", "2.5")),
+                        help="max median seconds from interpreter start to serving")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="startup-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{tmp}/startup.db",
+        "ML_PRELOAD": "lazy",
+        "PYTHONPATH": os.getcwd(),
+    }
+    samples = [sample(env) for _ in range(args.samples)]
+    imported = statistics.median(s["import"] for s in samples)
+    started = statistics.median(s["startup"] for s in samples)
+    warm = statistics.median(s["warm_up"] for s in samples)
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+
+    print(f"import app.main : {imported * 1000:8.0f} ms (median of {args.samples})")
+    print(f"ready to serve  : {started * 1000:8.0f} ms  (budget {args.budget * 1000:.0f} ms)")
+    print(f"ML warm-up      : {warm * 1000:8.0f} ms  (paid lazily, in background, or once in the master)")
+    print(f"eager ML imports: {', '.join(heavy) or 'none'}")
+
+    failed = False
+    if started > args.budget:
+        print("FAIL: cold start over budget")
+        failed = True
+    if heavy:
+        print("FAIL: ML stack imported at startup with ML_PRELOAD=lazy")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
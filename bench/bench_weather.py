@@ -0,0 +1,74 @@
+"""
+Offline load test of the weather service with the fake provider.
+
+Simulates a morning burst: many users spread over a few gazetteer cities
+request the current weather at once, typed the way real users type them
+(case, aliases, "name, CC", coordinates within ~1 km of the centre).
+Runs once keyed by geohash cell and once keyed by the raw text, and reports
+upstream calls, coalescing and latency for both.
+
+    python -m bench.bench_weather --users 20000 --cities 50 --latency 0.08
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fakeredis import FakeAsyncRedis
+
+from app import geo, weather
+from app.auth import redis_store
+
+
+def spelling(place, rng):
+    """One way a user might enter this place."""
+    variant = rng.randrange(6)
+    if variant == 0:
+        return place.name.upper()
+    if variant == 1:
+        return f"{place.name.lower()}, {place.country.lower()}"
+    if variant == 2:
+        return f"  {place.name} "
+    if variant == 3:
+        return f"{place.lat + rng.uniform(-0.005, 0.005):.4f},{place.lon + rng.uniform(-0.005, 0.005):.4f}"
+    return place.name
+
+
+async def run_keyed(requests, latency, by_text):
+    redis_store.r = FakeAsyncRedis(decode_responses=True)
+    provider = weather.FakeWeatherProvider(latency=latency)
+    service = weather.WeatherService(provider)
+    if by_text:  # the old behaviour: every distinct normalized spelling is its own key
+        requests = [geo.Location(name=" ".join(c.lower().split()), cell=None) for c in requests]
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(service.current(c) for c in requests))
+    elapsed = time.perf_counter() - t0
+    await weather.close_client()
+
+    label = "by text" if by_text else "by cell"
+    print(f"{label}: {len(requests)} lookups in {elapsed * 1000:.0f} ms, upstream calls {provider.calls} "
+          f"({len(requests) / provider.calls:.0f} lookups per call), cached keys {len(service._cache)}")
+
+
+async def run(users, cities, latency):
+    rng = random.Random(0)
+    places = geo.get_gazetteer().places[:cities]
+    requests = [spelling(rng.choice(places), rng) for _ in range(users)]
+    print(f"{users} users over {len(places)} cities, {len(set(requests))} distinct spellings")
+    await run_keyed(requests, latency, by_text=True)
+    await run_keyed(requests, latency, by_text=False)
+    print(geo.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.08)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.cities, args.latency))
+
+
+if __name__ == "__main__":
+    main()
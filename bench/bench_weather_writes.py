@@ -0,0 +1,73 @@
+"""
+weather_data write throughput: one INSERT + COMMIT per observation versus
+the batched write-behind writer (COPY on asyncpg, multi-row INSERT elsewhere).
+
+    python -m bench.bench_weather_writes --rows 20000
+    python -m bench.bench_weather_writes --url sqlite+aiosqlite:///bench.db
+
+--url defaults to DATABASE_URL. With SQLite the tables are created first;
+with Postgres the schema from sql/ must already exist.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--url", default=None)
+    return parser.parse_args()
+
+
+async def run(rows, batch):
+    from app.auth.models import User  # noqa: F401 (users table for the FK)
+    from app.database import Base, SessionLocal, engine
+    from app.ingest import BatchWriter
+    from app.models import WeatherData
+    from app.weather import FakeWeatherProvider, write_observations
+
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    fake = FakeWeatherProvider()
+    now = time.time()
+    observations = [fake._at(f"city {i % 500}", now - i) for i in range(rows)]
+
+    t0 = time.perf_counter()
+    async with SessionLocal() as db:
+        for obs in observations:
+            db.add(WeatherData(
+                city=obs.city, temperature=obs.temperature, condition=obs.condition,
+                humidity=obs.humidity, wind_speed=obs.wind_speed,
+            ))
+            await db.commit()
+    per_row = rows / (time.perf_counter() - t0)
+
+    writer = BatchWriter("bench", write_observations, max_batch=batch, max_delay=0.05, max_pending=rows)
+    t0 = time.perf_counter()
+    writer.start()
+    for obs in observations:
+        writer.submit(obs)
+    await writer.stop()
+    batched = rows / (time.perf_counter() - t0)
+    await engine.dispose()
+
+    print(f"driver      : {engine.dialect.name}+{engine.dialect.driver}")
+    print(f"per-row     : {per_row:10.0f} rows/s")
+    print(f"batched({batch}): {batched:10.0f} rows/s  ({batched / per_row:.1f}x)")
+    print(writer.diagnostics())
+
+
+def main():
+    args = parse_args()
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    asyncio.run(run(args.rows, args.batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+In-process load test of the auth and API hot paths.
+
+Boots app.main:app with its lifespan against a throwaway SQLite database
+(or --url) and fakeredis (or --redis), then runs these phases one after
+another, each with --concurrency virtual users in flight:
+
+    register -> login -> /me -> /auth/me -> /auth/refresh -> /auth/revoke-all
+
+Activation goes through /auth/activate when register hands back a token,
+otherwise users are activated directly in the database.
+
+Every phase reports p50/p95/p99 latency, throughput and non-2xx count.
+Results are written as JSON (git commit included) so runs can be diffed:
+
+    python -m bench.loadtest --users 40 --concurrency 10
+    python -m bench.loadtest --out before.json
+    python -m bench.loadtest --compare before.json
+
+Note: register and login are bcrypt-bound by design; their throughput
+tracks HASH_WORKERS and the CPU count rather than the web stack.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+PHASES = ("register", "login", "me", "auth_me", "refresh", "revoke_all")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--me", type=int, default=25, help="/me and /auth/me calls per user")
+    parser.add_argument("--refresh", type=int, default=5, help="sequential refresh rotations per user")
+    parser.add_argument("--url", default=None, help="database URL (default: fresh SQLite file)")
+    parser.add_argument("--redis", default=None, help="Redis URL (default: fakeredis)")
+    parser.add_argument("--out", default=None, help="JSON results path (default: bench/results/)")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to diff against")
+    return parser.parse_args()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.started = self.finished = None
+
+    async def call(self, send, *args, **kwargs):
+        t0 = time.perf_counter()
+        response = await send(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - t0)
+        if response.status_code >= 300:
+            self.errors += 1
+        return response
+
+    def summary(self) -> dict:
+        if not self.latencies:
+            return {"requests": 0, "errors": self.errors}
+        ms = np.asarray(self.latencies) * 1000
+        wall = self.finished - self.started
+        return {
+            "requests": len(ms),
+            "errors": self.errors,
+            "rps": round(len(ms) / wall, 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "max_ms": round(float(ms.max()), 3),
+        }
+
+
+async def _run_phase(phase, users, concurrency, work):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(user):
+        async with limit:
+            await work(phase, user)
+
+    phase.started = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in users))
+    phase.finished = time.perf_counter()
+    return phase
+
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy import update
+
+    from app.auth.models import User
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    transport = httpx.ASGITransport(app=app)
+    run_id = int(time.time())
+    users = [
+        {"email": f"load{run_id}-{i}@loadtest.dev", "password": f"pw-{i}-{run_id}"}
+        for i in range(args.users)
+    ]
+    for u in users:
+        u["client"] = httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+    async def register(phase, u):
+        await phase.call(u["client"].post, "/auth/register", json={"email": u["email"], "password": u["password"]})
+
+    async def login(phase, u):
+        r = await phase.call(u["client"].post, "/auth/login", json={"email": u["email"], "password": u["password"]})
+        u["headers"] = {"Authorization": f"Bearer {r.json().get('access_token')}"}
+
+    async def me(phase, u):
+        for _ in range(args.me):
+            await phase.call(u["client"].get, "/me", headers=u["headers"])
+
+    async def auth_me(phase, u):
+        for _ in range(args.me):
+            await phase.call(u["client"].get, "/auth/me", headers=u["headers"])
+
+    async def refresh(phase, u):
+        for _ in range(args.refresh):
+            await phase.call(u["client"].post, "/auth/refresh")  # rotates the refresh cookie
+
+    async def revoke_all(phase, u):
+        await phase.call(u["client"].post, "/auth/revoke-all", headers=u["headers"])
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        results["register"] = await _run_phase(Phase("register"), users, args.concurrency, register)
+
+        # activation links go out by mail; activate directly instead
+        async with SessionLocal() as db:
+            await db.execute(update(User).where(User.email.in_([u["email"] for u in users])).values(is_active=True))
+            await db.commit()
+
+        for name, work in (("login", login), ("me", me), ("auth_me", auth_me), ("refresh", refresh), ("revoke_all", revoke_all)):
+            results[name] = await _run_phase(Phase(name), users, args.concurrency, work)
+
+    for u in users:
+        await u["client"].aclose()
+    await engine.dispose()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "database": f"{engine.dialect.name}+{engine.dialect.driver}",
+            "redis": args.redis or "fakeredis",
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "me_per_user": args.me,
+            "refresh_per_user": args.refresh,
+        },
+        "phases": {name: results[name].summary() for name in PHASES},
+    }
+
+
+def report(result, baseline=None):
+    print(f"commit {result['meta']['commit']}  {result['meta']['database']}  "
+          f"users={result['meta']['users']} concurrency={result['meta']['concurrency']}")
+    print(f"{'phase':<11}{'reqs':>7}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in result["phases"].items():
+        if not s["requests"]:
+            continue
+        line = (f"{name:<11}{s['requests']:>7}{s['errors']:>5}{s['rps']:>10.1f}"
+                f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+        old = (baseline or {}).get("phases", {}).get(name)
+        if old and old.get("requests"):
+            line += f"   rps {s['rps'] / old['rps']:.2f}x  p95 {s['p95_ms'] / old['p95_ms']:.2f}x"
+        print(line)
+
+
+def main():
+    args = parse_args()
+    tmp = None
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        tmp = tempfile.mkdtemp(prefix="loadtest-")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/loadtest.db"
+    os.environ.setdefault("MAIL_WORKER", "0")  # queued activation mails are not sent during the run
+    if args.redis:
+        os.environ["REDIS_URL"] = args.redis
+    else:
+        from fakeredis import FakeAsyncRedis
+        from app.auth import redis_store
+        redis_store.r = FakeAsyncRedis(decode_responses=True)
+
+    result = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+
+    out = args.out or os.path.join("bench", "results", f"loadtest-{result['meta']['commit']}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=1)
+    print(f"saved {out}")
+    if tmp:
+        os.remove(os.path.join(tmp, "loadtest.db"))
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
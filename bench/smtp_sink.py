@@ -0,0 +1,129 @@
+"""
+Minimal SMTP server that accepts and discards mail: a local stand-in for
+exercising app.mailer without a real relay.
+
+    python -m bench.smtp_sink --port 1025
+    python -m bench.smtp_sink --port 1025 --fail-rate 0.2 --latency 0.05
+
+Speaks EHLO/HELO, AUTH PLAIN/LOGIN (any credentials), MAIL, RCPT, DATA,
+RSET, NOOP and QUIT. No STARTTLS, so point the app at it with
+SMTP_STARTTLS=0. Recipients containing "reject" get 550 at RCPT;
+--fail-rate answers that share of messages with 451 after DATA.
+"""
+import argparse
+import asyncio
+import random
+from email import message_from_bytes
+
+
+class SMTPSink:
+    def __init__(self, fail_rate: float = 0.0, latency: float = 0.0, verbose: bool = False):
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.verbose = verbose
+        self.messages = []  # (recipients, email.message.Message)
+        self.stats = {"connections": 0, "accepted": 0, "deferred": 0, "rejected": 0}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 1025):
+        return await asyncio.start_server(self._session, host, port)
+
+    async def _session(self, reader, writer):
+        self.stats["connections"] += 1
+
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    return
+                line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                verb = line.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    writer.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250-AUTH PLAIN LOGIN\r\n")
+                    await reply("250 SIZE 10485760")
+                elif verb == "HELO":
+                    await reply("250 smtp-sink")
+                elif verb == "AUTH":
+                    parts = line.split()
+                    if len(parts) == 2:  # credentials follow as continuation lines
+                        steps = 2 if parts[1].upper() == "LOGIN" else 1
+                        for _ in range(steps):
+                            await reply("334 ")
+                            await reader.readline()
+                    await reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    sender, recipients = line[10:].strip(), []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    address = line[8:].strip()
+                    if "reject" in address.lower():
+                        self.stats["rejected"] += 1
+                        await reply("550 5.1.1 Mailbox unavailable")
+                    else:
+                        recipients.append(address)
+                        await reply("250 OK")
+                elif verb == "DATA":
+                    if sender is None or not recipients:
+                        await reply("503 5.5.1 Bad sequence of commands")
+                        continue
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while (chunk := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        lines.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if random.random() < self.fail_rate:
+                        self.stats["deferred"] += 1
+                        await reply("451 4.3.0 Try again later")
+                    else:
+                        message = message_from_bytes(b"".join(lines))
+                        self.messages.append((recipients, message))
+                        self.stats["accepted"] += 1
+                        if self.verbose:
+                            print(f"{', '.join(recipients)}  {message['Subject']}")
+                        await reply("250 OK queued")
+                    sender, recipients = None, []
+                elif verb == "RSET":
+                    sender, recipients = None, []
+                    await reply("250 OK")
+                elif verb == "NOOP":
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    return
+                else:
+                    await reply("502 5.5.2 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before answering DATA")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.fail_rate, args.latency, verbose=True)
+    server = await sink.start(args.host, args.port)
+    print(f"smtp sink on {args.host}:{args.port} (Ctrl-C to stop)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(sink.stats)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
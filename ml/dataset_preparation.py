@@ -0,0 +1,386 @@
+"""
+Streaming training-set builder.
+
+Joins feedback -> outfits and, through the recommendation that produced
+the outfit, -> weather_data. Rows are read with a server-side cursor in
+fixed-size chunks and each chunk is written as memory-mappable .npy shards:
+
+    <out>/000001-X.npy     float32 (rows, n_features)
+    <out>/000001-y.npy     int8    (rows,)   1 = liked
+    <out>/000001-ids.npy   int64   (rows, 3) feedback_id, user_id, outfit_id
+    <out>/manifest.json    feature names, shard list, watermark, gaps
+
+The watermark is the highest feedback.id read, so later runs only read
+newer rows. SERIAL ids are drawn at insert, not at commit: a transaction
+still in flight can commit a lower id after a higher one was read. So
+every id missing below the watermark is kept as a gap and read again by
+the next runs until it shows up or is FEATURE_GAP_SECONDS old (rolled
+back inserts and deleted rows never show up). Late rows land in the next
+shard, so training follows shards, not ids. Training code opens shards
+with np.load(mmap_mode="r"). A build holds an exclusive flock on
+<out>/.lock, so the CLI and the API's online steps never interleave
+manifest writes. read_votes() follows the same {watermark, gaps} cursor
+for the collaborative NeighbourIndex (ml.recommender_model).
+
+    python -m ml.dataset_preparation --out data/features
+    python -m ml.dataset_preparation --out data/features --full   # rebuild
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import or_, select
+
+from app.database import engine
+from app.models import Feedback, Outfit, Recommendation, WeatherData
+from app.recommender import (
+    SEASONS, CATEGORIES, CONDITIONS, NO_RANGE,
+    season_code, category_code, condition_code, vote_arrays,
+)
+
+FEATURE_DIR = os.getenv("FEATURE_DIR", "data/features")
+CHUNK_ROWS = int(os.getenv("FEATURE_CHUNK_ROWS", "50000"))
+# longer than any feedback insert transaction can stay open
+GAP_SECONDS = int(os.getenv("FEATURE_GAP_SECONDS", "3600"))
+MAX_GAPS = int(os.getenv("FEATURE_MAX_GAPS", "1000"))  # id ranges re-read per run, newest kept
+MANIFEST = "manifest.json"
+LOCK = ".lock"
+
+NUMERIC_FEATURES = [
+    "temperature", "humidity", "wind_speed", "range_lo", "range_hi",
+    "below_range", "above_range", "in_range", "has_weather",
+]
+FEATURE_NAMES = (
+    NUMERIC_FEATURES
+    + [f"season_{s}" for s in SEASONS]
+    + [f"category_{c}" for c in CATEGORIES]
+    + [f"condition_{c}" for c in CONDITIONS]
+)
+_SEASON_AT = len(NUMERIC_FEATURES)
+_CATEGORY_AT = _SEASON_AT + len(SEASONS)
+_CONDITION_AT = _CATEGORY_AT + len(CATEGORIES)
+
+
+# --------------------------------------------------------
+# 🧮 Features (shared with serving in ml/recommender_model.py)
+# --------------------------------------------------------
+def build_features(temperature, humidity, wind_speed, has_weather, lo, hi, season, category, condition):
+    """
+    Columnar feature matrix. Every argument is an array of length n (or a
+    scalar, broadcast); season/category/condition are integer codes from
+    app.recommender. Numeric columns are scaled to roughly unit range.
+    """
+    season, category, condition = (np.asarray(a, dtype=np.intp) for a in (season, category, condition))
+    n = max(np.size(a) for a in (temperature, lo, season, category, condition))
+    has_weather = np.broadcast_to(np.asarray(has_weather, dtype=np.float32), (n,))
+    t = np.broadcast_to(np.asarray(temperature, dtype=np.float32), (n,)) * has_weather
+    lo = np.broadcast_to(np.asarray(lo, dtype=np.float32), (n,))
+    hi = np.broadcast_to(np.asarray(hi, dtype=np.float32), (n,))
+
+    X = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float32)
+    X[:, 0] = t / 10
+    X[:, 1] = np.broadcast_to(np.asarray(humidity, dtype=np.float32), (n,)) * has_weather / 100
+    X[:, 2] = np.broadcast_to(np.asarray(wind_speed, dtype=np.float32), (n,)) * has_weather / 10
+    X[:, 3] = np.clip(lo, -40, 50) / 10
+    X[:, 4] = np.clip(hi, -40, 50) / 10
+    X[:, 5] = np.maximum(lo - t, 0) * has_weather / 10
+    X[:, 6] = np.maximum(t - hi, 0) * has_weather / 10
+    X[:, 7] = ((lo <= t) & (t <= hi)) * has_weather
+    X[:, 8] = has_weather
+    rows = np.arange(n)
+    X[rows, _SEASON_AT + np.broadcast_to(season, (n,))] = 1
+    X[rows, _CATEGORY_AT + np.broadcast_to(category, (n,))] = 1
+    X[rows, _CONDITION_AT + np.broadcast_to(condition, (n,))] = 1
+    return X
+
+
+def _featurize_chunk(rows):
+    n = len(rows)
+    ids = np.empty((n, 3), dtype=np.int64)
+    y = np.empty(n, dtype=np.int8)
+    temperature = np.zeros(n, dtype=np.float32)
+    humidity = np.zeros(n, dtype=np.float32)
+    wind = np.zeros(n, dtype=np.float32)
+    has_weather = np.zeros(n, dtype=np.float32)
+    lo = np.empty(n, dtype=np.float32)
+    hi = np.empty(n, dtype=np.float32)
+    season = np.empty(n, dtype=np.intp)
+    category = np.empty(n, dtype=np.intp)
+    condition = np.empty(n, dtype=np.intp)
+
+    for i, row in enumerate(rows):
+        ids[i] = (row.feedback_id, row.user_id, row.outfit_id)
+        y[i] = 1 if row.liked else 0
+        lo[i], hi[i] = row.temperature_range or NO_RANGE
+        season[i] = season_code(row.season)
+        category[i] = category_code(row.category)
+        if row.temperature is not None:
+            temperature[i] = row.temperature
+            humidity[i] = row.humidity or 0
+            wind[i] = row.wind_speed or 0
+            has_weather[i] = 1
+            condition[i] = condition_code(row.condition)
+        else:
+            condition[i] = condition_code(row.weather_tag)
+
+    X = build_features(temperature, humidity, wind, has_weather, lo, hi, season, category, condition)
+    return X, y, ids
+
+
+# --------------------------------------------------------
+# 🗄 Streaming query
+# --------------------------------------------------------
+def training_query(after_id: int, gaps=()):
+    # weather of the latest recommendation of this outfit made before the vote
+    weather_id = (
+        select(Recommendation.weather_id)
+        .where(
+            Recommendation.user_id == Feedback.user_id,
+            Recommendation.outfit_id == Feedback.outfit_id,
+            Recommendation.created_at <= Feedback.created_at,
+        )
+        .order_by(Recommendation.created_at.desc())
+        .limit(1)
+        .correlate(Feedback)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            Feedback.id.label("feedback_id"), Feedback.user_id, Feedback.outfit_id,
+            Feedback.weather_tag, Feedback.liked,
+            Outfit.temperature_range, Outfit.season, Outfit.category,
+            WeatherData.temperature, WeatherData.condition, WeatherData.humidity, WeatherData.wind_speed,
+        )
+        .join(Outfit, Outfit.id == Feedback.outfit_id)
+        .outerjoin(WeatherData, WeatherData.id == weather_id)
+        # rows without a vote are read too, so their ids do not look like gaps
+        .where(_after(after_id, gaps))
+        .order_by(Feedback.id)
+    )
+
+
+def votes_query(after_id: int, gaps=()):
+    """Feedback with its outfit's archetype columns, for the NeighbourIndex."""
+    return (
+        select(
+            Feedback.id.label("feedback_id"), Feedback.user_id,
+            Outfit.category, Outfit.season, Outfit.color, Feedback.weather_tag, Feedback.liked,
+        )
+        .join(Outfit, Outfit.id == Feedback.outfit_id)
+        .where(_after(after_id, gaps))
+        .order_by(Feedback.id)
+    )
+
+
+def _after(after_id: int, gaps):
+    return or_(Feedback.id > after_id, *(Feedback.id.between(lo, hi) for lo, hi, _ in gaps))
+
+
+# --------------------------------------------------------
+# 💾 Shards + manifest
+# --------------------------------------------------------
+def read_manifest(out_dir: str = FEATURE_DIR) -> dict:
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"feature_names": FEATURE_NAMES, "watermark": 0, "gaps": [], "shards": []}
+    with open(path) as f:
+        return {"gaps": [], **json.load(f)}
+
+
+def _write_manifest(out_dir, manifest):
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+
+def _write_shard(out_dir, seq, X, y, ids):
+    name = f"{seq:06d}"
+    for suffix, arr in (("X", X), ("y", y), ("ids", ids)):
+        np.save(os.path.join(out_dir, f"{name}-{suffix}.npy"), arr)
+    return name
+
+
+def _holes(ids: np.ndarray, after: int, now: float) -> list:
+    """[lo, hi, first seen] for every id missing between `after` and the sorted `ids`."""
+    prev = np.concatenate([[after], ids[:-1]])
+    missing = ids - prev > 1
+    return [[int(a) + 1, int(b) - 1, now] for a, b in zip(prev[missing], ids[missing])]
+
+
+def _fill(gaps: list, found: np.ndarray) -> list:
+    """The gap ranges minus the sorted ids in `found`."""
+    left = []
+    for lo, hi, seen in gaps:
+        for f in found[(found >= lo) & (found <= hi)].tolist():
+            if f > lo:
+                left.append([lo, f - 1, seen])
+            lo = f + 1
+        if lo <= hi:
+            left.append([lo, hi, seen])
+    return left
+
+
+def _advance(cursor: dict, read: np.ndarray, after: int, now: float):
+    """Move a {watermark, gaps} cursor past one chunk of sorted ids read after `after`."""
+    old, new = read[read <= after], read[read > after]
+    gaps = _fill(cursor["gaps"], old) if len(old) else cursor["gaps"]
+    if len(new):
+        gaps = gaps + _holes(new, cursor["watermark"], now)
+        cursor["watermark"] = int(new[-1])
+    cursor["gaps"] = gaps[-MAX_GAPS:]
+
+
+def _live_gaps(gaps: list, now: float) -> list:
+    """Gaps still worth re-reading: younger than GAP_SECONDS, newest MAX_GAPS."""
+    return [g for g in gaps if now - g[2] < GAP_SECONDS][-MAX_GAPS:]
+
+
+def _store_chunk(out_dir, manifest, rows, after: int, now: float):
+    """Advance the manifest past one chunk and write its voted rows as a shard. Returns (rows, late rows)."""
+    _advance(manifest, np.fromiter((r.feedback_id for r in rows), dtype=np.int64, count=len(rows)), after, now)
+    voted = [r for r in rows if r.liked is not None]
+    late = 0
+    if voted:
+        X, y, ids = _featurize_chunk(voted)
+        name = _write_shard(out_dir, len(manifest["shards"]) + 1, X, y, ids)
+        manifest["shards"].append({"name": name, "rows": len(voted), "max_id": int(ids[-1, 0])})
+        late = int(np.count_nonzero(ids[:, 0] <= after))
+    # commit each shard as it lands, so an interrupted run resumes here
+    _write_manifest(out_dir, manifest)
+    return len(voted), late
+
+
+@contextlib.contextmanager
+def build_lock(out_dir: str = FEATURE_DIR, wait: bool = True):
+    """Exclusive lock on the feature dir; yields False if busy and not waiting."""
+    import fcntl
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, LOCK), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def build(out_dir: str = FEATURE_DIR, chunk_rows: int = CHUNK_ROWS, full: bool = False,
+                wait: bool = True) -> dict | None:
+    """
+    Append shards for feedback newer than the watermark or in a gap.
+    Returns a summary, or None if another build holds the lock and `wait`
+    is False.
+    """
+    with build_lock(out_dir, wait) as locked:
+        if not locked:
+            return None
+        return await _build(out_dir, chunk_rows, full)
+
+
+async def _build(out_dir, chunk_rows, full):
+    if full:
+        for name in os.listdir(out_dir):
+            if name != LOCK:  # others may be waiting on this very file
+                os.remove(os.path.join(out_dir, name))
+
+    manifest = read_manifest(out_dir)
+    if manifest["feature_names"] != FEATURE_NAMES:
+        raise RuntimeError("Feature layout changed; rebuild with --full")
+
+    started, written, late = time.perf_counter(), 0, 0
+    now = time.time()
+    manifest.setdefault("build", uuid.uuid4().hex)  # tells trainers a --full rebuild happened
+    manifest["gaps"] = _live_gaps(manifest["gaps"], now)
+    after = manifest["watermark"]
+    loop = asyncio.get_running_loop()
+    async with engine.connect() as conn:
+        result = await conn.stream(
+            training_query(after, manifest["gaps"]).execution_options(yield_per=chunk_rows)
+        )
+        async for rows in result.partitions(chunk_rows):
+            # featurizing and file writes stay off the loop (the API runs online steps)
+            voted, chunk_late = await loop.run_in_executor(None, _store_chunk, out_dir, manifest, rows, after, now)
+            written += voted
+            late += chunk_late
+
+    return {
+        "rows": written,
+        "late_rows": late,
+        "shards": len(manifest["shards"]),
+        "watermark": manifest["watermark"],
+        "gaps": len(manifest["gaps"]),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+async def read_votes(cursor: dict = None, chunk_rows: int = CHUNK_ROWS):
+    """
+    (user_ids, tags, items, values) arrays for NeighbourIndex.fit/add of
+    every vote past `cursor` ({"watermark", "gaps"} as in the manifest;
+    None reads them all), and the advanced cursor.
+    """
+    now = time.time()
+    cursor = {"watermark": 0, "gaps": []} if cursor is None else dict(cursor)
+    cursor["gaps"] = _live_gaps(cursor["gaps"], now)
+    after = cursor["watermark"]
+    parts = [vote_arrays([])]
+    async with engine.connect() as conn:
+        result = await conn.stream(votes_query(after, cursor["gaps"]).execution_options(yield_per=chunk_rows))
+        async for rows in result.partitions(chunk_rows):
+            _advance(cursor, np.fromiter((r.feedback_id for r in rows), dtype=np.int64, count=len(rows)),
+                     after, now)
+            parts.append(vote_arrays(
+                (r.user_id, r.category, r.season, r.color, r.weather_tag, r.liked, 1) for r in rows
+            ))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts)), cursor
+
+
+# --------------------------------------------------------
+# 📖 Zero-copy readers for training jobs
+# --------------------------------------------------------
+def iter_shards(out_dir: str = FEATURE_DIR, after_id: int = 0, skip: int = 0, stop: int = None):
+    """
+    Yield (X, y, ids) memory-mapped per shard in manifest positions
+    [skip, stop), optionally only rows past after_id.
+    """
+    for shard in read_manifest(out_dir)["shards"][skip:stop]:
+        if shard["max_id"] <= after_id:
+            continue
+        X, y, ids = (
+            np.load(os.path.join(out_dir, f"{shard['name']}-{suffix}.npy"), mmap_mode="r")
+            for suffix in ("X", "y", "ids")
+        )
+        if after_id:
+            keep = ids[:, 0] > after_id
+            X, y, ids = X[keep], y[keep], ids[keep]
+        yield X, y, ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=FEATURE_DIR)
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--full", action="store_true", help="discard existing shards and rebuild")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await build(args.out, args.chunk, args.full)
+        finally:
+            await engine.dispose()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,854 @@
+"""
+Online-updatable like/dislike model with versioned, memory-mapped artifacts.
+
+Layout under MODEL_DIR:
+
+    v000003/coef.npy       float32 (n_features,)   served via mmap
+    v000003/intercept.npy  float32 (1,)
+    v000003/meta.json      version, feature names, watermark, shards read, rows seen
+    v000003/state.joblib   SGDClassifier state, used only to keep training
+    CURRENT                "v000003" (swapped with os.replace)
+
+Training continues from the current version with partial_fit and
+publishes a new directory, then flips CURRENT. Trainers hold an
+exclusive flock on MODEL_DIR/.lock from load to publish, so concurrent
+ones queue instead of overwriting each other's steps. Serving workers notice the
+flip on their next get_model() call (checked at most every
+MODEL_POLL_SECONDS) and swap their reference; requests already holding
+the old model finish with it.
+
+    python -m ml.recommender_model train      # fold new feature shards in
+    python -m ml.recommender_model status
+
+The collaborative NeighbourIndex (users who voted like you, per weather
+tag) lives here too and is published the same way, under NEIGHBOURS_DIR
+(one .npy per array, plus meta.json with the feedback cursor). One build
+at a time folds the votes committed since the current version in, or
+refits from the whole table every NEIGHBOURS_REBUILD_SECONDS; workers
+memory-map the current version through a NeighbourHandle:
+
+    python -m ml.recommender_model neighbours          # new votes (or a due refit)
+    python -m ml.recommender_model neighbours --full   # refit now
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+
+from ml.dataset_preparation import FEATURE_DIR, FEATURE_NAMES, build_features, iter_shards, read_manifest
+
+MODEL_DIR = os.getenv("MODEL_DIR", "data/models")
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "5"))
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "5"))
+NEIGHBOURS_DIR = os.getenv("NEIGHBOURS_DIR", os.path.join(MODEL_DIR, "neighbours"))
+CURRENT = "CURRENT"
+LOCK = ".lock"
+
+
+class LinearModel:
+    """A published version, loaded read-only. Weights are shared page-cache mmaps."""
+    __slots__ = ("version", "coef", "intercept", "meta", "loaded_at", "load_seconds")
+
+    def __init__(self, path: str):
+        t0 = time.perf_counter()
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["feature_names"] != FEATURE_NAMES:
+            raise RuntimeError(f"{path}: feature layout does not match this build")
+        self.version = self.meta["version"]
+        self.coef = np.load(os.path.join(path, "coef.npy"), mmap_mode="r")
+        self.intercept = float(np.load(os.path.join(path, "intercept.npy"))[0])
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - t0
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """P(liked) per row of a build_features() matrix."""
+        return 1.0 / (1.0 + np.exp(-(X @ self.coef + self.intercept)))
+
+    def score_wardrobe(self, wardrobe, weather: np.ndarray) -> np.ndarray:
+        """P(liked) for every outfit in an app.recommender.Wardrobe under one weather vector."""
+        from app.recommender import TEMP, CONDITION, HUMIDITY, WIND
+        X = build_features(
+            weather[TEMP], weather[HUMIDITY], weather[WIND], 1.0,
+            wardrobe.lo, wardrobe.hi, wardrobe.season, wardrobe.category, int(weather[CONDITION]),
+        )
+        return self.predict_proba(X)
+
+    def score_wardrobe_batch(self, wardrobe, weathers: np.ndarray) -> np.ndarray:
+        """P(liked) as (m, n) for m weather rows (e.g. forecast hours), in one matrix product."""
+        from app.recommender import TEMP, CONDITION, HUMIDITY, WIND
+        m, n = len(weathers), len(wardrobe)
+        hour = np.repeat(np.arange(m), n)
+        X = build_features(
+            weathers[hour, TEMP], weathers[hour, HUMIDITY], weathers[hour, WIND], 1.0,
+            np.tile(wardrobe.lo, m), np.tile(wardrobe.hi, m),
+            np.tile(wardrobe.season, m), np.tile(wardrobe.category, m), weathers[hour, CONDITION],
+        )
+        return self.predict_proba(X).reshape(m, n)
+
+
+# --------------------------------------------------------
+# 🔄 Hot-swappable handle used by the API workers
+# --------------------------------------------------------
+class ModelHandle:
+    def __init__(self, model_dir: str = MODEL_DIR, loader=None):
+        self.model_dir = model_dir
+        self.loader = loader or LinearModel  # path -> object with .meta["name"]
+        self.model = None
+        self._checked_at = 0.0
+        self._pointer_mtime = None
+        self.errors = 0
+
+    def _pointer(self):
+        return os.path.join(self.model_dir, CURRENT)
+
+    def reload(self):
+        """Load whatever CURRENT points at, if it changed. Never raises."""
+        try:
+            mtime = os.stat(self._pointer()).st_mtime_ns
+        except FileNotFoundError:
+            return self.model
+        if mtime == self._pointer_mtime and self.model is not None:
+            return self.model
+        try:
+            with open(self._pointer()) as f:
+                name = f.read().strip()
+            if self.model is None or self.model.meta.get("name") != name:
+                model = self.loader(os.path.join(self.model_dir, name))
+                self.model = model  # atomic swap; in-flight users keep the old object
+            self._pointer_mtime = mtime
+        except Exception:
+            self.errors += 1
+        return self.model
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= MODEL_POLL_SECONDS:
+            self._checked_at = now
+            self.reload()
+        return self.model
+
+    def diagnostics(self) -> dict:
+        m = self.model
+        if m is None:
+            return {"version": None, "model_dir": self.model_dir, "errors": self.errors}
+        return {
+            "version": m.version,
+            "loaded_at": m.loaded_at,
+            "load_ms": round(m.load_seconds * 1000, 3),
+            "published_at": m.meta["published_at"],
+            "rows_seen": m.meta["rows_seen"],
+            "errors": self.errors,
+        }
+
+
+_handle = None
+
+
+def get_handle() -> ModelHandle:
+    global _handle
+    if _handle is None:
+        _handle = ModelHandle()
+    return _handle
+
+
+def get_model():
+    """Current LinearModel or None if nothing has been published yet."""
+    return get_handle().get()
+
+
+# --------------------------------------------------------
+# 👥 Collaborative neighbours
+# --------------------------------------------------------
+NEIGHBOURS_K = int(os.getenv("NEIGHBOURS_K", "20"))
+NEIGHBOURS_BLOCK = int(os.getenv("NEIGHBOURS_BLOCK", "2048"))  # users per sparse product
+NEIGHBOURS_MIN_SIMILARITY = float(os.getenv("NEIGHBOURS_MIN_SIMILARITY", "0.1"))
+NEIGHBOURS_CANDIDATES = int(os.getenv("NEIGHBOURS_CANDIDATES", "64"))  # users per archetype posting list, 0 = exact
+NEIGHBOURS_SHRINK = 1.0  # similarity mass a prediction needs before it counts fully
+NEIGHBOURS_REBUILD_SECONDS = float(os.getenv("NEIGHBOURS_REBUILD_SECONDS", "3600"))  # refit from the table
+
+
+class _TagState:
+    """One weather tag's matrices. Replaced whole, never mutated, so readers need no lock."""
+    __slots__ = ("votes", "unit", "nbr", "sim")
+
+    def __init__(self, votes, unit, nbr, sim):
+        self.votes, self.unit, self.nbr, self.sim = votes, unit, nbr, sim
+
+
+def _gather(matrix, rows: np.ndarray):
+    """(owner, at): for every stored entry of matrix[rows], its position in `rows` and in matrix.data."""
+    lengths = np.diff(matrix.indptr)[rows]
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    at = np.repeat(matrix.indptr[rows], lengths) + offsets
+    return owner, at
+
+
+def _unit_rows(votes):
+    """Rows scaled to unit L2 norm, so unit @ unit.T is cosine similarity."""
+    from scipy import sparse
+
+    votes.sort_indices()  # fixed summation order: equal rows give bit-equal dot products
+    norms = np.sqrt(np.asarray(votes.power(2).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    unit = (sparse.diags_array(inv.astype(np.float32)) @ votes).tocsr()
+    unit.sort_indices()
+    return unit
+
+
+def _tiebreak(ids: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """User id per column (padding last), the tie-break wherever similarities are equal."""
+    return np.where(cols >= 0, ids[np.maximum(cols, 0)], np.iinfo(np.int64).max)
+
+
+def _postings(unit, ids: np.ndarray):
+    """
+    unit.T (archetypes x users), each archetype's list cut to
+    NEIGHBOURS_CANDIDATES users. The cut keeps the users with the smallest
+    multiplicative hash of their user id (`ids`, row -> user id), a fixed
+    pseudo-random sample, so the result depends only on the votes and not
+    on the order rows were assigned in: apply() and fit() agree.
+    """
+    postings = unit.T.tocsr()
+    cap = NEIGHBOURS_CANDIDATES
+    if not cap or np.diff(postings.indptr).max(initial=0) <= cap:
+        return postings
+    item = np.repeat(np.arange(postings.shape[0]), np.diff(postings.indptr))
+    user = ids[postings.indices]
+    key = (user.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)
+    order = np.lexsort((user, key, item))
+    pos = np.arange(len(order)) - np.searchsorted(item[order], item[order])
+    chosen = np.sort(order[pos < cap])
+    from scipy import sparse
+    return sparse.csr_array(
+        (postings.data[chosen], (item[chosen], postings.indices[chosen])), shape=postings.shape
+    )
+
+
+_TOPK_CHUNK = 1 << 22  # dense cells per top-k chunk
+
+
+def _top_k_rows(product, exclude: np.ndarray, k: int, ids: np.ndarray):
+    """
+    Top-k (column, value) per row of a CSR product, best first, -1 / 0
+    padded; `exclude[i]` (the user's own column) and values <= 0 are skipped. Rows are laid
+    out dense a chunk at a time (at most _TOPK_CHUNK cells) and partitioned,
+    so nothing is fully sorted. Equal values are ranked by user id
+    (`ids[column]`), so the result does not depend on the chunk layout.
+    """
+    n = product.shape[0]
+    nbr = np.full((n, k), -1, dtype=np.int32)
+    sim = np.zeros((n, k), dtype=np.float32)
+    lengths = np.diff(product.indptr)
+    lo = 0
+    while lo < n:
+        width = int(lengths[lo:].max(initial=0))
+        if width == 0:
+            break
+        hi = min(n, lo + max(1, _TOPK_CHUNK // width))
+        a, b = product.indptr[lo], product.indptr[hi]
+        r = np.repeat(np.arange(hi - lo), lengths[lo:hi])
+        pos = np.arange(b - a) - (product.indptr[lo:hi] - a)[r]
+        vals = np.full((hi - lo, width), -1.0, dtype=np.float32)
+        cols = np.full((hi - lo, width), -1, dtype=np.int32)
+        vals[r, pos], cols[r, pos] = product.data[a:b], product.indices[a:b]
+        vals[(cols == exclude[lo:hi, None]) | (vals <= 0)] = -1.0
+        tie = _tiebreak(ids, np.where(vals >= 0, cols, -1))
+        if width > k:
+            # everything above the k-th value, then that value's ties by user id
+            kth = -np.partition(-vals, k - 1, axis=1)[:, k - 1:k]
+            rank = np.where(vals > kth, -1, np.where(vals == kth, tie, np.iinfo(np.int64).max))
+            part = np.argpartition(rank, k - 1, axis=1)[:, :k]
+            vals, cols, tie = (np.take_along_axis(a, part, 1) for a in (vals, cols, tie))
+        order = np.lexsort((tie, -vals), axis=1)
+        vals, cols = np.take_along_axis(vals, order, 1), np.take_along_axis(cols, order, 1)
+        found = vals >= 0
+        keep = min(k, width)
+        nbr[lo:hi, :keep] = np.where(found, cols, -1)
+        sim[lo:hi, :keep] = np.where(found, vals, 0)
+        lo = hi
+    return nbr, sim
+
+
+def _cosine(unit, block: np.ndarray, cand: np.ndarray) -> np.ndarray:
+    """Exact unit[block[i]] . unit[cand[i, j]] for every candidate; -1 where cand is padding."""
+    dense = unit[block].toarray()  # (len(block), archetypes): small, archetypes are few
+    i, j = np.nonzero(cand >= 0)
+    owner, at = _gather(unit, cand[i, j])
+    dots = np.bincount(owner, dense[i[owner], unit.indices[at]] * unit.data[at], minlength=len(i))
+    out = np.full(cand.shape, -1.0, dtype=np.float32)
+    out[i, j] = dots
+    return out
+
+
+def _top_neighbours(unit, rows: np.ndarray, k: int, ids: np.ndarray):
+    """
+    (nbr, sim) of shape (len(rows), k) for the given rows: the k most
+    similar other users, best first, -1 / 0 padded. Computed
+    NEIGHBOURS_BLOCK rows at a time as unit[block] @ postings.
+
+    Capped postings make this approximate. Candidates are the users who
+    share an archetype within its sample, so a block costs rows x votes x
+    the cap instead of growing with the user count. A sampled product only
+    sees part of a pair's shared archetypes, so it only shortlists 2k
+    candidates per row; their similarities are then recomputed exactly.
+    Every tie is broken by user id, so a row's list depends only on the
+    votes, never on which other rows shared its block.
+    """
+    nbr = np.full((len(rows), k), -1, dtype=np.int32)
+    sim = np.zeros((len(rows), k), dtype=np.float32)
+    unit_t = _postings(unit, ids)
+    for start in range(0, len(rows), NEIGHBOURS_BLOCK):
+        block = rows[start:start + NEIGHBOURS_BLOCK]
+        cand, _ = _top_k_rows((unit[block] @ unit_t).tocsr(), block, 2 * k, ids)
+        exact = _cosine(unit, block, cand)
+        exact[exact < NEIGHBOURS_MIN_SIMILARITY] = -1.0
+        order = np.lexsort((_tiebreak(ids, cand), -exact), axis=1)[:, :k]
+        cand, exact = np.take_along_axis(cand, order, 1), np.take_along_axis(exact, order, 1)
+        found = exact >= 0
+        end = start + len(block)
+        nbr[start:end] = np.where(found, cand, -1)
+        sim[start:end] = np.where(found, exact, 0)
+    return nbr, sim
+
+
+def _merge_reverse(nbr, sim, rows, ids: np.ndarray):
+    """Similarity is symmetric: put each refreshed row into the lists of its own neighbours."""
+    n, k = nbr.shape
+    found = nbr[rows]
+    valid = found >= 0
+    target = found[valid].astype(np.int64)  # whose list changes
+    source = np.repeat(rows, valid.sum(axis=1))  # the refreshed row to insert
+    scores = sim[rows][valid]
+    if not len(target):
+        return
+    lists = np.unique(target)
+    old_row = np.repeat(lists, k)
+    old_nbr, old_sim = nbr[lists].ravel().astype(np.int64), sim[lists].ravel()
+    # drop stale entries for the rows being re-inserted, and the padding
+    keep = (old_nbr >= 0) & ~np.isin(old_row * n + old_nbr, target * n + source)
+    row = np.concatenate([old_row[keep], target])
+    other = np.concatenate([old_nbr[keep], source])
+    score = np.concatenate([old_sim[keep], scores])
+    order = np.lexsort((ids[other], -score, row))
+    row, other, score = row[order], other[order], score[order]
+    pos = np.arange(len(row)) - np.searchsorted(row, row)
+    top = pos < k
+    nbr[lists], sim[lists] = -1, 0
+    nbr[row[top], pos[top]] = other[top]
+    sim[row[top], pos[top]] = score[top]
+
+
+class NeighbourIndex:
+    """
+    User-user neighbours per weather tag over a sparse vote matrix.
+
+    Outfits belong to one user, so the item axis is the outfit archetype
+    (category x season x color, app.recommender.archetype_code): two users
+    are alike when they voted the same kinds of clothes the same way under
+    the same weather. Per tag:
+
+        votes   CSR users x archetypes, likes minus dislikes
+        unit    votes with unit-norm rows (cosine similarity)
+        nbr     (users, K) int32 rows of the K most similar users, -1 padded
+        sim     (users, K) float32 their similarities
+
+    add() buffers new votes; apply() folds them in, recomputes the
+    neighbour lists of just the users who voted and merges those users
+    into their neighbours' lists. A voter's refreshed list is the list a
+    fit() on the same votes would give it, plus any better voter merged in
+    from the other side, so it is never worse (bench/bench_neighbours.py
+    checks this). Other users' lists only gain voters: one who drops out
+    of someone's list through a new vote stays there, with its old
+    similarity, until the next fit().
+
+    save() writes every array as .npy; load() memory-maps them back, so
+    the workers serving one published version share its pages.
+    """
+
+    def __init__(self, n_tags: int, n_items: int, k: int = NEIGHBOURS_K):
+        self.n_tags, self.n_items, self.k = n_tags, n_items, k
+        self._row = {}  # user id -> row, shared by all tags; None when loaded (see _lookup)
+        self._ids = np.empty(0, dtype=np.int64)  # row -> user id
+        self._sorted_ids = self._sorted_rows = None
+        self._tags = [None] * n_tags
+        self._pending = []
+        self.built_at = None
+        self.stats = {"fit_seconds": None, "applies": 0, "apply_seconds": 0.0, "votes_applied": 0}
+        self.meta, self.version, self.loaded_at, self.load_seconds = {}, None, None, None
+
+    def _lookup(self, user_id: int):
+        """Row of a user id, or None. A loaded index bisects the sorted id array instead of a dict."""
+        if self._row is not None:
+            return self._row.get(user_id)
+        at = int(np.searchsorted(self._sorted_ids, user_id))
+        if at < len(self._sorted_ids) and self._sorted_ids[at] == user_id:
+            return int(self._sorted_rows[at])
+        return None
+
+    def _rows(self, user_ids: np.ndarray) -> np.ndarray:
+        if self._row is None:
+            self._row = dict(zip(self._ids.tolist(), range(len(self._ids))))
+        row = self._row
+        for uid in np.unique(user_ids).tolist():
+            if uid not in row:
+                row[uid] = len(row)
+        if len(row) > len(self._ids):
+            self._ids = np.fromiter(row, dtype=np.int64, count=len(row))
+        return np.array([row[u] for u in user_ids.tolist()], dtype=np.int64)
+
+    def _matrix(self, rows, items, values, n_rows):
+        from scipy import sparse
+
+        return sparse.csr_array(
+            (np.asarray(values, dtype=np.float32), (rows, np.asarray(items, dtype=np.int64))),
+            shape=(n_rows, self.n_items),
+        )  # duplicate (row, item) pairs are summed
+
+    def fit(self, user_ids, tags, items, values):
+        """Build every tag from scratch from parallel vote arrays (value = +likes / -dislikes)."""
+        t0 = time.perf_counter()
+        user_ids, tags = np.asarray(user_ids, dtype=np.int64), np.asarray(tags, dtype=np.intp)
+        rows = self._rows(user_ids)
+        for tag in range(self.n_tags):
+            mask = tags == tag
+            votes = self._matrix(rows[mask], np.asarray(items)[mask], np.asarray(values)[mask], len(self._row))
+            unit = _unit_rows(votes)
+            nbr, sim = _top_neighbours(unit, np.arange(len(self._row)), self.k, self._ids)
+            self._tags[tag] = _TagState(votes, unit, nbr, sim)
+        self.built_at = time.time()
+        self.stats["fit_seconds"] = round(time.perf_counter() - t0, 3)
+        return self
+
+    def add(self, user_ids, tags, items, values):
+        """Buffer new votes until the next apply()."""
+        self._pending.append(tuple(np.asarray(a) for a in (user_ids, tags, items, values)))
+
+    def apply(self) -> int:
+        """Fold buffered votes in; refresh the neighbour lists of the users who voted."""
+        if not self._pending:
+            return 0
+        t0 = time.perf_counter()
+        pending, self._pending = self._pending, []
+        user_ids, tags, items, values = (np.concatenate(parts) for parts in zip(*pending))
+        rows = self._rows(user_ids.astype(np.int64))
+        n = len(self._row)
+        for tag in np.unique(tags).tolist():
+            mask = tags == tag
+            state = self._tags[tag]
+            votes = state.votes.copy() if state is not None else self._matrix([], [], [], 0)
+            votes.resize((n, self.n_items))
+            votes = (votes + self._matrix(rows[mask], items[mask], values[mask], n)).tocsr()
+            votes.eliminate_zeros()  # a like cancelled by a dislike
+            unit = _unit_rows(votes)
+            nbr = np.full((n, self.k), -1, dtype=np.int32)
+            sim = np.zeros((n, self.k), dtype=np.float32)
+            if state is not None:
+                nbr[:len(state.nbr)], sim[:len(state.sim)] = state.nbr, state.sim
+            dirty = np.unique(rows[mask])
+            nbr[dirty], sim[dirty] = _top_neighbours(unit, dirty, self.k, self._ids)
+            _merge_reverse(nbr, sim, dirty, self._ids)
+            self._tags[tag] = _TagState(votes, unit, nbr, sim)
+        self.stats["applies"] += 1
+        self.stats["votes_applied"] += len(user_ids)
+        self.stats["apply_seconds"] = round(self.stats["apply_seconds"] + time.perf_counter() - t0, 3)
+        return len(user_ids)
+
+    def neighbours(self, user_id: int, tag: int):
+        """(row ids, similarities) of a user's neighbours under `tag`: an O(k) array lookup."""
+        row, state = self._lookup(user_id), self._tags[tag]
+        if row is None or state is None or row >= len(state.nbr):
+            return None, None
+        nbr, sim = state.nbr[row], state.sim[row]
+        valid = nbr >= 0
+        return nbr[valid], sim[valid]
+
+    def predict(self, user_id: int, tag: int):
+        """
+        (n_items,) neighbour approval in [-1, 1] per archetype: the
+        similarity-weighted balance of the neighbours' likes and dislikes,
+        shrunk towards 0 when few similar users voted. None if no neighbours.
+        """
+        nbr, sim = self.neighbours(user_id, tag)
+        if nbr is None or not len(nbr):
+            return None
+        votes = self._tags[tag].votes
+        owner, at = _gather(votes, nbr)  # straight from indptr, no scipy slicing per request
+        items, weights = votes.indices[at], sim[owner]
+        agree = np.bincount(items, weights * np.sign(votes.data[at]), minlength=self.n_items)
+        weight = np.bincount(items, weights, minlength=self.n_items)
+        return agree / (weight + NEIGHBOURS_SHRINK)
+
+    def save(self, path: str) -> list:
+        """Write every array under `path` (an existing directory); returns the tags written."""
+        order = np.argsort(self._ids, kind="stable")
+        arrays = {"ids": self._ids, "sorted_ids": self._ids[order], "sorted_rows": order.astype(np.int64)}
+        tags = []
+        for tag, state in enumerate(self._tags):
+            if state is None:
+                continue
+            tags.append(tag)
+            for name, matrix in (("votes", state.votes), ("unit", state.unit)):
+                for part in ("data", "indices", "indptr"):
+                    arrays[f"t{tag}-{name}-{part}"] = getattr(matrix, part)
+            arrays[f"t{tag}-nbr"], arrays[f"t{tag}-sim"] = state.nbr, state.sim
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        return tags
+
+    @classmethod
+    def load(cls, path: str):
+        """A published version (see publish_neighbours); every array is a read-only mmap."""
+        from scipy import sparse
+
+        t0 = time.perf_counter()
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(meta["n_tags"], meta["n_items"], meta["k"])
+
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        index._row = None
+        index._ids, index._sorted_ids, index._sorted_rows = array("ids"), array("sorted_ids"), array("sorted_rows")
+        for tag in meta["tags"]:
+            # a tag apply() did not touch keeps its old row count, so size each one by its indptr
+            votes, unit = (
+                sparse.csr_array(tuple(parts), shape=(len(parts[2]) - 1, index.n_items), copy=False)
+                for parts in ([array(f"t{tag}-{name}-{part}") for part in ("data", "indices", "indptr")]
+                              for name in ("votes", "unit"))
+            )
+            index._tags[tag] = _TagState(votes, unit, array(f"t{tag}-nbr"), array(f"t{tag}-sim"))
+        index.meta, index.version = meta, meta["version"]
+        index.built_at, index.stats = meta["built_at"], meta["stats"]
+        index.loaded_at, index.load_seconds = time.time(), time.perf_counter() - t0
+        return index
+
+    def diagnostics(self) -> dict:
+        states = [s for s in self._tags if s is not None]
+        return {
+            "users": len(self._ids),
+            "votes_nnz": sum(s.votes.nnz for s in states),
+            "k": self.k,
+            "built_at": self.built_at,
+            "pending": sum(len(p[0]) for p in self._pending),
+            **self.stats,
+        }
+
+
+class NeighbourHandle(ModelHandle):
+    """ModelHandle over NEIGHBOURS_DIR: the published NeighbourIndex, memory-mapped."""
+
+    def __init__(self, model_dir: str = NEIGHBOURS_DIR):
+        super().__init__(model_dir, loader=NeighbourIndex.load)
+
+    def diagnostics(self) -> dict:
+        m = self.model
+        if m is None:
+            return {"version": None, "model_dir": self.model_dir, "errors": self.errors}
+        return {
+            "version": m.version,
+            "loaded_at": m.loaded_at,
+            "load_ms": round(m.load_seconds * 1000, 3),
+            "published_at": m.meta["published_at"],
+            "watermark": m.meta["cursor"]["watermark"],
+            "errors": self.errors,
+            **m.diagnostics(),
+        }
+
+
+_neighbour_handle = None
+
+
+def get_neighbour_handle() -> NeighbourHandle:
+    global _neighbour_handle
+    if _neighbour_handle is None:
+        _neighbour_handle = NeighbourHandle()
+    return _neighbour_handle
+
+
+def get_neighbours():
+    """Current published NeighbourIndex or None if nothing has been built yet."""
+    return get_neighbour_handle().get()
+
+
+# --------------------------------------------------------
+# 🏋️ Incremental training + publishing
+# --------------------------------------------------------
+def _current_name(model_dir):
+    try:
+        with open(os.path.join(model_dir, CURRENT)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+@contextlib.contextmanager
+def trainer_lock(model_dir: str = MODEL_DIR, wait: bool = True):
+    """
+    Exclusive lock on the model dir for one load -> fit -> publish cycle.
+    Yields False instead of blocking if it is busy and `wait` is False.
+    """
+    import fcntl
+
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, LOCK), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_trainer(model_dir: str = MODEL_DIR):
+    """(SGDClassifier, meta) continuing from CURRENT, or a fresh one."""
+    import joblib
+    from sklearn.linear_model import SGDClassifier
+
+    name = _current_name(model_dir)
+    if name is None:
+        clf = SGDClassifier(loss="log_loss", alpha=1e-4, learning_rate="optimal")
+        return clf, {"version": 0, "watermark": 0, "rows_seen": 0}
+    path = os.path.join(model_dir, name)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return joblib.load(os.path.join(path, "state.joblib")), meta
+
+
+def partial_fit(clf, X: np.ndarray, y: np.ndarray):
+    clf.partial_fit(np.asarray(X), np.asarray(y), classes=np.array([0, 1]))
+
+
+def publish(clf, meta: dict, model_dir: str = MODEL_DIR) -> str:
+    """
+    Write a new version directory, then atomically point CURRENT at it.
+    Call under trainer_lock(), with meta from load_trainer().
+    """
+    import joblib
+
+    previous = _current_name(model_dir)
+    name, path = _new_version(model_dir, meta["version"] + 1)
+
+    np.save(os.path.join(path, "coef.npy"), clf.coef_[0].astype(np.float32))
+    np.save(os.path.join(path, "intercept.npy"), clf.intercept_.astype(np.float32))
+    joblib.dump(clf, os.path.join(path, "state.joblib"))
+    meta = {
+        **meta, "version": int(name[1:]), "name": name,
+        "feature_names": FEATURE_NAMES, "published_at": time.time(),
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    _point(model_dir, name, previous)
+    return name
+
+
+def _new_version(model_dir, version):
+    """(name, path) of a new, empty version directory numbered `version` or the next free one."""
+    os.makedirs(model_dir, exist_ok=True)
+    while True:
+        name = f"v{version:06d}"
+        try:
+            os.mkdir(os.path.join(model_dir, name))  # exclusive: concurrent trainers can't collide
+            return name, os.path.join(model_dir, name)
+        except FileExistsError:
+            version += 1
+
+
+def _point(model_dir, name, previous):
+    """Atomically point CURRENT at `name`, then prune versions retired before `previous`."""
+    tmp = os.path.join(model_dir, f"{CURRENT}.{name}.tmp")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(model_dir, CURRENT))
+    if previous is not None:
+        _prune(model_dir, keep=MODEL_KEEP_VERSIONS, before=previous)
+
+
+def _prune(model_dir, keep, before):
+    """
+    Drop all but the newest `keep` versions, and only ones older than
+    `before` (what CURRENT named until this publish): a worker that read
+    the old pointer may still be opening that directory. Unlinking is
+    safe for workers that already mmap an old version.
+    """
+    import shutil
+
+    versions = sorted(d for d in os.listdir(model_dir) if d.startswith("v") and d[1:].isdigit())
+    for name in versions[:-keep]:
+        if name < before:
+            shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+
+def train(feature_dir: str = FEATURE_DIR, model_dir: str = MODEL_DIR):
+    """
+    Fold every feature shard the model has not seen into a new version.
+    Shards are followed by position, since a late-committed row lands in a
+    later shard below the id watermark. After a --full rebuild of the
+    features (a new manifest "build"), only rows past the watermark count.
+    """
+    with trainer_lock(model_dir):
+        return _train(feature_dir, model_dir)
+
+
+def _train(feature_dir, model_dir):
+    clf, meta = load_trainer(model_dir)
+    manifest = read_manifest(feature_dir)
+    seen, stop = meta.get("features", {}), len(manifest["shards"])  # a concurrent build only appends
+    if "shards" in seen and seen.get("build") == manifest.get("build"):
+        shards = iter_shards(feature_dir, skip=seen["shards"], stop=stop)
+    else:
+        shards = iter_shards(feature_dir, after_id=meta["watermark"], stop=stop)
+    rows = 0
+    watermark = meta["watermark"]
+    for X, y, ids in shards:
+        if len(y):
+            partial_fit(clf, X, y)
+            rows += len(y)
+            watermark = max(watermark, int(ids[:, 0].max()))
+    if not rows:
+        return None
+    meta = {
+        **meta, "watermark": watermark, "rows_seen": meta["rows_seen"] + rows,
+        "features": {"build": manifest.get("build"), "shards": stop},
+    }
+    return publish(clf, meta, model_dir), rows
+
+
+def update(X: np.ndarray, y: np.ndarray, watermark: int = None, model_dir: str = MODEL_DIR):
+    """Apply one online step from fresh feedback rows and publish it."""
+    if not len(y):
+        return None
+    with trainer_lock(model_dir):
+        clf, meta = load_trainer(model_dir)
+        partial_fit(clf, X, y)
+        meta = {**meta, "rows_seen": meta["rows_seen"] + len(y)}
+        if watermark is not None:
+            meta["watermark"] = max(meta["watermark"], watermark)
+        return publish(clf, meta, model_dir)
+
+
+# --------------------------------------------------------
+# 👥 Neighbour index builds + publishing
+# --------------------------------------------------------
+def publish_neighbours(index: NeighbourIndex, meta: dict, out_dir: str = NEIGHBOURS_DIR) -> str:
+    """Write `index` as a new version and point CURRENT at it. Call under trainer_lock(out_dir)."""
+    index.apply()
+    previous = _current_name(out_dir)
+    name, path = _new_version(out_dir, int(previous[1:]) + 1 if previous else 1)
+    tags = index.save(path)
+    meta = {
+        **meta, "version": int(name[1:]), "name": name, "published_at": time.time(),
+        "n_tags": index.n_tags, "n_items": index.n_items, "k": index.k, "tags": tags,
+        "users": len(index._ids), "built_at": index.built_at, "stats": index.stats,
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    _point(out_dir, name, previous)
+    return name
+
+
+def _open_neighbours(out_dir: str, full: bool, now: float):
+    """The published index to extend, or None when it has to be refitted."""
+    name = _current_name(out_dir)
+    if full or name is None:
+        return None
+    index = NeighbourIndex.load(os.path.join(out_dir, name))
+    return None if now - index.meta["fitted_at"] >= NEIGHBOURS_REBUILD_SECONDS else index
+
+
+def _refit_neighbours(votes, meta: dict, out_dir: str):
+    from app.recommender import ARCHETYPES, CONDITIONS
+
+    index = NeighbourIndex(len(CONDITIONS), ARCHETYPES)
+    index.fit(*votes)
+    return index, publish_neighbours(index, meta, out_dir)
+
+
+def _extend_neighbours(index: NeighbourIndex, votes, meta: dict, out_dir: str) -> str:
+    index.add(*votes)
+    return publish_neighbours(index, meta, out_dir)
+
+
+async def build_neighbours(full: bool = False, out_dir: str = NEIGHBOURS_DIR, wait: bool = True):
+    """
+    Publish a NeighbourIndex with every vote committed so far. The votes
+    past the current version's feedback cursor are folded in with
+    add()/apply(); the index is refitted from the whole table instead if
+    `full`, if nothing is published yet, or if the last fit is
+    NEIGHBOURS_REBUILD_SECONDS old (lists that lost a voter catch up then).
+    Returns a summary, or None if another build holds the lock and `wait`
+    is False. Only the vote reads run on the loop: loading, fitting and
+    publishing go to the executor.
+    """
+    import asyncio
+
+    from ml.dataset_preparation import read_votes
+
+    with trainer_lock(out_dir, wait) as locked:
+        if not locked:
+            return None
+        started, now = time.perf_counter(), time.time()
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, _open_neighbours, out_dir, full, now)
+        refit = index is None
+        votes, cursor = await read_votes(None if refit else index.meta["cursor"])
+        published = None
+        if refit:
+            index, published = await loop.run_in_executor(
+                None, _refit_neighbours, votes, {"cursor": cursor, "fitted_at": now}, out_dir
+            )
+        elif len(votes[0]) or cursor != index.meta["cursor"]:  # else nothing new: keep the version
+            published = await loop.run_in_executor(
+                None, _extend_neighbours, index, votes, {"cursor": cursor, "fitted_at": index.meta["fitted_at"]}, out_dir
+            )
+        return {
+            "published": published,
+            "refit": refit,
+            "votes": len(votes[0]),
+            "users": len(index._ids),
+            "watermark": cursor["watermark"],
+            "gaps": len(cursor["gaps"]),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["train", "neighbours", "status"])
+    parser.add_argument("--feature-dir", default=FEATURE_DIR)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--neighbours-dir", default=NEIGHBOURS_DIR)
+    parser.add_argument("--full", action="store_true", help="neighbours: refit from the whole feedback table")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        result = train(args.feature_dir, args.model_dir)
+        print("Nothing new to train on" if result is None else f"Published {result[0]} (+{result[1]} rows)")
+    elif args.command == "neighbours":
+        import asyncio
+
+        from app.database import engine
+
+        async def run():
+            try:
+                return await build_neighbours(args.full, args.neighbours_dir)
+            finally:
+                await engine.dispose()
+
+        print(asyncio.run(run()))
+    else:
+        for handle in (ModelHandle(args.model_dir), NeighbourHandle(args.neighbours_dir)):
+            handle.reload()
+            print(handle.diagnostics())
+
+
+if __name__ == "__main__":
+    main()
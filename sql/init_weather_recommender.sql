@@ -5,6 +5,7 @@
 -- Enable useful extensions
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+CREATE EXTENSION IF NOT EXISTS "btree_gist";
 
 -- =========================
 -- USERS
@@ -14,6 +15,7 @@ CREATE TABLE IF NOT EXISTS users (
     email           VARCHAR(255) UNIQUE NOT NULL,
     password_hash   TEXT NOT NULL,
     name            VARCHAR(100),                
+    city            VARCHAR(100),
     is_active       BOOLEAN DEFAULT FALSE,
     created_at      TIMESTAMP DEFAULT now()
 );
@@ -30,9 +32,16 @@ CREATE TABLE IF NOT EXISTS outfits (
     temperature_range INT[] CHECK (array_length(temperature_range, 1) = 2),
     color             VARCHAR(30),
     image_path        TEXT,
-    created_at        TIMESTAMP DEFAULT now()
+    created_at        TIMESTAMP DEFAULT now(),
+    -- Derived from temperature_range; NULL range means "any temperature"
+    temp_range        int4range GENERATED ALWAYS AS
+                          (int4range(temperature_range[1], temperature_range[2], '[]')) STORED
 );
 
+-- "Outfits of user X suitable at T °C": WHERE user_id = X AND temp_range @> T
+CREATE INDEX IF NOT EXISTS ix_outfits_user_temp_range
+    ON outfits USING gist (user_id, temp_range);
+
 -- =========================
 -- FEEDBACK
 -- =========================
@@ -46,44 +55,283 @@ CREATE TABLE IF NOT EXISTS feedback (
 );
 
 -- =========================
--- WEATHER DATA
+-- WEATHER DATA (one partition per day, see TIME PARTITIONS below)
 -- =========================
 CREATE TABLE IF NOT EXISTS weather_data (
-    id           SERIAL PRIMARY KEY,
+    id           SERIAL,
     user_id      INT REFERENCES users(id) ON DELETE SET NULL,
     city         VARCHAR(100),
+    cell         VARCHAR(12),   -- geohash cell (app.geo); NULL for unresolved names
     temperature  FLOAT,
     condition    VARCHAR(50),
     humidity     INT,
     wind_speed   FLOAT,
-    fetched_at   TIMESTAMP DEFAULT now()
-);
+    fetched_at   TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, fetched_at)
+) PARTITION BY RANGE (fetched_at);
+
+-- "Latest observation for a city" is an index-only scan
+CREATE INDEX IF NOT EXISTS ix_weather_data_city_fetched_at
+    ON weather_data (city, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed);
+
+-- Same lookup keyed by geohash cell, which is how the app stores weather now
+CREATE INDEX IF NOT EXISTS ix_weather_data_cell_fetched_at
+    ON weather_data (cell, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed)
+    WHERE cell IS NOT NULL;
 
 -- =========================
--- RECOMMENDATIONS
+-- RECOMMENDATIONS (one partition per day)
 -- =========================
 CREATE TABLE IF NOT EXISTS recommendations (
-    id           SERIAL PRIMARY KEY,
+    id           SERIAL,
     user_id      INT REFERENCES users(id) ON DELETE CASCADE,
     outfit_id    INT REFERENCES outfits(id) ON DELETE CASCADE,
-    weather_id   INT REFERENCES weather_data(id) ON DELETE SET NULL,
+    weather_id   INT,           -- weather_data.id; no FK: that key includes fetched_at
     score        FLOAT,
-    created_at   TIMESTAMP DEFAULT now()
+    created_at   TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- "Today's recommendations for user X" is one index-only range scan
+CREATE INDEX IF NOT EXISTS ix_recommendations_user_created_at
+    ON recommendations (user_id, created_at DESC)
+    INCLUDE (outfit_id, score, weather_id);
+
+-- =========================
+-- FEEDBACK COUNTERS (maintained by triggers on feedback)
+-- No FKs: a cascaded delete of a user/outfit fires the feedback trigger
+-- after the parent row is gone; reconcile_feedback_counts() drops leftovers.
+-- weather_tag NULL is stored as ''. Upserts take their row locks in key
+-- order, so concurrent batches queue instead of deadlocking.
+-- =========================
+CREATE TABLE IF NOT EXISTS feedback_counts_user (
+    user_id      INT PRIMARY KEY,
+    total        BIGINT NOT NULL DEFAULT 0,
+    likes        BIGINT NOT NULL DEFAULT 0,
+    dislikes     BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS feedback_counts_outfit (
+    outfit_id    INT NOT NULL,
+    weather_tag  VARCHAR(20) NOT NULL,
+    total        BIGINT NOT NULL DEFAULT 0,
+    likes        BIGINT NOT NULL DEFAULT 0,
+    dislikes     BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (outfit_id, weather_tag)
+);
+
+-- Per-tag totals are derived, not stored: a handful of global rows bumped
+-- by every feedback transaction would serialise all writers on their locks
+CREATE OR REPLACE VIEW feedback_counts_tag AS
+SELECT weather_tag, sum(total) AS total, sum(likes) AS likes, sum(dislikes) AS dislikes
+FROM feedback_counts_outfit
+GROUP BY weather_tag;
+
+-- Apply a signed batch of feedback rows to both counter tables
+CREATE OR REPLACE FUNCTION feedback_counts_bump(
+    d_user INT[], d_outfit INT[], d_tag TEXT[], d_liked BOOLEAN[], d_sign INT[]
+) RETURNS void LANGUAGE sql AS $$
+    WITH d AS (
+        SELECT * FROM unnest(d_user, d_outfit, d_tag, d_liked, d_sign)
+            AS t(user_id, outfit_id, tag, liked, s)
+    ),
+    u AS (
+        INSERT INTO feedback_counts_user AS c (user_id, total, likes, dislikes)
+        SELECT user_id, sum(s),
+               COALESCE(sum(s) FILTER (WHERE liked), 0),
+               COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+        FROM d WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            likes = c.likes + EXCLUDED.likes,
+            dislikes = c.dislikes + EXCLUDED.dislikes
+    )
+    INSERT INTO feedback_counts_outfit AS c (outfit_id, weather_tag, total, likes, dislikes)
+    SELECT outfit_id, tag, sum(s),
+           COALESCE(sum(s) FILTER (WHERE liked), 0),
+           COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+    FROM d WHERE outfit_id IS NOT NULL GROUP BY outfit_id, tag ORDER BY outfit_id, tag
+    ON CONFLICT (outfit_id, weather_tag) DO UPDATE SET
+        total = c.total + EXCLUDED.total,
+        likes = c.likes + EXCLUDED.likes,
+        dislikes = c.dislikes + EXCLUDED.dislikes;
+$$;
+
+-- Statement-level: one bump per INSERT/UPDATE/DELETE statement, however many rows
+CREATE OR REPLACE FUNCTION feedback_counts_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(COALESCE(weather_tag, '')), array_agg(liked), array_agg(1))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(COALESCE(weather_tag, '')), array_agg(liked), array_agg(-1))
+        FROM old_rows;
+    ELSE
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(tag), array_agg(liked), array_agg(s))
+        FROM (
+            SELECT user_id, outfit_id, COALESCE(weather_tag, '') AS tag, liked, 1 AS s FROM new_rows
+            UNION ALL
+            SELECT user_id, outfit_id, COALESCE(weather_tag, '') AS tag, liked, -1 AS s FROM old_rows
+        ) d;
+    END IF;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS feedback_counts_ins ON feedback;
+CREATE TRIGGER feedback_counts_ins AFTER INSERT ON feedback
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+DROP TRIGGER IF EXISTS feedback_counts_upd ON feedback;
+CREATE TRIGGER feedback_counts_upd AFTER UPDATE ON feedback
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+DROP TRIGGER IF EXISTS feedback_counts_del ON feedback;
+CREATE TRIGGER feedback_counts_del AFTER DELETE ON feedback
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+-- Recompute all counters from feedback. Holds a SHARE lock on feedback
+-- (writers wait, readers don't) so no trigger bump can slip in between.
+-- Returns how many counter rows had drifted; dry_run only reports.
+CREATE OR REPLACE FUNCTION reconcile_feedback_counts(dry_run BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (counter TEXT, drifted BIGINT) LANGUAGE plpgsql AS $$
+BEGIN
+    LOCK TABLE feedback IN SHARE MODE;
+
+    CREATE TEMP TABLE _fc_user ON COMMIT DROP AS
+        SELECT user_id, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE user_id IS NOT NULL GROUP BY user_id;
+    CREATE TEMP TABLE _fc_outfit ON COMMIT DROP AS
+        SELECT outfit_id, COALESCE(weather_tag, '') AS weather_tag, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE outfit_id IS NOT NULL GROUP BY 1, 2;
+
+    counter := 'user';
+    SELECT count(*) INTO drifted
+    FROM _fc_user t FULL JOIN feedback_counts_user c USING (user_id)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.user_id IS NULL AND c.user_id IS NOT NULL);
+    RETURN NEXT;
+
+    counter := 'outfit';
+    SELECT count(*) INTO drifted
+    FROM _fc_outfit t FULL JOIN feedback_counts_outfit c USING (outfit_id, weather_tag)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.outfit_id IS NULL AND c.outfit_id IS NOT NULL);
+    RETURN NEXT;
+
+
+    IF NOT dry_run THEN
+        DELETE FROM feedback_counts_user;
+        INSERT INTO feedback_counts_user SELECT * FROM _fc_user;
+        DELETE FROM feedback_counts_outfit;
+        INSERT INTO feedback_counts_outfit SELECT * FROM _fc_outfit;
+    END IF;
+END $$;
+
+-- =========================
+-- TIME PARTITIONS, ROLLUPS AND RETENTION (driven by app.retention)
+-- weather_data_pYYYYMMDD / recommendations_pYYYYMMDD hold one UTC day each;
+-- *_default catches rows for days not created yet. Expired days are
+-- dropped whole; raw weather is first rolled up into weather_hourly and
+-- weather_daily (per location: the cell, or the city when unresolved).
+-- =========================
+CREATE TABLE IF NOT EXISTS weather_data_default PARTITION OF weather_data DEFAULT;
+CREATE TABLE IF NOT EXISTS recommendations_default PARTITION OF recommendations DEFAULT;
+
+-- Create <parent>_pYYYYMMDD for `day` unless it exists. Rows for that day
+-- that landed in <parent>_default are moved into it first, because
+-- ATTACH refuses while the default partition still holds them.
+CREATE OR REPLACE FUNCTION ensure_day_partition(parent REGCLASS, day DATE)
+RETURNS TEXT LANGUAGE plpgsql AS $$
+DECLARE
+    base TEXT := (SELECT relname FROM pg_class WHERE oid = parent);
+    part TEXT := format('%s_p%s', base, to_char(day, 'YYYYMMDD'));
+    key TEXT;
+    lo TIMESTAMP := day;
+    hi TIMESTAMP := day + 1;
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN part;
+    END IF;
+    SELECT a.attname INTO key
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = parent;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %s INCLUDING DEFAULTS)', part, parent);
+    -- lets ATTACH skip its validation scan of the new table
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (%I >= %L AND %I < %L)',
+                   part, part || '_bounds', key, lo, key, hi);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', base || '_default', key, lo, key, hi, part);
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, part, lo, hi);
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', part, part || '_bounds');
+    RETURN part;
+END $$;
+
+SELECT ensure_day_partition('weather_data', d::date)
+FROM generate_series(current_date - 1, current_date + 7, interval '1 day') d;
+SELECT ensure_day_partition('recommendations', d::date)
+FROM generate_series(current_date - 1, current_date + 7, interval '1 day') d;
+
+CREATE TABLE IF NOT EXISTS weather_hourly (
+    location      VARCHAR(100) NOT NULL,   -- cell, or city for unresolved names
+    hour          TIMESTAMP NOT NULL,
+    city          VARCHAR(100),
+    samples       INT NOT NULL,
+    temp_min      FLOAT,
+    temp_max      FLOAT,
+    temp_avg      FLOAT,
+    humidity_avg  FLOAT,
+    wind_avg      FLOAT,
+    condition     VARCHAR(50),             -- most frequent in the bucket
+    PRIMARY KEY (location, hour)
+);
+
+CREATE TABLE IF NOT EXISTS weather_daily (
+    location      VARCHAR(100) NOT NULL,
+    day           DATE NOT NULL,
+    city          VARCHAR(100),
+    samples       INT NOT NULL,
+    temp_min      FLOAT,
+    temp_max      FLOAT,
+    temp_avg      FLOAT,
+    humidity_avg  FLOAT,
+    wind_avg      FLOAT,
+    condition     VARCHAR(50),
+    PRIMARY KEY (location, day)
+);
+
+-- Progress of resumable maintenance jobs (e.g. legacy backfill watermarks)
+CREATE TABLE IF NOT EXISTS maintenance_state (
+    key           TEXT PRIMARY KEY,
+    value         BIGINT NOT NULL,
+    updated_at    TIMESTAMP NOT NULL DEFAULT now()
 );
 
 -- =========================
--- VIEW: USER FEEDBACK SUMMARY
+-- VIEW: USER FEEDBACK SUMMARY (O(1) per user: PK lookup on the counters)
 -- =========================
 CREATE OR REPLACE VIEW user_feedback_summary AS
 SELECT
     u.id AS user_id,
     u.email,
-    COUNT(f.*) AS total_feedbacks,
-    COALESCE(SUM(CASE WHEN f.liked THEN 1 ELSE 0 END), 0) AS likes,
-    COALESCE(SUM(CASE WHEN NOT f.liked THEN 1 ELSE 0 END), 0) AS dislikes
+    COALESCE(c.total, 0) AS total_feedbacks,
+    COALESCE(c.likes, 0) AS likes,
+    COALESCE(c.dislikes, 0) AS dislikes
 FROM users u
-LEFT JOIN feedback f ON u.id = f.user_id
-GROUP BY u.id, u.email;
+LEFT JOIN feedback_counts_user c ON c.user_id = u.id;
 
 -- =====================================================
 -- End of Schema
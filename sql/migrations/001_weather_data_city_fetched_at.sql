@@ -0,0 +1,12 @@
+-- =====================================================
+-- 001: index for "latest observation for city"
+-- Run outside a transaction (CONCURRENTLY does not block writers):
+--   psql -d weatherdb -f sql/migrations/001_weather_data_city_fetched_at.sql
+-- =====================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_weather_data_city_fetched_at
+    ON weather_data (city, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed);
+
+-- Keep the visibility map current so the lookup stays index-only
+ANALYZE weather_data;
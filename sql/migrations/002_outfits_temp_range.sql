@@ -0,0 +1,19 @@
+-- =====================================================
+-- 002: int4range + GiST index for temperature candidate retrieval
+-- temp_range is a stored generated column, so it is backfilled by the
+-- ALTER and stays in step with temperature_range on every write.
+-- Run outside a transaction (the index build is CONCURRENTLY):
+--   psql -d weatherdb -f sql/migrations/002_outfits_temp_range.sql
+-- =====================================================
+
+CREATE EXTENSION IF NOT EXISTS "btree_gist";
+
+-- Rewrites the table once (takes an ACCESS EXCLUSIVE lock while it runs)
+ALTER TABLE outfits
+    ADD COLUMN IF NOT EXISTS temp_range int4range
+    GENERATED ALWAYS AS (int4range(temperature_range[1], temperature_range[2], '[]')) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_outfits_user_temp_range
+    ON outfits USING gist (user_id, temp_range);
+
+ANALYZE outfits;
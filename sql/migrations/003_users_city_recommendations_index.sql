@@ -0,0 +1,11 @@
+-- =====================================================
+-- 003: home city per user (groups users for batch precomputation)
+--      and the lookup index for precomputed recommendations
+--   psql -d weatherdb -f sql/migrations/003_users_city_recommendations_index.sql
+-- =====================================================
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS city VARCHAR(100);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recommendations_user_created_at
+    ON recommendations (user_id, created_at DESC)
+    INCLUDE (outfit_id, score, weather_id);
@@ -0,0 +1,186 @@
+-- =====================================================
+-- 004: incrementally maintained feedback counters
+-- Replaces the full-scan user_feedback_summary view with counter tables
+-- kept current by statement-level triggers on feedback, then backfills
+-- them with reconcile_feedback_counts().
+--   psql -d weatherdb -1 -f sql/migrations/004_feedback_counters.sql
+-- =====================================================
+
+-- =========================
+-- FEEDBACK COUNTERS (maintained by triggers on feedback)
+-- No FKs: a cascaded delete of a user/outfit fires the feedback trigger
+-- after the parent row is gone; reconcile_feedback_counts() drops leftovers.
+-- weather_tag NULL is stored as ''.
+-- =========================
+CREATE TABLE IF NOT EXISTS feedback_counts_user (
+    user_id      INT PRIMARY KEY,
+    total        BIGINT NOT NULL DEFAULT 0,
+    likes        BIGINT NOT NULL DEFAULT 0,
+    dislikes     BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS feedback_counts_outfit (
+    outfit_id    INT NOT NULL,
+    weather_tag  VARCHAR(20) NOT NULL,
+    total        BIGINT NOT NULL DEFAULT 0,
+    likes        BIGINT NOT NULL DEFAULT 0,
+    dislikes     BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (outfit_id, weather_tag)
+);
+
+CREATE TABLE IF NOT EXISTS feedback_counts_tag (
+    weather_tag  VARCHAR(20) PRIMARY KEY,
+    total        BIGINT NOT NULL DEFAULT 0,
+    likes        BIGINT NOT NULL DEFAULT 0,
+    dislikes     BIGINT NOT NULL DEFAULT 0
+);
+
+-- Apply a signed batch of feedback rows to all three counter tables
+CREATE OR REPLACE FUNCTION feedback_counts_bump(
+    d_user INT[], d_outfit INT[], d_tag TEXT[], d_liked BOOLEAN[], d_sign INT[]
+) RETURNS void LANGUAGE sql AS $$
+    WITH d AS (
+        SELECT * FROM unnest(d_user, d_outfit, d_tag, d_liked, d_sign)
+            AS t(user_id, outfit_id, tag, liked, s)
+    ),
+    u AS (
+        INSERT INTO feedback_counts_user AS c (user_id, total, likes, dislikes)
+        SELECT user_id, sum(s),
+               COALESCE(sum(s) FILTER (WHERE liked), 0),
+               COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+        FROM d WHERE user_id IS NOT NULL GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            likes = c.likes + EXCLUDED.likes,
+            dislikes = c.dislikes + EXCLUDED.dislikes
+    ),
+    o AS (
+        INSERT INTO feedback_counts_outfit AS c (outfit_id, weather_tag, total, likes, dislikes)
+        SELECT outfit_id, tag, sum(s),
+               COALESCE(sum(s) FILTER (WHERE liked), 0),
+               COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+        FROM d WHERE outfit_id IS NOT NULL GROUP BY outfit_id, tag
+        ON CONFLICT (outfit_id, weather_tag) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            likes = c.likes + EXCLUDED.likes,
+            dislikes = c.dislikes + EXCLUDED.dislikes
+    )
+    INSERT INTO feedback_counts_tag AS c (weather_tag, total, likes, dislikes)
+    SELECT tag, sum(s),
+           COALESCE(sum(s) FILTER (WHERE liked), 0),
+           COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+    FROM d GROUP BY tag
+    ON CONFLICT (weather_tag) DO UPDATE SET
+        total = c.total + EXCLUDED.total,
+        likes = c.likes + EXCLUDED.likes,
+        dislikes = c.dislikes + EXCLUDED.dislikes;
+$$;
+
+-- Statement-level: one bump per INSERT/UPDATE/DELETE statement, however many rows
+CREATE OR REPLACE FUNCTION feedback_counts_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(COALESCE(weather_tag, '')), array_agg(liked), array_agg(1))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(COALESCE(weather_tag, '')), array_agg(liked), array_agg(-1))
+        FROM old_rows;
+    ELSE
+        PERFORM feedback_counts_bump(array_agg(user_id), array_agg(outfit_id),
+                                     array_agg(tag), array_agg(liked), array_agg(s))
+        FROM (
+            SELECT user_id, outfit_id, COALESCE(weather_tag, '') AS tag, liked, 1 AS s FROM new_rows
+            UNION ALL
+            SELECT user_id, outfit_id, COALESCE(weather_tag, '') AS tag, liked, -1 AS s FROM old_rows
+        ) d;
+    END IF;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS feedback_counts_ins ON feedback;
+CREATE TRIGGER feedback_counts_ins AFTER INSERT ON feedback
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+DROP TRIGGER IF EXISTS feedback_counts_upd ON feedback;
+CREATE TRIGGER feedback_counts_upd AFTER UPDATE ON feedback
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+DROP TRIGGER IF EXISTS feedback_counts_del ON feedback;
+CREATE TRIGGER feedback_counts_del AFTER DELETE ON feedback
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION feedback_counts_trigger();
+
+-- Recompute all counters from feedback. Holds a SHARE lock on feedback
+-- (writers wait, readers don't) so no trigger bump can slip in between.
+-- Returns how many counter rows had drifted; dry_run only reports.
+CREATE OR REPLACE FUNCTION reconcile_feedback_counts(dry_run BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (counter TEXT, drifted BIGINT) LANGUAGE plpgsql AS $$
+BEGIN
+    LOCK TABLE feedback IN SHARE MODE;
+
+    CREATE TEMP TABLE _fc_user ON COMMIT DROP AS
+        SELECT user_id, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE user_id IS NOT NULL GROUP BY user_id;
+    CREATE TEMP TABLE _fc_outfit ON COMMIT DROP AS
+        SELECT outfit_id, COALESCE(weather_tag, '') AS weather_tag, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE outfit_id IS NOT NULL GROUP BY 1, 2;
+    CREATE TEMP TABLE _fc_tag ON COMMIT DROP AS
+        SELECT COALESCE(weather_tag, '') AS weather_tag, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback GROUP BY 1;
+
+    counter := 'user';
+    SELECT count(*) INTO drifted
+    FROM _fc_user t FULL JOIN feedback_counts_user c USING (user_id)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.user_id IS NULL AND c.user_id IS NOT NULL);
+    RETURN NEXT;
+
+    counter := 'outfit';
+    SELECT count(*) INTO drifted
+    FROM _fc_outfit t FULL JOIN feedback_counts_outfit c USING (outfit_id, weather_tag)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.outfit_id IS NULL AND c.outfit_id IS NOT NULL);
+    RETURN NEXT;
+
+    counter := 'tag';
+    SELECT count(*) INTO drifted
+    FROM _fc_tag t FULL JOIN feedback_counts_tag c USING (weather_tag)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.weather_tag IS NULL AND c.weather_tag IS NOT NULL);
+    RETURN NEXT;
+
+    IF NOT dry_run THEN
+        DELETE FROM feedback_counts_user;
+        INSERT INTO feedback_counts_user SELECT * FROM _fc_user;
+        DELETE FROM feedback_counts_outfit;
+        INSERT INTO feedback_counts_outfit SELECT * FROM _fc_outfit;
+        DELETE FROM feedback_counts_tag;
+        INSERT INTO feedback_counts_tag SELECT * FROM _fc_tag;
+    END IF;
+END $$;
+
+-- =========================
+-- VIEW: USER FEEDBACK SUMMARY (O(1) per user: PK lookup on the counters)
+-- =========================
+CREATE OR REPLACE VIEW user_feedback_summary AS
+SELECT
+    u.id AS user_id,
+    u.email,
+    COALESCE(c.total, 0) AS total_feedbacks,
+    COALESCE(c.likes, 0) AS likes,
+    COALESCE(c.dislikes, 0) AS dislikes
+FROM users u
+LEFT JOIN feedback_counts_user c ON c.user_id = u.id;
+
+-- Backfill from existing feedback
+SELECT * FROM reconcile_feedback_counts();
@@ -0,0 +1,18 @@
+-- =====================================================
+-- 005: weather_data keyed by geohash cell (app.geo)
+-- Nearby users and different spellings of a city now share one cell,
+-- so fetches and rows are per cell. Older rows keep cell NULL and are
+-- still found by city for names the gazetteer does not know.
+-- Run outside a transaction (the index build is CONCURRENTLY):
+--   psql -d weatherdb -f sql/migrations/005_weather_data_cell.sql
+-- =====================================================
+
+-- Nullable with no default: a catalog-only change, no table rewrite
+ALTER TABLE weather_data ADD COLUMN IF NOT EXISTS cell VARCHAR(12);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_weather_data_cell_fetched_at
+    ON weather_data (cell, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed)
+    WHERE cell IS NOT NULL;
+
+ANALYZE weather_data;
@@ -0,0 +1,149 @@
+-- =====================================================
+-- 006: day-range partitioning for weather_data and recommendations,
+--      rollup tables and maintenance state (see app/retention.py)
+--
+-- A plain table cannot be turned into a partitioned one in place, so the
+-- current tables are renamed to *_legacy and empty partitioned tables take
+-- their names, reusing the id sequences. New writes go to the partitions
+-- at once. `python -m app.retention` then copies the legacy rows across
+-- in resumable chunks and drops the legacy tables.
+--
+-- The primary keys become (id, fetched_at) / (id, created_at): a
+-- partitioned table's unique keys must include the partition key.
+-- recommendations.weather_id therefore loses its FK (ids stay unique
+-- through the sequence).
+--
+-- Runs in one transaction; the renames take brief exclusive locks:
+--   psql -d weatherdb -1 -f sql/migrations/006_time_partitions.sql
+-- =====================================================
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'weather_data'::regclass) = 'p' THEN
+        RAISE EXCEPTION '006 already applied: weather_data is partitioned';
+    END IF;
+END $$;
+
+-- weather_data --------------------------------------------------------
+ALTER TABLE recommendations DROP CONSTRAINT IF EXISTS recommendations_weather_id_fkey;
+ALTER TABLE weather_data RENAME TO weather_data_legacy;
+ALTER INDEX IF EXISTS weather_data_pkey RENAME TO weather_data_legacy_pkey;
+ALTER INDEX IF EXISTS ix_weather_data_city_fetched_at RENAME TO ix_weather_data_legacy_city_fetched_at;
+ALTER INDEX IF EXISTS ix_weather_data_cell_fetched_at RENAME TO ix_weather_data_legacy_cell_fetched_at;
+
+CREATE TABLE weather_data (
+    id           INT NOT NULL DEFAULT nextval('weather_data_id_seq'),
+    user_id      INT REFERENCES users(id) ON DELETE SET NULL,
+    city         VARCHAR(100),
+    cell         VARCHAR(12),
+    temperature  FLOAT,
+    condition    VARCHAR(50),
+    humidity     INT,
+    wind_speed   FLOAT,
+    fetched_at   TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, fetched_at)
+) PARTITION BY RANGE (fetched_at);
+-- keep the sequence when the legacy table is dropped
+ALTER SEQUENCE weather_data_id_seq OWNED BY weather_data.id;
+
+CREATE INDEX ix_weather_data_city_fetched_at
+    ON weather_data (city, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed);
+CREATE INDEX ix_weather_data_cell_fetched_at
+    ON weather_data (cell, fetched_at DESC)
+    INCLUDE (id, temperature, condition, humidity, wind_speed)
+    WHERE cell IS NOT NULL;
+CREATE TABLE weather_data_default PARTITION OF weather_data DEFAULT;
+
+-- recommendations -----------------------------------------------------
+ALTER TABLE recommendations RENAME TO recommendations_legacy;
+ALTER INDEX IF EXISTS recommendations_pkey RENAME TO recommendations_legacy_pkey;
+ALTER INDEX IF EXISTS ix_recommendations_user_created_at RENAME TO ix_recommendations_legacy_user_created_at;
+
+CREATE TABLE recommendations (
+    id           INT NOT NULL DEFAULT nextval('recommendations_id_seq'),
+    user_id      INT REFERENCES users(id) ON DELETE CASCADE,
+    outfit_id    INT REFERENCES outfits(id) ON DELETE CASCADE,
+    weather_id   INT,
+    score        FLOAT,
+    created_at   TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE recommendations_id_seq OWNED BY recommendations.id;
+
+CREATE INDEX ix_recommendations_user_created_at
+    ON recommendations (user_id, created_at DESC)
+    INCLUDE (outfit_id, score, weather_id);
+CREATE TABLE recommendations_default PARTITION OF recommendations DEFAULT;
+
+-- partitions, rollups, state ------------------------------------------
+-- Create <parent>_pYYYYMMDD for `day` unless it exists. Rows for that day
+-- that landed in <parent>_default are moved into it first, because
+-- ATTACH refuses while the default partition still holds them.
+CREATE OR REPLACE FUNCTION ensure_day_partition(parent REGCLASS, day DATE)
+RETURNS TEXT LANGUAGE plpgsql AS $$
+DECLARE
+    base TEXT := (SELECT relname FROM pg_class WHERE oid = parent);
+    part TEXT := format('%s_p%s', base, to_char(day, 'YYYYMMDD'));
+    key TEXT;
+    lo TIMESTAMP := day;
+    hi TIMESTAMP := day + 1;
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN part;
+    END IF;
+    SELECT a.attname INTO key
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = parent;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %s INCLUDING DEFAULTS)', part, parent);
+    -- lets ATTACH skip its validation scan of the new table
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (%I >= %L AND %I < %L)',
+                   part, part || '_bounds', key, lo, key, hi);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', base || '_default', key, lo, key, hi, part);
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, part, lo, hi);
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', part, part || '_bounds');
+    RETURN part;
+END $$;
+
+SELECT ensure_day_partition('weather_data', d::date)
+FROM generate_series(current_date - 1, current_date + 7, interval '1 day') d;
+SELECT ensure_day_partition('recommendations', d::date)
+FROM generate_series(current_date - 1, current_date + 7, interval '1 day') d;
+
+CREATE TABLE IF NOT EXISTS weather_hourly (
+    location      VARCHAR(100) NOT NULL,   -- cell, or city for unresolved names
+    hour          TIMESTAMP NOT NULL,
+    city          VARCHAR(100),
+    samples       INT NOT NULL,
+    temp_min      FLOAT,
+    temp_max      FLOAT,
+    temp_avg      FLOAT,
+    humidity_avg  FLOAT,
+    wind_avg      FLOAT,
+    condition     VARCHAR(50),             -- most frequent in the bucket
+    PRIMARY KEY (location, hour)
+);
+
+CREATE TABLE IF NOT EXISTS weather_daily (
+    location      VARCHAR(100) NOT NULL,
+    day           DATE NOT NULL,
+    city          VARCHAR(100),
+    samples       INT NOT NULL,
+    temp_min      FLOAT,
+    temp_max      FLOAT,
+    temp_avg      FLOAT,
+    humidity_avg  FLOAT,
+    wind_avg      FLOAT,
+    condition     VARCHAR(50),
+    PRIMARY KEY (location, day)
+);
+
+-- Progress of resumable maintenance jobs (e.g. legacy backfill watermarks)
+CREATE TABLE IF NOT EXISTS maintenance_state (
+    key           TEXT PRIMARY KEY,
+    value         BIGINT NOT NULL,
+    updated_at    TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,91 @@
+-- =====================================================
+-- 007: per-tag feedback totals become a view
+-- Every feedback transaction upserted the same few global
+-- feedback_counts_tag rows and held their locks until commit, which
+-- serialised all feedback writers; multi-row upserts could also lock rows
+-- in different orders and deadlock. The per-tag totals are now summed
+-- from feedback_counts_outfit on read, and the remaining upserts lock
+-- rows in key order.
+--   psql -d weatherdb -1 -f sql/migrations/007_feedback_counts_tag_view.sql
+-- =====================================================
+
+DROP TABLE IF EXISTS feedback_counts_tag;
+
+-- Per-tag totals are derived, not stored: a handful of global rows bumped
+-- by every feedback transaction would serialise all writers on their locks
+CREATE OR REPLACE VIEW feedback_counts_tag AS
+SELECT weather_tag, sum(total) AS total, sum(likes) AS likes, sum(dislikes) AS dislikes
+FROM feedback_counts_outfit
+GROUP BY weather_tag;
+
+-- Apply a signed batch of feedback rows to both counter tables
+CREATE OR REPLACE FUNCTION feedback_counts_bump(
+    d_user INT[], d_outfit INT[], d_tag TEXT[], d_liked BOOLEAN[], d_sign INT[]
+) RETURNS void LANGUAGE sql AS $$
+    WITH d AS (
+        SELECT * FROM unnest(d_user, d_outfit, d_tag, d_liked, d_sign)
+            AS t(user_id, outfit_id, tag, liked, s)
+    ),
+    u AS (
+        INSERT INTO feedback_counts_user AS c (user_id, total, likes, dislikes)
+        SELECT user_id, sum(s),
+               COALESCE(sum(s) FILTER (WHERE liked), 0),
+               COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+        FROM d WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            likes = c.likes + EXCLUDED.likes,
+            dislikes = c.dislikes + EXCLUDED.dislikes
+    )
+    INSERT INTO feedback_counts_outfit AS c (outfit_id, weather_tag, total, likes, dislikes)
+    SELECT outfit_id, tag, sum(s),
+           COALESCE(sum(s) FILTER (WHERE liked), 0),
+           COALESCE(sum(s) FILTER (WHERE NOT liked), 0)
+    FROM d WHERE outfit_id IS NOT NULL GROUP BY outfit_id, tag ORDER BY outfit_id, tag
+    ON CONFLICT (outfit_id, weather_tag) DO UPDATE SET
+        total = c.total + EXCLUDED.total,
+        likes = c.likes + EXCLUDED.likes,
+        dislikes = c.dislikes + EXCLUDED.dislikes;
+$$;
+
+-- Recompute all counters from feedback. Holds a SHARE lock on feedback
+-- (writers wait, readers don't) so no trigger bump can slip in between.
+-- Returns how many counter rows had drifted; dry_run only reports.
+CREATE OR REPLACE FUNCTION reconcile_feedback_counts(dry_run BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (counter TEXT, drifted BIGINT) LANGUAGE plpgsql AS $$
+BEGIN
+    LOCK TABLE feedback IN SHARE MODE;
+
+    CREATE TEMP TABLE _fc_user ON COMMIT DROP AS
+        SELECT user_id, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE user_id IS NOT NULL GROUP BY user_id;
+    CREATE TEMP TABLE _fc_outfit ON COMMIT DROP AS
+        SELECT outfit_id, COALESCE(weather_tag, '') AS weather_tag, count(*) AS total,
+               count(*) FILTER (WHERE liked) AS likes, count(*) FILTER (WHERE NOT liked) AS dislikes
+        FROM feedback WHERE outfit_id IS NOT NULL GROUP BY 1, 2;
+
+    counter := 'user';
+    SELECT count(*) INTO drifted
+    FROM _fc_user t FULL JOIN feedback_counts_user c USING (user_id)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.user_id IS NULL AND c.user_id IS NOT NULL);
+    RETURN NEXT;
+
+    counter := 'outfit';
+    SELECT count(*) INTO drifted
+    FROM _fc_outfit t FULL JOIN feedback_counts_outfit c USING (outfit_id, weather_tag)
+    WHERE (COALESCE(t.total, 0), COALESCE(t.likes, 0), COALESCE(t.dislikes, 0))
+          IS DISTINCT FROM (COALESCE(c.total, 0), COALESCE(c.likes, 0), COALESCE(c.dislikes, 0))
+       OR (t.outfit_id IS NULL AND c.outfit_id IS NOT NULL);
+    RETURN NEXT;
+
+
+    IF NOT dry_run THEN
+        DELETE FROM feedback_counts_user;
+        INSERT INTO feedback_counts_user SELECT * FROM _fc_user;
+        DELETE FROM feedback_counts_outfit;
+        INSERT INTO feedback_counts_outfit SELECT * FROM _fc_outfit;
+    END IF;
+END $$;